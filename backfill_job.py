@@ -0,0 +1,22 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+from src.database import get_instruments_by_pattern
+from src.backfill import run_backfill
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill gaps in historical_candles from the Kite API.")
+    parser.add_argument("--pattern", default="NIFTY26%", help="SQL LIKE pattern of trading symbols")
+    parser.add_argument("--days", type=int, default=30, help="How far back to look for gaps")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent chunk requests")
+    args = parser.parse_args()
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=args.days)
+
+    print(f"Looking up instruments matching '{args.pattern}'...")
+    instruments = get_instruments_by_pattern(args.pattern)
+
+    if instruments:
+        run_backfill(instruments, start, end, max_workers=args.workers)
+    else:
+        print("No instruments found. Run fetch_instruments_job.py first.")
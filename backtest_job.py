@@ -0,0 +1,29 @@
+import argparse
+from src.database import get_instruments_by_pattern, SMA_WINDOW
+from src.orders import TAKE_PROFIT_PCT
+from src.backtest import run_backtest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the SMA strategy on stored historical candles.")
+    parser.add_argument("--pattern", default="NIFTY26%", help="SQL LIKE pattern of trading symbols")
+    parser.add_argument("--window", type=int, default=SMA_WINDOW, help="SMA window in candles")
+    parser.add_argument("--take-profit", type=float, default=TAKE_PROFIT_PCT, help="Profit ratio that closes a short")
+    parser.add_argument("--store", action="store_true", help="Read candles from the local candle store instead of Postgres")
+    args = parser.parse_args()
+
+    print(f"Looking up instruments matching '{args.pattern}'...")
+    instruments = get_instruments_by_pattern(args.pattern)
+
+    if not instruments:
+        print("No instruments found. Run fetch_instruments_job.py first.")
+
+    for instrument in instruments:
+        result = run_backtest(instrument['trading_symbol'], args.window, args.take_profit, use_store=args.store)
+        if not result["candles"]:
+            print(f"{result['trading_symbol']}: no candles stored.")
+            continue
+
+        print(f"{result['trading_symbol']}: {result['candles']} candles, {len(result['trades'])} trades, "
+              f"PnL {result['pnl']:.2f}, win rate {result['win_rate'] * 100:.1f}%, "
+              f"max drawdown {result['max_drawdown']:.2f}"
+              + (f", open short from {result['open_position']['entry_price']:.2f}" if result["open_position"] else ""))
@@ -0,0 +1,226 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Seconds per Kite interval name
+INTERVALS = {"minute": 60, "3minute": 180, "5minute": 300, "10minute": 600, "15minute": 900,
+             "30minute": 1800, "60minute": 3600, "day": 86400}
+DUMP_HEADER = ["instrument_token", "exchange_token", "tradingsymbol", "name", "last_price", "expiry",
+               "strike", "tick_size", "lot_size", "instrument_type", "segment", "exchange"]
+
+
+def bench_symbol(i: int) -> str:
+    return f"BENCH{i:05d}FUT"
+
+
+def candle_close(token: int, epoch: int) -> float:
+    """
+    Deterministic close for (instrument, bar), so a re-fetched bar always matches what was stored.
+    """
+    return round(100.0 + 10.0 * math.sin(token * 0.7 + epoch / 3600.0) + (token % 7), 2)
+
+
+class _Window:
+    """
+    Fixed one-second request window per endpoint, like Kite's per-second limits.
+    """
+
+    def __init__(self, rps: float):
+        self.rps = rps
+        self.second = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rps <= 0:
+            return True
+        with self.lock:
+            now = int(time.monotonic())
+            if now != self.second:
+                self.second, self.count = now, 0
+            self.count += 1
+            return self.count <= self.rps
+
+
+class FakeKite:
+    """
+    Local stand-in for the Kite REST endpoints used by src/kite_api.py:
+    /instruments (gzipped CSV dump with ETag) and /instruments/historical/{token}/{interval}.
+
+    `instruments` FUT rows named BENCHnnnnnFUT are listed, plus `filler_rows` non-FUT rows
+    to grow the dump. Historical requests return every bar boundary in [from, to], or the
+    last `candles` bars up to `to` when set. Each request sleeps `latency_ms` plus up to
+    `jitter_ms`; more than `historical_rps` / `instruments_rps` requests in one second
+    (0: unlimited) get a 429, with a Retry-After header if `retry_after` is set.
+    """
+
+    def __init__(self, instruments: int = 10, filler_rows: int = 0, latency_ms: float = 20.0, jitter_ms: float = 5.0,
+                 historical_rps: float = 0.0, instruments_rps: float = 0.0, candles: Optional[int] = None,
+                 retry_after: Optional[float] = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.candles = candles
+        self.retry_after = retry_after
+        self.limits = {"historical": _Window(historical_rps), "instruments": _Window(instruments_rps)}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        self._dump = None
+        self.set_instruments(instruments, filler_rows)
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.kite = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_instruments(self, instruments: int, filler_rows: int = 0):
+        """
+        Replaces the instrument dump (and its ETag).
+        """
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(DUMP_HEADER)
+        for i in range(instruments):
+            writer.writerow([1000000 + i, 4000 + i, bench_symbol(i), "BENCH", 0, "2026-12-31", 0, 0.05, 50, "FUT", "NFO-FUT", "NFO"])
+        for i in range(filler_rows):
+            writer.writerow([9000000 + i, 8000 + i, f"FILL{i:07d}CE", "FILL", 0, "2026-12-31", 100, 0.05, 50, "CE", "NFO-OPT", "NFO"])
+        body = gzip.compress(out.getvalue().encode("utf-8"), compresslevel=1)
+        self._dump = (body, f'"{instruments}-{filler_rows}"', time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()))
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {}
+
+    def _count(self, endpoint: str, outcome: str, size: int = 0):
+        with self._stats_lock:
+            counts = self.stats.setdefault(endpoint, {"requests": 0, "rate_limited": 0, "not_modified": 0, "bytes": 0})
+            counts["requests"] += 1
+            counts["bytes"] += size
+            if outcome != "ok":
+                counts[outcome] += 1
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY each keep-alive
+    # response would stall ~40 ms on delayed ACKs and swamp the simulated latency
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json", **(headers or {})})
+
+    def do_GET(self):
+        kite = self.server.kite
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["instruments"]:
+            endpoint = "instruments"
+        elif len(parts) == 4 and parts[:2] == ["instruments", "historical"]:
+            endpoint = "historical"
+        else:
+            self._json(404, {"status": "error", "message": "Route not found"})
+            return
+
+        time.sleep((kite.latency_ms + random.uniform(0, kite.jitter_ms)) / 1000.0)
+
+        if not kite.limits[endpoint].allow():
+            kite._count(endpoint, "rate_limited")
+            headers = {"Retry-After": str(kite.retry_after)} if kite.retry_after is not None else {}
+            self._json(429, {"status": "error", "message": "Too many requests", "error_type": "NetworkException"}, headers)
+            return
+
+        if endpoint == "instruments":
+            body, etag, last_modified = kite._dump
+            if self.headers.get("If-None-Match") == etag:
+                kite._count(endpoint, "not_modified")
+                self._send(304, headers={"ETag": etag})
+                return
+            kite._count(endpoint, "ok", len(body))
+            self._send(200, body, {"Content-Type": "text/csv", "Content-Encoding": "gzip",
+                                   "ETag": etag, "Last-Modified": last_modified})
+            return
+
+        token, interval = parts[2], parts[3]
+        query = parse_qs(url.query)
+        try:
+            step = INTERVALS[interval]
+            start = datetime.strptime(query["from"][0], "%Y-%m-%d %H:%M:%S")
+            end = datetime.strptime(query["to"][0], "%Y-%m-%d %H:%M:%S")
+            token_value = int(token)
+        except (KeyError, ValueError):
+            self._json(400, {"status": "error", "message": "Invalid request", "error_type": "InputException"})
+            return
+
+        # Bar boundaries in IST wall-clock seconds, as the request's from/to are
+        last = int((end - datetime(1970, 1, 1)).total_seconds()) // step * step
+        first = last - (kite.candles - 1) * step if kite.candles else -(-int((start - datetime(1970, 1, 1)).total_seconds()) // step) * step
+        candles = []
+        for epoch in range(first, last + 1, step):
+            stamp = (datetime(1970, 1, 1) + timedelta(seconds=epoch)).strftime("%Y-%m-%dT%H:%M:%S+0530")
+            close = candle_close(token_value, epoch)
+            candles.append([stamp, close, close + 0.5, close - 0.5, close, 1000])
+
+        body = json.dumps({"status": "success", "data": {"candles": candles}}).encode("utf-8")
+        kite._count(endpoint, "ok", len(body))
+        self._send(200, body, {"Content-Type": "application/json"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Kite REST API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--instruments", type=int, default=100, help="FUT instruments in the dump (BENCHnnnnnFUT)")
+    parser.add_argument("--filler-rows", type=int, default=0, help="Extra non-FUT rows to grow the dump")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--historical-rps", type=float, default=0.0, help="Requests/second before 429s (0: unlimited)")
+    parser.add_argument("--instruments-rps", type=float, default=0.0)
+    parser.add_argument("--candles", type=int, default=None, help="Bars per historical response (default: the requested range)")
+    args = parser.parse_args()
+
+    kite = FakeKite(args.instruments, args.filler_rows, args.latency_ms, args.jitter_ms, args.historical_rps,
+                    args.instruments_rps, args.candles, port=args.port)
+    print(f"Fake Kite API on {kite.url} (set KITE_API_BASE_URL to use it)")
+    try:
+        kite._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,65 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# What each scenario imports in a fresh interpreter
+SCENARIOS = {
+    # Lambda init phase: loading the handler module
+    "handler init": "import lambda_function",
+    # Init plus what the first invocation imports (staged mode, no indicators)
+    "init + first call": "import lambda_function, main, src.metrics, src.config",
+    # Everything the handler used to import at module load
+    "eager imports": "import dotenv, main, src.pipeline, src.indicators, src.metrics, src.config",
+}
+
+
+def time_import(statement: str) -> float:
+    """
+    Milliseconds a fresh interpreter spends on `statement` (interpreter startup excluded).
+    """
+    code = f"import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _import_times(statement: str):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return rows
+
+
+def heaviest_modules(statement: str, top: int):
+    """
+    The `top` modules with the largest cumulative import time (python -X importtime),
+    leaving out what the interpreter imports at startup.
+    """
+    startup = {module for _, module in _import_times("pass")}
+    rows = [row for row in _import_times(statement) if row[1] not in startup]
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cold import time of the Lambda handler with eager imports.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per scenario")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest modules to list per scenario (0: none)")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<20}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, statement in SCENARIOS.items():
+        samples = [time_import(statement) for _ in range(args.runs)]
+        print(f"{name:<20}{statistics.median(samples):>12.1f}{min(samples):>10.1f}{max(samples):>10.1f}")
+
+    for name, statement in SCENARIOS.items():
+        if args.top <= 0:
+            break
+        print(f"\nHeaviest imports ({name}):")
+        for micros, module in heaviest_modules(statement, args.top):
+            print(f"  {micros / 1000:>8.1f} ms  {module}")
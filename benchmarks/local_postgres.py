@@ -0,0 +1,83 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psycopg2
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def _temp_cluster(bin_dir: str):
+    data_dir = tempfile.mkdtemp(prefix="kite_bench_pg_")
+    log_file = os.path.join(data_dir, "server.log")
+    port = _free_port()
+    try:
+        subprocess.run([os.path.join(bin_dir, "initdb"), "-D", data_dir, "-U", "postgres", "-A", "trust",
+                        "-E", "UTF8", "--no-sync"], check=True, capture_output=True)
+        # Durability is irrelevant for a throwaway cluster; keep the socket inside the data dir
+        options = f"-p {port} -k {data_dir} -c listen_addresses='' -c fsync=off -c synchronous_commit=off -c full_page_writes=off"
+        subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data_dir, "-l", log_file, "-o", options, "-w", "start"],
+                       check=True, capture_output=True)
+        try:
+            yield {"DB_HOST": data_dir, "DB_PORT": str(port), "DB_USER": "postgres", "DB_PASS": "", "DB_NAME": "postgres"}
+        finally:
+            subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data_dir, "-m", "immediate", "-w", "stop"], capture_output=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextmanager
+def _temp_database(server: Dict[str, str]):
+    name = f"kite_bench_{os.getpid()}_{int(time.time())}"
+    admin = dict(host=server["DB_HOST"], port=server["DB_PORT"], user=server["DB_USER"], password=server["DB_PASS"] or None,
+                 dbname=server.get("DB_ADMIN_NAME", "postgres"))
+
+    conn = psycopg2.connect(**admin)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+    try:
+        yield {**server, "DB_NAME": name}
+    finally:
+        conn = psycopg2.connect(**admin)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        conn.close()
+
+
+@contextmanager
+def disposable_postgres(bin_dir: Optional[str] = None):
+    """
+    Yields DB_* settings for a throwaway database, removed on exit.
+
+    With Postgres binaries available (`bin_dir`, or initdb on PATH) and not running
+    as root, a temporary cluster is initialised and started on a free port. Otherwise
+    a fresh database is created on the server named by the DB_HOST/DB_PORT/DB_USER/
+    DB_PASS environment variables and dropped afterwards.
+    """
+    initdb = shutil.which("initdb", path=bin_dir) if bin_dir else shutil.which("initdb")
+    if initdb and os.geteuid() != 0:
+        with _temp_cluster(os.path.dirname(initdb)) as settings:
+            yield settings
+        return
+
+    server = {
+        "DB_HOST": os.getenv("DB_HOST", "localhost"),
+        "DB_PORT": os.getenv("DB_PORT", "5432"),
+        "DB_USER": os.getenv("DB_USER", "postgres"),
+        "DB_PASS": os.getenv("DB_PASS", ""),
+    }
+    with _temp_database(server) as settings:
+        yield settings
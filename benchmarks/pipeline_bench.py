@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+from fake_kite import FakeKite, candle_close
+from local_postgres import disposable_postgres
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PATTERN = "BENCH%"
+BAR_SECONDS = 300
+
+# DB round-trips made through psycopg2.connect while counting is on
+_counts: Dict[str, int] = {}
+_counts_lock = threading.Lock()
+
+
+def _count(kind: str, n: int = 1):
+    with _counts_lock:
+        _counts[kind] = _counts.get(kind, 0) + n
+
+
+class _CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        _count("statements")
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _count("statements", len(vars_list))
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count("statements")
+        return super().copy_expert(sql, file, size)
+
+
+class _CountingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = _CountingCursor
+        _count("connections")
+
+    def commit(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _count("commits")
+        return super().commit()
+
+    def rollback(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _count("rollbacks")
+        return super().rollback()
+
+
+_connect = psycopg2.connect
+
+
+def _counting_connect(*args, **kwargs):
+    kwargs.setdefault("connection_factory", _CountingConnection)
+    return _connect(*args, **kwargs)
+
+
+def _admin_connection():
+    return _connect(host=os.environ["DB_HOST"], port=os.environ["DB_PORT"], user=os.environ["DB_USER"],
+                    password=os.environ["DB_PASS"] or None, dbname=os.environ["DB_NAME"])
+
+
+def _truncate_tables():
+    conn = _admin_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'schema_migrations'")
+        tables = [row[0] for row in cur.fetchall()]
+        if tables:
+            cur.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+    conn.commit()
+    conn.close()
+
+
+def _seed_history(targets: List[Dict], bars: int):
+    """
+    Stores `bars` candles per instrument before the bar the pipeline fetches, with the
+    same closes the fake server returns, so the SMA stage runs on a full window.
+    """
+    if bars <= 0:
+        return
+    ist = timezone(timedelta(hours=5, minutes=30))
+    # First bar boundary at or after now - 1 minute (IST wall clock), as main.py requests it
+    wall = int((datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=5, minutes=29) - datetime(1970, 1, 1)).total_seconds())
+    current = -(-wall // BAR_SECONDS) * BAR_SECONDS
+
+    rows = []
+    for instrument in targets:
+        token = int(instrument['instrument_token'])
+        for epoch in range(current - bars * BAR_SECONDS, current, BAR_SECONDS):
+            stamp = (datetime(1970, 1, 1) + timedelta(seconds=epoch)).replace(tzinfo=ist)
+            rows.append((stamp, candle_close(token, epoch), instrument['instrument_token'], instrument['trading_symbol']))
+
+    conn = _admin_connection()
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO historical_candles (timestamp, closed, instrument_token, trading_symbol)
+            VALUES %s ON CONFLICT DO NOTHING
+        """, rows, page_size=10000)
+    conn.commit()
+    conn.close()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+def _latencies(metrics) -> Dict[str, Dict]:
+    """
+    p50/p99 per metric, merged over instruments (stage/op labels kept apart).
+    """
+    grouped: Dict[str, List[float]] = {}
+    for h in metrics.snapshot()["histograms"]:
+        extra = [h["labels"][k] for k in ("stage", "op") if k in h["labels"]]
+        name = h["name"] + (f"[{','.join(extra)}]" if extra else "")
+        grouped.setdefault(name, []).extend(h["samples"])
+    return {
+        name: {"count": len(v), "p50_ms": round(_percentile(v, 0.50), 3), "p99_ms": round(_percentile(v, 0.99), 3)}
+        for name, v in sorted(grouped.items()) if v
+    }
+
+
+def run_size(app, kite: FakeKite, size: int, args, cache_dir: str) -> Dict:
+    from src import metrics
+    from src.database import clear_instrument_cache, close_pool, recompute_running_averages
+    from src.kite_api import close_http_session
+
+    # Each size starts from empty tables, no instrument snapshot and cold connections
+    _truncate_tables()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    clear_instrument_cache()
+    close_pool()
+    close_http_session()
+    kite.set_instruments(size, args.filler_rows)
+
+    started = time.perf_counter()
+    targets = app.ensure_target_instruments_exist(PATTERN)
+    resolve_s = time.perf_counter() - started
+    if len(targets) != size:
+        raise RuntimeError(f"Expected {size} instruments, resolved {len(targets)}")
+
+    _seed_history(targets, args.history)
+    recompute_running_averages([t['trading_symbol'] for t in targets])
+
+    metrics.reset()
+    kite.reset_stats()
+    with _counts_lock:
+        _counts.clear()
+
+    started = time.perf_counter()
+    if args.mode == "async":
+        from src.pipeline import run_pipeline_sync
+        run_pipeline_sync(targets)
+    else:
+        updated = app.fetch_and_save_historical_data(targets)
+        latest = app.update_sma_for_instruments(updated)
+        app.process_orders_for_instruments(updated, latest)
+    elapsed = time.perf_counter() - started
+
+    db = {kind: _counts.get(kind, 0) for kind in ("statements", "commits", "rollbacks", "connections")}
+    return {
+        "instruments": size,
+        "mode": args.mode,
+        "elapsed_s": round(elapsed, 3),
+        "instruments_per_s": round(size / elapsed, 2),
+        "resolve_s": round(resolve_s, 3),
+        "db": {**db, "statements_per_instrument": round(db["statements"] / size, 2)},
+        "http": kite.stats,
+        "latency": _latencies(metrics),
+    }
+
+
+def print_result(result: Dict, baseline: Dict = None):
+    def delta(current, previous, higher_is_better=False):
+        if not previous:
+            return ""
+        change = (current - previous) / previous * 100
+        better = change > 0 if higher_is_better else change < 0
+        return f" ({change:+.1f}% {'better' if better else 'worse'})" if abs(change) >= 0.05 else " (=)"
+
+    base = baseline or {}
+    db = result["db"]
+    print(f"\n== {result['instruments']} instruments ({result['mode']}) ==")
+    print(f"throughput: {result['instruments_per_s']} instruments/s over {result['elapsed_s']}s"
+          f"{delta(result['instruments_per_s'], base.get('instruments_per_s'), True)}"
+          f"; instrument lookup {result['resolve_s']}s")
+    print(f"DB round-trips: {db['statements']} statements{delta(db['statements'], base.get('db', {}).get('statements'))}, "
+          f"{db['commits']} commits, {db['rollbacks']} rollbacks, {db['connections']} connections "
+          f"({db['statements_per_instrument']} statements/instrument)")
+    for endpoint, counts in sorted(result["http"].items()):
+        print(f"HTTP {endpoint}: {counts['requests']} requests, {counts['rate_limited']} rate limited, {counts['bytes']} bytes")
+
+    print(f"{'latency':<36}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    base_latency = base.get("latency", {})
+    for name, stats in result["latency"].items():
+        print(f"{name:<36}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+              f"{delta(stats['p99_ms'], base_latency.get(name, {}).get('p99_ms'))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark main.py's pipeline against a fake Kite API and a throwaway Postgres.")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated instrument counts")
+    parser.add_argument("--mode", choices=("staged", "async"), default="staged", help="Pipeline to run (PIPELINE_MODE)")
+    parser.add_argument("--history", type=int, default=200, help="Stored candles per instrument before the run")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake Kite response latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--server-rps", type=float, default=0.0, help="Fake Kite historical limit before 429s (0: unlimited)")
+    parser.add_argument("--client-rps", type=float, default=1000.0, help="KITE_HISTORICAL_RPS for the run")
+    parser.add_argument("--candles", type=int, default=None, help="Bars per historical response (default: the requested range)")
+    parser.add_argument("--filler-rows", type=int, default=0, help="Extra non-FUT rows in the instrument dump")
+    parser.add_argument("--pg-bin", default=None, help="Directory with initdb/pg_ctl for a temporary cluster")
+    parser.add_argument("--save", default=None, help="Write the results to this JSON file (a baseline)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's own output")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["instruments"], r["mode"]): r for r in json.load(f)}
+
+    cache_dir = tempfile.mkdtemp(prefix="kite_bench_instruments_")
+    results = []
+    with FakeKite(max(sizes), args.filler_rows, args.latency_ms, args.jitter_ms, historical_rps=args.server_rps,
+                  candles=args.candles) as kite, disposable_postgres(args.pg_bin) as db:
+        # src reads its configuration at import time, so everything is set before importing it
+        os.environ.update(db)
+        os.environ.update({
+            "KITE_API_BASE_URL": kite.url,
+            "KITE_API_KEY": "bench",
+            "KITE_AUTH_TOKEN": "bench",
+            "KITE_HISTORICAL_RPS": str(args.client_rps),
+            "INSTRUMENT_CACHE_DIR": cache_dir,
+            "PIPELINE_MODE": args.mode,
+            "METRICS_ENABLED": "true",
+        })
+        psycopg2.connect = _counting_connect
+        sys.path.insert(0, ROOT)
+
+        import main as app
+        from src import metrics
+        # Keep every latency sample for exact percentiles
+        metrics.EMF_SAMPLES = None
+
+        for size in sizes:
+            print(f"Running {size} instruments...", file=sys.stderr)
+            stdout = sys.stdout
+            if not args.verbose:
+                sys.stdout = open(os.devnull, "w")
+            try:
+                result = run_size(app, kite, size, args, cache_dir)
+            finally:
+                if sys.stdout is not stdout:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+            results.append(result)
+            print_result(result, baseline.get((size, args.mode)))
+
+        from src.database import close_pool
+        close_pool()
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
@@ -0,0 +1,18 @@
+import argparse
+from src.database import get_instruments_by_pattern
+from src.candle_store import sync_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the local columnar candle store from historical_candles.")
+    parser.add_argument("--pattern", default=None, help="SQL LIKE pattern of trading symbols (default: every stored symbol)")
+    args = parser.parse_args()
+
+    symbols = None
+    if args.pattern:
+        print(f"Looking up instruments matching '{args.pattern}'...")
+        symbols = [i['trading_symbol'] for i in get_instruments_by_pattern(args.pattern)]
+
+    if symbols == []:
+        print("No instruments found. Run fetch_instruments_job.py first.")
+    else:
+        sync_store(symbols)
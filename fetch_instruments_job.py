@@ -1,13 +1,31 @@
-from src.kite_api import fetch_instruments
-from src.database import save_instruments
+import argparse
+from src.kite_api import fetch_instrument_snapshot, iter_instruments
+from src.bulk_load import sync_instruments
+from src.instrument_cache import ist_today
 
 if __name__ == "__main__":
-    print("Fetching instruments...")
-    instruments = fetch_instruments()
-    
-    if instruments:
-        print(f"Fetched {len(instruments)} instruments.")
-        print("Saving to database...")
-        save_instruments(instruments)
+    parser = argparse.ArgumentParser(description="Sync the instrument master into instruments_scd.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the dump straight into the sync instead of building the daily snapshot")
+    parser.add_argument("--pattern", default=None,
+                        help="Only sync trading symbols matching this SQL LIKE pattern (implies --stream)")
+    args = parser.parse_args()
+
+    if args.stream or args.pattern:
+        print("Streaming instruments into the database...")
+        # Rows are filtered while parsing and fed to COPY as they arrive; a failed
+        # download rolls the whole sync back, so nothing is expired by a partial dump
+        sync_instruments(iter_instruments(pattern=args.pattern), ist_today(), scope_pattern=args.pattern)
     else:
-        print("No instruments fetched.")
+        print("Fetching instruments...")
+        # Downloads at most once per trading date; an unchanged dump costs a 304
+        snapshot = fetch_instrument_snapshot()
+
+        if snapshot:
+            print(f"Fetched {len(snapshot)} instruments.")
+            print("Syncing changes to database...")
+            # Records are generated one at a time into the COPY stream; only the snapshot's
+            # compact rows are held in full. Only additions, expiries and changed contracts are written
+            sync_instruments(snapshot.records(), snapshot.trading_date)
+        else:
+            print("No instruments fetched.")
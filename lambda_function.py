@@ -1,53 +1,154 @@
 import json
 import logging
 import os
-from dotenv import load_dotenv
+import time
+from datetime import datetime, timedelta, timezone
 
-# Load environment variables for local testing
-load_dotenv()
-
-# Import core logic from main.py
-from main import (
-    ensure_target_instruments_exist,
-    fetch_and_save_historical_data,
-    update_sma_for_instruments,
-    process_orders_for_instruments
-)
+# Only the standard library is imported at module load, keeping the cold-start init
+# phase short. main (requests, psycopg2, dotenv and src, including the pipeline) is
+# imported by the first invocation; numpy only when INDICATORS actually needs it.
+# Environment variables (.env for local testing) are loaded by src.config.
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# State reused by warm invocations of the same container. The DB connection pool and
+# the HTTP session live at module level in src.database / src.kite_api; all of it is
+# dropped and rebuilt once it is older than LAMBDA_WARM_TTL_SECONDS.
+_warm = {
+    "started": None,     # monotonic time the current warm state was built
+    "targets": {},       # pattern -> (IST date, target instruments)
+    "last_candle": {},   # trading_symbol -> timestamp of the newest candle this container stored
+}
+
+
+def _reset_warm_state():
+    """
+    Closes pooled DB connections and the HTTP session and forgets cached instruments
+    and candle timestamps; the next calls reconnect and re-resolve on demand.
+    """
+    from src.database import clear_instrument_cache, close_pool
+    from src.kite_api import close_http_session
+
+    close_pool()
+    close_http_session()
+    clear_instrument_cache()
+    _warm["targets"].clear()
+    _warm["last_candle"].clear()
+    _warm["started"] = time.monotonic()
+
+
+def _refresh_warm_state():
+    from src.config import LAMBDA_WARM_TTL_SECONDS
+
+    if _warm["started"] is None:
+        _warm["started"] = time.monotonic()
+    elif time.monotonic() - _warm["started"] > LAMBDA_WARM_TTL_SECONDS:
+        logger.info(f"Warm state older than {LAMBDA_WARM_TTL_SECONDS}s; reconnecting and re-resolving instruments")
+        _reset_warm_state()
+
+
+def _target_instruments(pattern: str):
+    """
+    Target instruments for `pattern`, resolved once per trading day (IST) per container.
+    """
+    from main import ensure_target_instruments_exist
+    from src.instrument_cache import ist_today
+
+    today = ist_today()
+    cached = _warm["targets"].get(pattern)
+    if cached and cached[0] == today:
+        logger.info(f"Reusing {len(cached[1])} target instruments from the warm container")
+        return cached[1]
+
+    targets = ensure_target_instruments_exist(pattern)
+    if targets:
+        _warm["targets"][pattern] = (today, targets)
+    return targets
+
+
+def _due_instruments(targets):
+    """
+    Drops instruments whose newest stored candle is already inside this run's fetch
+    window (now - 1 min onwards, see main.fetch_and_save_historical_data), e.g. on a
+    retried invocation: fetching them again could only return duplicates.
+    """
+    window_start = datetime.now(timezone.utc) - timedelta(minutes=1)
+    last = _warm["last_candle"]
+    return [t for t in targets if t['trading_symbol'] not in last or last[t['trading_symbol']] <= window_start]
+
+
+def _remember_candles(instruments):
+    for instrument in instruments:
+        for candle in instrument.get("new_candles", []):
+            ts = candle['timestamp']
+            if not isinstance(ts, datetime):
+                ts = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S%z")
+            symbol = instrument['trading_symbol']
+            if symbol not in _warm["last_candle"] or ts > _warm["last_candle"][symbol]:
+                _warm["last_candle"][symbol] = ts
+
+
 def lambda_handler(event, context):
     """
     AWS Lambda Handler for the trading pipeline.
     """
     logger.info("Lambda execution started")
-    
+
+    # Import core logic from main.py (a no-op on warm invocations)
+    from main import (
+        fetch_and_save_historical_data,
+        update_sma_for_instruments,
+        process_orders_for_instruments
+    )
+    from src import metrics
+    from src.config import PIPELINE_MODE
+
+    _refresh_warm_state()
+
     try:
         # 1. Ensure Instruments
         # Using the same pattern as in main.py, or from env var if available
         PATTERN = os.getenv("INSTRUMENT_PATTERN", "NIFTY26%")
         logger.info(f"Step 1: Ensuring instruments for pattern {PATTERN}")
-        targets = ensure_target_instruments_exist(PATTERN)
-        
+        targets = _target_instruments(PATTERN)
+
+        due = _due_instruments(targets)
+        if len(due) < len(targets):
+            logger.info(f"Skipping {len(targets) - len(due)} instruments whose current candle is already stored")
+
+        if PIPELINE_MODE == "async":
+            from src.pipeline import run_pipeline_sync
+
+            # 2-4. Each instrument flows through fetch -> persist -> SMA -> orders on its own
+            logger.info(f"Steps 2-4: Running async pipeline for {len(due)} instruments")
+            completed = []
+            summary = run_pipeline_sync(due, results=completed)
+            _remember_candles(completed)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'message': 'Pipeline completed successfully', 'summary': summary})
+            }
+
         # 2. Fetch Historical Data
-        logger.info(f"Step 2: Fetching historical data for {len(targets)} instruments")
-        updated_instruments = fetch_and_save_historical_data(targets)
-        
+        logger.info(f"Step 2: Fetching historical data for {len(due)} instruments")
+        updated_instruments = fetch_and_save_historical_data(due)
+        _remember_candles(updated_instruments)
+
         # 3. Update SMA
         logger.info(f"Step 3: Updating SMA for {len(updated_instruments)} instruments")
-        update_sma_for_instruments(updated_instruments)
-        
+        latest_stats = update_sma_for_instruments(updated_instruments)
+
         # 4. Process Orders
         logger.info(f"Step 4: Processing orders")
-        process_orders_for_instruments(updated_instruments)
-        
+        process_orders_for_instruments(updated_instruments, latest_stats)
+
         return {
             'statusCode': 200,
             'body': json.dumps('Pipeline completed successfully')
         }
-        
+
     except Exception as e:
         logger.error(f"Pipeline failed: {e}", exc_info=True)
         return {
@@ -55,6 +156,12 @@ def lambda_handler(event, context):
             'body': json.dumps(f"Execution Error: {str(e)}")
         }
 
+    finally:
+        if metrics.is_enabled():
+            # Printed EMF documents become CloudWatch metrics; start the next warm run empty
+            metrics.emit("emf")
+            metrics.reset()
+
 if __name__ == "__main__":
     # Local Test
     print(lambda_handler({}, None))
@@ -1,36 +1,37 @@
-from src.kite_api import fetch_kite_historical_data, fetch_instruments
-from src.database import save_historical_data, save_instruments, get_instruments_by_pattern, update_running_average, get_latest_stats_and_close
-from src.orders import process_order_logic
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict
+from src.kite_api import fetch_instruments
+from src.database import get_instruments_by_pattern, recompute_running_averages, get_latest_stats_and_close_bulk
+from src.pipeline import run_stages, update_average
+from src.positions import PositionBook
+from src.bulk_load import sync_instruments
+from src.instrument_cache import load_snapshot
+from src.metrics import timed, emit, is_enabled, increment
+from src.config import INDICATORS, FETCH_WORKERS, SMA_MODE, PIPELINE_MODE
+from typing import List, Dict, Optional
 
 def ensure_target_instruments_exist(pattern: str) -> List[Dict]:
     """
     Ensures that instruments matching the pattern exist in the database.
-    If not found, fetches from API, saves, and retries.
+    Today's on-disk instrument snapshot is consulted first, without touching
+    Postgres or the network. If not found, fetches from API, saves, and retries.
     """
     print(f"Checking for instruments matching pattern '{pattern}'...")
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        target_instruments = snapshot.lookup(pattern)
+        if target_instruments:
+            print(f"Found {len(target_instruments)} instruments matching '{pattern}' in today's instrument snapshot.")
+            return target_instruments
+
     target_instruments = get_instruments_by_pattern(pattern)
     
     if not target_instruments:
         print(f"No instruments found for pattern '{pattern}'. Fetching all instruments from Kite API...")
         try:
-            all_instruments = fetch_instruments()
-            if all_instruments:
-                print(f"Fetched {len(all_instruments)} instruments from API.")
-                
-                # Filter instruments by pattern before saving
-                import fnmatch
-                # Convert SQL LIKE pattern (%) to fnmatch pattern (*)
-                fnmatch_pattern = pattern.replace('%', '*')
-                
-                filtered_instruments = [
-                    inst for inst in all_instruments 
-                    if fnmatch.fnmatch(inst['trading_symbol'], fnmatch_pattern)
-                ]
-                
-                print(f"Filtered down to {len(filtered_instruments)} instruments matching '{fnmatch_pattern}'. Saving to database...")
-                save_instruments(filtered_instruments)
+            # The symbol pattern is applied while the dump streams, so only matches are kept
+            target_from_api = fetch_instruments(pattern=pattern)
+            if target_from_api:
+                print(f"Fetched {len(target_from_api)} instruments matching '{pattern}' from API. Syncing to database...")
+                sync_instruments(target_from_api, scope_pattern=pattern)
                 
                 # Retry fetching target instruments (should match what we just saved)
                 target_instruments = get_instruments_by_pattern(pattern)
@@ -44,112 +45,100 @@ def ensure_target_instruments_exist(pattern: str) -> List[Dict]:
         
     return target_instruments
 
-def fetch_and_save_historical_data(instruments: List[Dict]) -> List[Dict]:
+@timed("pipeline.stage", count_rows=True, labels={"stage": "fetch"})
+def fetch_and_save_historical_data(instruments: List[Dict], max_workers: Optional[int] = None) -> List[Dict]:
     """
-    Fetches historical data for the given list of instruments and saves to DB.
-    Returns the list of instruments that were successfully processed.
+    Fetches historical data for the given list of instruments and saves to DB, through
+    the pipeline's fetch and persist stages. Up to `max_workers` (default FETCH_WORKERS)
+    HTTP requests run concurrently; the candles are then saved one instrument at a time,
+    in input order. Returns the instruments that were successfully processed, in input order, with their
+    newly inserted candles under 'new_candles'.
     """
     if not instruments:
         print("No target instruments available to fetch data for.")
         return []
 
     print(f"Starting historical data fetch for {len(instruments)} instruments...")
-    
-    # Define time range: Current time to +5 minutes
-    # AWS Lambda runs in UTC, so we must manually adjust to IST (UTC+5:30)
-    now_utc = datetime.now(timezone.utc)
-    now_ist = now_utc + timedelta(hours=5, minutes=30)
-    
-    print(f"Current Time (IST): {now_ist}")
-
-    from_date = (now_ist - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S")
-    to_date = (now_ist + timedelta(minutes=4)).strftime("%Y-%m-%d %H:%M:%S")
-    # from_date = now.strftime("%Y-%m-%d %H:%M:%S")
-    # to_date = (now + timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
-    # from_date = "2026-01-12 13:00:00"
-    # to_date = datetime.now()
-    interval = "5minute"
-    
-    successful_instruments = []
-    
-    for instrument in instruments:
-        token = instrument['instrument_token']
-        symbol = instrument['trading_symbol']
-        
-        print(f"Fetching data for {symbol} ({token})...")
-        try:
-            candles = fetch_kite_historical_data(
-                instrument_token=token,
-                trading_symbol=symbol,
-                from_date=from_date,
-                to_date=to_date,
-                interval=interval
-            )
-            
-            if candles:
-                print(f"Fetched {len(candles)} candles for {symbol}. Saving to DB...")
-                save_historical_data(candles)
-                successful_instruments.append(instrument)
-            else:
-                print(f"No candles fetched for {symbol}.")
-                
-        except Exception as e:
-            print(f"Failed to fetch/save data for {symbol}: {e}")
-            
+    fetched = run_stages(instruments, ("fetch",), timeout=None,
+                         concurrency={"fetch": max(1, max_workers or FETCH_WORKERS)})
+    # A single persist worker takes the input-ordered buffer in turn, so saves keep input order
+    updated = run_stages(fetched, ("persist",), timeout=None, concurrency={"persist": 1})
     print("Historical data fetch completed.")
-    return successful_instruments
+    return updated
 
-def update_sma_for_instruments(instruments: List[Dict]):
+@timed("pipeline.stage", labels={"stage": "sma"})
+def update_sma_for_instruments(instruments: List[Dict]) -> Optional[Dict[str, tuple]]:
     """
-    Updates the 200 SMA for the given list of instruments.
+    Updates the 200 SMA (and any INDICATORS) for the given list of instruments.
     Stage 2 of the pipeline.
+    Returns {symbol: (latest_close, avg_200)} for the order stage. With SMA_MODE=bulk,
+    all windows are recomputed in one statement instead of per instrument.
     """
     if not instruments:
         print("No instruments to update SMA for.")
-        return
+        return None
 
     print(f"Starting SMA update for {len(instruments)} instruments...")
-    
-    for instrument in instruments:
-        symbol = instrument['trading_symbol']
+
+    if SMA_MODE == "bulk":
+        symbols = [instrument['trading_symbol'] for instrument in instruments]
+        latest = recompute_running_averages(symbols)
+    else:
+        # Running averages are updated per instrument; stats are then read in one round-trip
+        updated = run_stages(instruments, ("indicator",), timeout=None, stages={"indicator": update_average})
+        symbols = [item['trading_symbol'] for item in updated]
+        latest = get_latest_stats_and_close_bulk(symbols) if symbols else {}
+        for symbol in symbols:
+            if symbol not in latest:
+                print(f"No sufficient data (stats/candles) found for {symbol}. Skipping orders.")
+
+    if INDICATORS and symbols:
+        # Imported here so runs without indicators never load numpy
+        from src.indicators import update_indicators
         try:
-            print(f"Updating running average for {symbol}...")
-            # We strictly need to "update" it based on the recent data.
-            # update_running_average recalculates based on latest 200 candles in DB.
-            update_running_average(symbol, []) 
+            update_indicators(symbols)
         except Exception as e:
-            print(f"Failed to update SMA for {symbol}: {e}")
-            
-    print("SMA update process completed.")
+            print(f"Failed to update indicators: {e}")
 
+    print("SMA update process completed.")
+    return latest
 
-def process_orders_for_instruments(instruments: List[Dict]):
+@timed("pipeline.stage", labels={"stage": "orders"})
+def process_orders_for_instruments(instruments: List[Dict], latest: Optional[Dict[str, tuple]] = None):
     """
     Processes trading orders for the given list of instruments.
     Stage 3 of the pipeline.
+    `latest` ({symbol: (latest_close, avg_200)}, as returned by update_sma_for_instruments)
+    saves re-reading the stats; symbols missing from it are read from the DB.
     """
     if not instruments:
         print("No instruments to process orders for.")
         return
 
     print(f"Starting order processing for {len(instruments)} instruments...")
-    
+
+    # Retrieve updated stats for every instrument in one round-trip
+    latest = dict(latest or {})
+    missing = [instrument['trading_symbol'] for instrument in instruments if instrument['trading_symbol'] not in latest]
+    if missing:
+        latest.update(get_latest_stats_and_close_bulk(missing))
+
+    ready = []
     for instrument in instruments:
-        symbol = instrument['trading_symbol']
-        
-        try:
-            # Retrieve updated stats
-            result = get_latest_stats_and_close(symbol)
-            
-            if result:
-                latest_close, avg_200 = result
-                print(f"Processing order logic for {symbol}. Close: {latest_close}, SMA: {avg_200}")
-                process_order_logic(symbol, latest_close, avg_200)
-            else:
-                print(f"No sufficient data (stats/candles) found for {symbol}. Skipping orders.")
-                    
-        except Exception as e:
-            print(f"Failed to process orders for {symbol}: {e}")
+        if latest.get(instrument['trading_symbol']):
+            ready.append({**instrument, "latest": latest[instrument['trading_symbol']]})
+        else:
+            print(f"No sufficient data (stats/candles) found for {instrument['trading_symbol']}. Skipping orders.")
+
+    # Open positions are read once and order writes batched into one transaction;
+    # if they cannot be loaded, each order step goes to the DB directly.
+    book = PositionBook.load([symbol for symbol in latest])
+    if ready:
+        run_stages(ready, ("order",), timeout=None, book=book)
+
+    if book is not None and not book.flush():
+        increment("orders.flush_failed")
+        print(f"Failed to write {book.pending} pending order changes; they were rolled back.")
             
     print("Order processing completed.")
 
@@ -157,12 +146,20 @@ if __name__ == "__main__":
     # 1. Ensure Instruments
     PATTERN = "NIFTY26%"
     targets = ensure_target_instruments_exist(PATTERN)
-    
-    # 2. Fetch Historical Data
-    updated_instruments = fetch_and_save_historical_data(targets)
-    
-    # 3. Update SMA
-    update_sma_for_instruments(updated_instruments)
-    
-    # 4. Process Orders
-    process_orders_for_instruments(updated_instruments)
+
+    if PIPELINE_MODE == "async":
+        # 2-4. Each instrument flows through fetch -> persist -> SMA -> orders on its own
+        from src.pipeline import run_pipeline_sync
+        run_pipeline_sync(targets)
+    else:
+        # 2. Fetch Historical Data
+        updated_instruments = fetch_and_save_historical_data(targets)
+
+        # 3. Update SMA
+        latest_stats = update_sma_for_instruments(updated_instruments)
+
+        # 4. Process Orders
+        process_orders_for_instruments(updated_instruments, latest_stats)
+
+    if is_enabled():
+        emit("json")
@@ -0,0 +1,17 @@
+from src.database import get_db_connection
+from src.schema import get_applied_version, migrate, SCHEMA_VERSION
+
+if __name__ == "__main__":
+    conn = get_db_connection()
+
+    if conn:
+        try:
+            current = get_applied_version(conn)
+            print(f"Schema version: {current} (latest: {SCHEMA_VERSION})")
+
+            applied = migrate(conn)
+            print(f"Applied {applied} migration(s).")
+        finally:
+            conn.close()
+    else:
+        print("Could not connect to database.")
@@ -0,0 +1,38 @@
+import argparse
+from src.database import get_instruments_by_pattern
+from src.optimizer import run_sweep, format_table
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",")]
+
+
+def _floats(value):
+    return [float(v) for v in value.split(",")]
+
+
+def _stops(value):
+    return [None if v.strip().lower() == "none" else float(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep SMA window / take-profit / stop-loss combinations over stored candles.")
+    parser.add_argument("--pattern", default="NIFTY26%", help="SQL LIKE pattern of trading symbols")
+    parser.add_argument("--windows", type=_ints, default="50,100,200", help="Comma-separated SMA windows")
+    parser.add_argument("--take-profits", type=_floats, default="0.01,0.02,0.05", help="Comma-separated take-profit ratios")
+    parser.add_argument("--stops", type=_stops, default="none,0.01,0.02", help="Comma-separated stop-loss ratios ('none' for no stop)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--store", action="store_true", help="Read candles from the local candle store instead of Postgres")
+    parser.add_argument("--top", type=int, default=20, help="Rows of the ranked table to print")
+    args = parser.parse_args()
+
+    print(f"Looking up instruments matching '{args.pattern}'...")
+    instruments = get_instruments_by_pattern(args.pattern)
+
+    if instruments:
+        results = run_sweep([i['trading_symbol'] for i in instruments], args.windows, args.take_profits, args.stops,
+                            args.workers, args.store)
+        if results:
+            print(format_table(results, args.top))
+    else:
+        print("No instruments found. Run fetch_instruments_job.py first.")
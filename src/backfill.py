@@ -0,0 +1,251 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from src.config import BACKFILL_WORKERS
+from src.bulk_load import bulk_save_historical_data
+from src.database import db_connection, update_running_average
+from src.kite_api import request_historical_candles, KiteAPIError
+from src.schema import ensure_schema
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# Kite's maximum span (in days) of a single historical request, per interval
+MAX_DAYS_PER_REQUEST = {
+    "minute": 60,
+    "3minute": 100,
+    "5minute": 100,
+    "10minute": 100,
+    "15minute": 200,
+    "30minute": 200,
+    "60minute": 400,
+    "day": 2000,
+}
+
+INTERVAL_MINUTES = {
+    "minute": 1,
+    "3minute": 3,
+    "5minute": 5,
+    "10minute": 10,
+    "15minute": 15,
+    "30minute": 30,
+    "60minute": 60,
+    "day": 1440,
+}
+
+# Exchange session (IST), used to tell overnight/weekend closures apart from real holes
+SESSION_OPEN = time(9, 15)
+SESSION_CLOSE = time(15, 30)
+
+Range = Tuple[datetime, datetime]
+
+
+def chunk_range(start: datetime, end: datetime, interval: str) -> List[Range]:
+    """
+    Splits [start, end) into consecutive pieces no longer than Kite allows per request.
+    """
+    step = timedelta(days=MAX_DAYS_PER_REQUEST[interval])
+    chunks = []
+    cursor = start
+    while cursor < end:
+        chunk_end = min(cursor + step, end)
+        chunks.append((cursor, chunk_end))
+        cursor = chunk_end
+    return chunks
+
+
+def subtract_ranges(ranges: List[Range], covered: List[Range], min_length: timedelta = timedelta(0)) -> List[Range]:
+    """
+    Removes the `covered` ranges from `ranges`, dropping leftovers shorter than `min_length`.
+    """
+    result = []
+    for start, end in ranges:
+        pieces = [(start, end)]
+        for c_start, c_end in covered:
+            remaining = []
+            for p_start, p_end in pieces:
+                if c_end <= p_start or c_start >= p_end:
+                    remaining.append((p_start, p_end))
+                    continue
+                if p_start < c_start:
+                    remaining.append((p_start, c_start))
+                if c_end < p_end:
+                    remaining.append((c_end, p_end))
+            pieces = remaining
+        result.extend(p for p in pieces if p[1] - p[0] > min_length)
+    return result
+
+
+def find_missing_ranges(cur, trading_symbol: str, start: datetime, end: datetime, interval: str) -> List[Range]:
+    """
+    Detects missing candle ranges for a symbol within [start, end]:
+    before the first stored candle, after the last one, and holes in between.
+    For intraday intervals a hole only counts if it is not a plain overnight or
+    weekend closure, i.e. it starts before the session's last bar or ends after its first.
+    """
+    bar = timedelta(minutes=INTERVAL_MINUTES[interval])
+
+    cur.execute("""
+        SELECT MIN(timestamp), MAX(timestamp) FROM historical_candles
+        WHERE trading_symbol = %s AND timestamp >= %s AND timestamp <= %s
+    """, (trading_symbol, start, end))
+    first, last = cur.fetchone()
+
+    if first is None:
+        return [(start, end)]
+
+    ranges = []
+    if first - start > bar:
+        ranges.append((start, first))
+
+    query = """
+        SELECT prev_ts, timestamp FROM (
+            SELECT timestamp, LAG(timestamp) OVER (ORDER BY timestamp) AS prev_ts
+            FROM historical_candles
+            WHERE trading_symbol = %s AND timestamp >= %s AND timestamp <= %s
+        ) t
+        WHERE prev_ts IS NOT NULL AND timestamp - prev_ts > %s
+    """
+    params = [trading_symbol, start, end, bar]
+
+    if interval != "day":
+        last_bar = (datetime.combine(date.today(), SESSION_CLOSE) - bar).time()
+        query += """
+          AND ((prev_ts AT TIME ZONE 'Asia/Kolkata')::time < %s
+               OR (timestamp AT TIME ZONE 'Asia/Kolkata')::time > %s)
+        """
+        params += [last_bar, SESSION_OPEN]
+
+    cur.execute(query, params)
+    ranges.extend((prev_ts, ts) for prev_ts, ts in cur.fetchall())
+
+    if end - last > bar:
+        ranges.append((last, end))
+
+    return ranges
+
+
+def plan_backfill(instruments: List[Dict], start: datetime, end: datetime, interval: str = "5minute") -> List[Tuple[Dict, datetime, datetime]]:
+    """
+    Returns the (instrument, chunk_start, chunk_end) requests needed to fill every gap,
+    excluding ranges already checkpointed by earlier (possibly interrupted) runs.
+    """
+    bar = timedelta(minutes=INTERVAL_MINUTES[interval])
+    plan = []
+
+    with db_connection() as conn:
+        if not conn:
+            return []
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                for instrument in instruments:
+                    symbol = instrument['trading_symbol']
+                    missing = find_missing_ranges(cur, symbol, start, end, interval)
+
+                    cur.execute("""
+                        SELECT range_start, range_end FROM backfill_checkpoints
+                        WHERE trading_symbol = %s AND interval = %s AND range_end > %s AND range_start < %s
+                    """, (symbol, interval, start, end))
+                    missing = subtract_ranges(missing, cur.fetchall(), min_length=bar)
+
+                    for gap_start, gap_end in missing:
+                        plan.extend((instrument, c_start, c_end) for c_start, c_end in chunk_range(gap_start, gap_end, interval))
+
+        except Exception as e:
+            print(f"Failed to plan backfill: {e}")
+            conn.rollback()
+            return []
+
+    return plan
+
+
+def _record_checkpoint(trading_symbol: str, interval: str, range_start: datetime, range_end: datetime, candles: int):
+    """
+    Marks a fetched chunk as done so a resumed backfill skips it.
+    """
+    with db_connection() as conn:
+        if not conn:
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO backfill_checkpoints (trading_symbol, interval, range_start, range_end, candles)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (trading_symbol, interval, range_start, range_end) DO NOTHING;
+                """, (trading_symbol, interval, range_start, range_end, candles))
+            conn.commit()
+
+        except Exception as e:
+            print(f"Failed to record backfill checkpoint for {trading_symbol}: {e}")
+            conn.rollback()
+
+
+def _kite_time(value: datetime) -> str:
+    return value.astimezone(IST).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def run_backfill(instruments: List[Dict], start: datetime, end: datetime,
+                 interval: str = "5minute", max_workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Fills gaps in historical_candles for the given instruments between `start` and `end`.
+
+    Chunks are fetched in parallel (the shared token bucket keeps the request rate
+    within Kite's limit) and each one is COPY-loaded and checkpointed as soon as it
+    arrives. Symbols that received candles get a full SMA recompute at the end.
+    historical_candles has no interval column, so `interval` must match the pipeline's.
+    """
+    unique = list({i['trading_symbol']: i for i in instruments}.values())
+    plan = plan_backfill(unique, start, end, interval)
+    summary = {"chunks": len(plan), "failed": 0, "inserted": 0, "symbols": 0}
+
+    if not plan:
+        print("Backfill: nothing to do.")
+        return summary
+
+    print(f"Backfill: {len(plan)} chunk(s) across {len({p[0]['trading_symbol'] for p in plan})} instrument(s)...")
+    touched = set()
+    workers = max(1, max_workers or BACKFILL_WORKERS)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                request_historical_candles,
+                instrument['instrument_token'],
+                instrument['trading_symbol'],
+                interval,
+                _kite_time(c_start),
+                _kite_time(c_end)
+            ): (instrument['trading_symbol'], c_start, c_end)
+            for instrument, c_start, c_end in plan
+        }
+
+        for future in as_completed(futures):
+            symbol, c_start, c_end = futures[future]
+            try:
+                candles = future.result()
+            except (requests.exceptions.RequestException, KiteAPIError, IndexError, KeyError, ValueError) as e:
+                print(f"Backfill chunk failed for {symbol} [{c_start} -> {c_end}]: {e}")
+                summary["failed"] += 1
+                continue
+
+            result = bulk_save_historical_data(candles)
+            if result is None:
+                summary["failed"] += 1
+                continue
+
+            _record_checkpoint(symbol, interval, c_start, c_end, len(candles))
+            summary["inserted"] += result["inserted"]
+            if result["inserted"]:
+                touched.add(symbol)
+            print(f"Backfill chunk done for {symbol} [{c_start} -> {c_end}]: {len(candles)} fetched, {result['inserted']} new.")
+
+    for symbol in sorted(touched):
+        update_running_average(symbol, [], full_recompute=True)
+
+    summary["symbols"] = len(touched)
+    print(f"Backfill completed: {summary}")
+    return summary
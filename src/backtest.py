@@ -0,0 +1,205 @@
+import numpy as np
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from src.candle_store import load_candles
+from src.database import db_connection, SMA_WINDOW
+from src.orders import TAKE_PROFIT_PCT
+
+# Closes are scanned for an exit in chunks that double in size, so a trade costs
+# O(its own length) even when the next reversal is far away.
+_FIRST_SCAN = 64
+
+
+def rolling_sma(closes: np.ndarray, window: int = SMA_WINDOW, decimals: Optional[int] = 2) -> np.ndarray:
+    """
+    SMA of each candle over itself and the previous window-1 closes, as the live
+    pipeline stores it: fewer candles at the start of the series, rounded to `decimals`.
+    """
+    n = len(closes)
+    if n == 0:
+        return np.empty(0)
+
+    # Centering keeps the running sum small, so differences stay exact to ~1e-9
+    offset = closes.mean()
+    csum = np.concatenate(([0.0], np.cumsum(closes - offset)))
+    end = np.arange(1, n + 1)
+    start = np.maximum(end - window, 0)
+    sma = (csum[end] - csum[start]) / (end - start) + offset
+
+    return np.round(sma, decimals) if decimals is not None else sma
+
+
+def _first_true(mask_fn, start: int, stop: int) -> int:
+    """
+    Index of the first position in [start, stop) where mask_fn(lo, hi) is True, else stop.
+    """
+    size = _FIRST_SCAN
+    while start < stop:
+        hi = min(start + size, stop)
+        hits = mask_fn(start, hi)
+        first = int(hits.argmax())
+        if hits[first]:
+            return start + first
+        start = hi
+        size *= 2
+    return stop
+
+
+def replay(closes: np.ndarray, sma: np.ndarray, take_profit: float = TAKE_PROFIT_PCT,
+           stop_loss: Optional[float] = None) -> Tuple[List[Tuple[int, int, str]], Optional[int]]:
+    """
+    Replays process_order_logic's rules over every candle, jumping from event to event
+    instead of stepping tick by tick.
+
+    Returns ([(entry_index, exit_index, reason)], index of the entry still open or None).
+    """
+    n = len(closes)
+    below = closes < sma
+    # Plain lists: bisect on them is much cheaper per event than np.searchsorted
+    entries = np.flatnonzero(below).tolist()
+    reversals = np.flatnonzero(closes > sma).tolist()
+
+    trades = []
+    t = 0
+    while True:
+        k = bisect_left(entries, t)
+        if k == len(entries):
+            return trades, None
+
+        entry = entries[k]
+        price = closes[entry]
+
+        r = bisect_left(reversals, entry + 1)
+        reversal = reversals[r] if r < len(reversals) else n
+
+        # Same expressions as decide_order_action, evaluated over a slice
+        def exits(lo, hi):
+            hit = below[lo:hi] & ((price - closes[lo:hi]) / price >= take_profit)
+            if stop_loss is not None:
+                hit |= (closes[lo:hi] - price) / price >= stop_loss
+            return hit
+
+        target = _first_true(exits, entry + 1, reversal)
+
+        if target < reversal:
+            stopped = stop_loss is not None and (closes[target] - price) / price >= stop_loss
+            trades.append((entry, target, "stop_loss" if stopped else "take_profit"))
+            t = target + 1
+        elif reversal < n:
+            trades.append((entry, reversal, "reversal"))
+            t = reversal + 1
+        else:
+            return trades, entry
+
+
+def max_drawdown(closes: np.ndarray, trades: List[Tuple[int, int, str]], open_entry: Optional[int]) -> float:
+    """
+    Largest peak-to-trough fall of the mark-to-market equity curve (price points, one unit short).
+    """
+    n = len(closes)
+    realized = np.zeros(n)
+    unrealized = np.zeros(n)
+
+    for entry, exit_, _ in trades:
+        realized[exit_] += closes[entry] - closes[exit_]
+        unrealized[entry:exit_] = closes[entry] - closes[entry:exit_]
+    if open_entry is not None:
+        unrealized[open_entry:] = closes[open_entry] - closes[open_entry:]
+
+    equity = np.cumsum(realized) + unrealized
+    return float(np.max(np.maximum.accumulate(np.maximum(equity, 0.0)) - equity)) if n else 0.0
+
+
+def backtest(closes: np.ndarray, timestamps: Optional[np.ndarray] = None, window: int = SMA_WINDOW,
+             take_profit: float = TAKE_PROFIT_PCT, stop_loss: Optional[float] = None) -> Dict:
+    """
+    Runs the SMA strategy over a close series without touching the orders table.
+
+    Returns {"candles", "trades", "open_position", "pnl", "win_rate", "max_drawdown"}.
+    Each trade is a dict with entry/exit index, time and price, the exit reason and
+    the short's pnl (entry - exit) and return. pnl and max_drawdown are in price points
+    for one unit; the open position is marked to the last close in neither.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    sma = rolling_sma(closes, window)
+    events, open_entry = replay(closes, sma, take_profit, stop_loss)
+
+    def _time(i):
+        return timestamps[i] if timestamps is not None else None
+
+    trades = []
+    for entry, exit_, reason in events:
+        pnl = float(closes[entry] - closes[exit_])
+        trades.append({
+            "entry_index": entry,
+            "entry_time": _time(entry),
+            "entry_price": float(closes[entry]),
+            "exit_index": exit_,
+            "exit_time": _time(exit_),
+            "exit_price": float(closes[exit_]),
+            "reason": reason,
+            "pnl": pnl,
+            "return": pnl / float(closes[entry])
+        })
+
+    open_position = None
+    if open_entry is not None:
+        open_position = {"entry_index": open_entry, "entry_time": _time(open_entry), "entry_price": float(closes[open_entry])}
+
+    return {
+        "candles": len(closes),
+        "trades": trades,
+        "open_position": open_position,
+        "pnl": sum(t["pnl"] for t in trades),
+        "win_rate": (sum(1 for t in trades if t["pnl"] > 0) / len(trades)) if trades else 0.0,
+        "max_drawdown": max_drawdown(closes, events, open_entry)
+    }
+
+
+def load_candle_series(trading_symbol: str, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Loads a symbol's stored candles, oldest first, as (datetime64[s] UTC timestamps, closes).
+    Returns empty arrays if there is no data or the DB is unavailable.
+    """
+    empty = (np.empty(0, dtype="datetime64[s]"), np.empty(0))
+
+    with db_connection() as conn:
+        if not conn:
+            return empty
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT EXTRACT(EPOCH FROM timestamp)::bigint, closed FROM historical_candles
+                    WHERE trading_symbol = %s
+                      AND (%s::timestamptz IS NULL OR timestamp >= %s)
+                      AND (%s::timestamptz IS NULL OR timestamp < %s)
+                    ORDER BY timestamp
+                """, (trading_symbol, start, start, end, end))
+                rows = cur.fetchall()
+
+        except Exception as e:
+            print(f"Failed to load candles for {trading_symbol}: {e}")
+            return empty
+
+    if not rows:
+        return empty
+
+    epochs, closes = zip(*rows)
+    return np.asarray(epochs, dtype=np.int64).astype("datetime64[s]"), np.asarray(closes, dtype=np.float64)
+
+
+def run_backtest(trading_symbol: str, window: int = SMA_WINDOW, take_profit: float = TAKE_PROFIT_PCT,
+                 stop_loss: Optional[float] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, use_store: bool = False) -> Dict:
+    """
+    Backtests the strategy on a symbol's stored historical_candles, or on its copy in
+    the local candle store (src/candle_store.py) if `use_store`.
+    """
+    load = load_candles if use_store else load_candle_series
+    timestamps, closes = load(trading_symbol, start, end)
+    result = backtest(closes, timestamps, window, take_profit, stop_loss)
+    result["trading_symbol"] = trading_symbol
+    return result
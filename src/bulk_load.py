@@ -0,0 +1,200 @@
+import csv
+import io
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional
+from src.database import clear_instrument_cache, db_connection
+from src.instrument_cache import ist_today
+from src.metrics import timed
+from src.schema import ensure_schema
+
+HISTORICAL_COLUMNS = ["timestamp", "closed", "instrument_token", "trading_symbol"]
+SCD_COLUMNS = ["instrument_token", "trading_symbol", "name", "instrument_type", "exchange_token", "exchange"]
+
+
+class _IteratorReader(io.TextIOBase):
+    """
+    Read-only file object over an iterator of text chunks, so COPY can pull
+    rows as they are produced instead of from a fully built buffer.
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _csv_chunks(rows: Iterable[Dict], columns: List[str], counter: Dict[str, int], chunk_bytes: int = 1 << 16) -> Iterator[str]:
+    """
+    Serialises dict rows to CSV text in ~chunk_bytes pieces, counting rows as they pass.
+    None becomes an empty unquoted field, which COPY reads as NULL.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    for row in rows:
+        writer.writerow([row.get(column) for column in columns])
+        counter["rows"] += 1
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _copy_to_stage(cur, table: str, columns: List[str], rows: Iterable[Dict], counter: Dict[str, int]) -> str:
+    """
+    Streams `rows` with COPY FROM STDIN (CSV) into a session-private staging table
+    shaped like `table`'s `columns`, dropped at commit. Returns the staging table name.
+    """
+    stage = f"_stage_{table}"
+    column_list = ", ".join(columns)
+
+    # Temp tables skip WAL like UNLOGGED ones and cannot collide across sessions
+    cur.execute(f"""
+        CREATE TEMP TABLE {stage} ON COMMIT DROP AS
+        SELECT {column_list} FROM {table} WITH NO DATA;
+    """)
+    cur.copy_expert(
+        f"COPY {stage} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+        _IteratorReader(_csv_chunks(rows, columns, counter))
+    )
+    return stage
+
+
+@timed("db.copy_merge", label_args=("table",), none_is_error=True)
+def copy_merge(table: str, columns: List[str], conflict_columns: List[str], rows: Iterable[Dict]) -> Optional[Dict[str, int]]:
+    """
+    Streams `rows` with COPY FROM STDIN (CSV) into a session-private staging table,
+    then merges them with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+
+    Returns {"rows", "inserted", "skipped"}, or None if the load failed (rolled back).
+    """
+    column_list = ", ".join(columns)
+    counter = {"rows": 0}
+
+    with db_connection() as conn:
+        if not conn:
+            return None
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                stage = _copy_to_stage(cur, table, columns, rows, counter)
+                cur.execute(f"""
+                    INSERT INTO {table} ({column_list})
+                    SELECT {column_list} FROM {stage}
+                    ON CONFLICT ({", ".join(conflict_columns)}) DO NOTHING;
+                """)
+                inserted = cur.rowcount
+
+            conn.commit()
+
+            result = {"rows": counter["rows"], "inserted": inserted, "skipped": counter["rows"] - inserted}
+            print(f"Bulk loaded {result['rows']} rows into {table}: {result['inserted']} inserted, {result['skipped']} skipped.")
+            return result
+
+        except Exception as e:
+            print(f"Bulk load into {table} failed: {e}")
+            conn.rollback()
+            return None
+
+
+def bulk_save_historical_data(data: Iterable[Dict]) -> Optional[Dict[str, int]]:
+    """
+    COPY-based equivalent of save_historical_data for large loads (e.g. backfills).
+    Accepts any iterable of candle dicts, including generators.
+    """
+    return copy_merge("historical_candles", HISTORICAL_COLUMNS, ["trading_symbol", "timestamp"], data)
+
+
+def sync_instruments(data: Iterable[Dict], trading_date: Optional[date] = None, scope_pattern: Optional[str] = None,
+                     expire: bool = True) -> Optional[Dict[str, int]]:
+    """
+    Applies an instrument dump to instruments_scd as a diff keyed by instrument_token.
+
+    Open versions whose contract is missing from the dump or whose attributes changed
+    are closed (valid_to = trading_date); new and changed contracts get a fresh open
+    version from trading_date. Unchanged contracts are not written at all.
+    `scope_pattern` (SQL LIKE on trading_symbol) limits expiry to that slice, for
+    dumps that were filtered before syncing. With `expire=False` contracts missing from
+    `data` are left open, for partial lists that are not a full dump.
+
+    Returns {"rows", "added", "changed", "expired"}, or None if the sync failed (rolled back).
+    """
+    trading_date = trading_date or ist_today()
+    counter = {"rows": 0}
+
+    with db_connection() as conn:
+        if not conn:
+            return None
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                stage = _copy_to_stage(cur, "instruments_scd", SCD_COLUMNS, data, counter)
+                unchanged = " AND ".join(f"s.{column} IS NOT DISTINCT FROM c.{column}" for column in SCD_COLUMNS[1:])
+
+                cur.execute(f"""
+                    UPDATE instruments_scd c SET valid_to = %s
+                    WHERE c.valid_to IS NULL
+                      AND (%s::text IS NULL OR c.trading_symbol LIKE %s)
+                      AND (%s OR EXISTS (SELECT 1 FROM {stage} s WHERE s.instrument_token = c.instrument_token))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM {stage} s
+                          WHERE s.instrument_token = c.instrument_token AND {unchanged}
+                      )
+                    RETURNING c.instrument_token;
+                """, (trading_date, scope_pattern, scope_pattern, expire))
+                closed = {row[0] for row in cur.fetchall()}
+
+                column_list = ", ".join(SCD_COLUMNS)
+                cur.execute(f"""
+                    INSERT INTO instruments_scd ({column_list}, valid_from)
+                    SELECT DISTINCT ON (s.instrument_token) {", ".join("s." + column for column in SCD_COLUMNS)}, %s
+                    FROM {stage} s
+                    WHERE s.instrument_token IS NOT NULL
+                      AND NOT EXISTS (
+                          SELECT 1 FROM instruments_scd c
+                          WHERE c.instrument_token = s.instrument_token AND c.valid_to IS NULL
+                      )
+                    ORDER BY s.instrument_token
+                    RETURNING instrument_token;
+                """, (trading_date,))
+                opened = {row[0] for row in cur.fetchall()}
+
+            conn.commit()
+            clear_instrument_cache()
+
+            result = {
+                "rows": counter["rows"],
+                "added": len(opened - closed),
+                "changed": len(opened & closed),
+                "expired": len(closed - opened),
+            }
+            print(f"Instrument sync for {trading_date}: {result['rows']} in dump, {result['added']} added, "
+                  f"{result['changed']} changed, {result['expired']} expired.")
+            return result
+
+        except Exception as e:
+            print(f"Instrument sync failed: {e}")
+            conn.rollback()
+            return None
@@ -0,0 +1,246 @@
+import glob
+import json
+import os
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from src.config import CANDLE_STORE_DIR
+from src.database import db_connection
+
+# Each partition is two raw little-endian column files, <symbol>/<YYYY-MM>.<generation>.ts
+# (int64 epoch seconds, ascending) and .close (float64), plus a manifest <symbol>/<YYYY-MM>.json
+# holding {"generation", "rows"}. The manifest is replaced last, in one os.replace: it is the
+# commit point, so readers see exactly `rows` rows of one generation and never a mix of columns.
+TS_DTYPE = np.dtype("<i8")
+CLOSE_DTYPE = np.dtype("<f8")
+MANIFEST_SUFFIX = ".json"
+
+
+def _symbol_dir(trading_symbol: str, root: Optional[str] = None) -> str:
+    if not trading_symbol or os.sep in trading_symbol or trading_symbol.startswith("."):
+        raise ValueError(f"Unsafe trading symbol for the candle store: {trading_symbol!r}")
+    return os.path.join(root or CANDLE_STORE_DIR, trading_symbol)
+
+
+def _partition_base(trading_symbol: str, month: str, root: Optional[str] = None) -> str:
+    return os.path.join(_symbol_dir(trading_symbol, root), month)
+
+
+def _column_paths(base: str, generation: int) -> Tuple[str, str]:
+    return f"{base}.{generation}.ts", f"{base}.{generation}.close"
+
+
+def _read_manifest(base: str) -> Optional[Dict[str, int]]:
+    """
+    The partition's committed {"generation", "rows"}, or None if it has none (or it is unreadable).
+    """
+    path = base + MANIFEST_SUFFIX
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        return {"generation": int(manifest["generation"]), "rows": int(manifest["rows"])}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable candle store manifest {path}: {e}")
+        return None
+
+
+def _write_manifest(base: str, generation: int, rows: int):
+    path = base + MANIFEST_SUFFIX
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"generation": generation, "rows": rows}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def list_months(trading_symbol: str, root: Optional[str] = None) -> List[str]:
+    """
+    The stored month partitions ("YYYY-MM") of a symbol, oldest first.
+    """
+    pattern = os.path.join(_symbol_dir(trading_symbol, root), "*" + MANIFEST_SUFFIX)
+    return sorted(os.path.basename(path)[:-len(MANIFEST_SUFFIX)] for path in glob.glob(pattern))
+
+
+def read_partition(trading_symbol: str, month: str, root: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Memory-maps one month of a symbol read-only: (int64 epoch seconds, float64 closes).
+    Nothing is copied until the arrays are touched.
+    """
+    base = _partition_base(trading_symbol, month, root)
+    for _ in range(2):
+        manifest = _read_manifest(base)
+        if not manifest or not manifest["rows"]:
+            break
+        ts_path, close_path = _column_paths(base, manifest["generation"])
+        n = manifest["rows"]
+        try:
+            return (np.memmap(ts_path, dtype=TS_DTYPE, mode="r", shape=(n,)),
+                    np.memmap(close_path, dtype=CLOSE_DTYPE, mode="r", shape=(n,)))
+        except FileNotFoundError:
+            # A rewrite committed a new generation (and removed this one) in between; re-read
+            continue
+    return np.empty(0, dtype=TS_DTYPE), np.empty(0, dtype=CLOSE_DTYPE)
+
+
+def iter_partitions(trading_symbol: str, root: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    Yields (month, timestamps, closes) memory maps for each stored month, oldest first.
+    """
+    for month in list_months(trading_symbol, root):
+        ts, closes = read_partition(trading_symbol, month, root)
+        if len(ts):
+            yield month, ts, closes
+
+
+def load_candles(trading_symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 root: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A symbol's stored candles in [start, end) as (datetime64[s] UTC timestamps, closes),
+    in the same shape as src.backtest.load_candle_series. Only the months that overlap
+    the range are read.
+    """
+    first = np.datetime64(int(start.timestamp()), "s").astype("datetime64[M]").astype(str) if start else None
+    last = np.datetime64(int(end.timestamp()), "s").astype("datetime64[M]").astype(str) if end else None
+
+    ts_parts, close_parts = [], []
+    for month, ts, closes in iter_partitions(trading_symbol, root):
+        if (first and month < first) or (last and month > last):
+            continue
+        ts_parts.append(ts)
+        close_parts.append(closes)
+
+    if not ts_parts:
+        return np.empty(0, dtype="datetime64[s]"), np.empty(0)
+
+    ts = np.concatenate(ts_parts)
+    closes = np.concatenate(close_parts)
+    lo = np.searchsorted(ts, int(start.timestamp())) if start else 0
+    hi = np.searchsorted(ts, int(end.timestamp())) if end else len(ts)
+    return ts[lo:hi].astype("datetime64[s]"), closes[lo:hi]
+
+
+def _remove_stale_columns(base: str, generation: int):
+    # Earlier generations, uncommitted leftovers and files from the old unversioned layout
+    keep = {base + MANIFEST_SUFFIX, *_column_paths(base, generation)}
+    for path in glob.glob(glob.escape(base) + ".*"):
+        if path not in keep and not path.endswith(".tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _write_partition(trading_symbol: str, month: str, ts: np.ndarray, closes: np.ndarray, root: Optional[str] = None):
+    """
+    Writes the month as a new generation of column files and commits it with the manifest;
+    until then readers keep seeing the previous generation.
+    """
+    base = _partition_base(trading_symbol, month, root)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    manifest = _read_manifest(base)
+    generation = manifest["generation"] + 1 if manifest else 1
+
+    for path, values, dtype in zip(_column_paths(base, generation), (ts, closes), (TS_DTYPE, CLOSE_DTYPE)):
+        with open(path, "wb") as f:
+            f.write(np.asarray(values, dtype=dtype).tobytes())
+            os.fsync(f.fileno())
+
+    _write_manifest(base, generation, len(ts))
+    _remove_stale_columns(base, generation)
+
+
+def _append_partition(trading_symbol: str, month: str, ts: np.ndarray, closes: np.ndarray, manifest: Dict[str, int],
+                      root: Optional[str] = None):
+    """
+    Appends rows to the committed generation's columns, then commits the new row count.
+    Bytes past the manifest's count (e.g. from a crashed append) are overwritten.
+    """
+    base = _partition_base(trading_symbol, month, root)
+    stored = manifest["rows"]
+    for path, values, dtype in zip(_column_paths(base, manifest["generation"]), (ts, closes), (TS_DTYPE, CLOSE_DTYPE)):
+        with open(path, "r+b") as f:
+            f.truncate(stored * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.asarray(values, dtype=dtype).tobytes())
+            os.fsync(f.fileno())
+
+    _write_manifest(base, manifest["generation"], stored + len(ts))
+
+
+def _fetch_month(cur, trading_symbol: str, month: str, after: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    cur.execute("""
+        SELECT EXTRACT(EPOCH FROM timestamp)::bigint, closed FROM historical_candles
+        WHERE trading_symbol = %s
+          AND timestamp >= (%s || '-01')::timestamp AT TIME ZONE 'UTC'
+          AND timestamp < ((%s || '-01')::timestamp + INTERVAL '1 month') AT TIME ZONE 'UTC'
+          AND (%s::bigint IS NULL OR timestamp > to_timestamp(%s))
+        ORDER BY timestamp
+    """, (trading_symbol, month, month, after, after))
+    rows = cur.fetchall()
+    if not rows:
+        return np.empty(0, dtype=TS_DTYPE), np.empty(0, dtype=CLOSE_DTYPE)
+    ts, closes = zip(*rows)
+    return np.asarray(ts, dtype=TS_DTYPE), np.asarray(closes, dtype=CLOSE_DTYPE)
+
+
+def sync_store(trading_symbols: Optional[Sequence[str]] = None, root: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """
+    Brings the store up to date with historical_candles (all symbols if None).
+
+    One grouped query returns each symbol's row count per month; months whose count
+    matches the stored partition are skipped. A month that only gained newer candles
+    gets them appended; any other difference (e.g. a backfilled gap) rewrites that month.
+    historical_candles rows are never updated in place, so counts identify changes.
+
+    Returns {"months", "appended", "rewritten", "candles"}, or None if the DB is unavailable.
+    """
+    summary = {"months": 0, "appended": 0, "rewritten": 0, "candles": 0}
+
+    with db_connection() as conn:
+        if not conn:
+            return None
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT trading_symbol,
+                           to_char(date_trunc('month', timestamp AT TIME ZONE 'UTC'), 'YYYY-MM') AS month,
+                           count(*)
+                    FROM historical_candles
+                    WHERE trading_symbol IS NOT NULL
+                      AND (%s::text[] IS NULL OR trading_symbol = ANY(%s))
+                    GROUP BY 1, 2
+                    ORDER BY 1, 2
+                """, (list(trading_symbols) if trading_symbols is not None else None,) * 2)
+                months = cur.fetchall()
+
+                for symbol, month, count in months:
+                    summary["months"] += 1
+                    manifest = _read_manifest(_partition_base(symbol, month, root))
+                    stored = manifest["rows"] if manifest else 0
+                    if stored == count:
+                        continue
+
+                    if 0 < stored < count:
+                        last = int(read_partition(symbol, month, root)[0][-1])
+                        ts, closes = _fetch_month(cur, symbol, month, after=last)
+                        if stored + len(ts) == count:
+                            _append_partition(symbol, month, ts, closes, manifest, root)
+                            summary["appended"] += 1
+                            summary["candles"] += len(ts)
+                            continue
+
+                    ts, closes = _fetch_month(cur, symbol, month)
+                    _write_partition(symbol, month, ts, closes, root)
+                    summary["rewritten"] += 1
+                    summary["candles"] += len(ts)
+
+        except Exception as e:
+            print(f"Candle store sync failed: {e}")
+            return None
+
+    print(f"Candle store synced: {summary}")
+    return summary
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -6,8 +7,79 @@ load_dotenv()
 
 KITE_API_KEY = os.getenv("KITE_API_KEY")
 KITE_AUTH_TOKEN = os.getenv("KITE_AUTH_TOKEN")
+# Kite REST endpoint; point it at a local stand-in (benchmarks/fake_kite.py) to run offline
+KITE_API_BASE_URL = os.getenv("KITE_API_BASE_URL", "https://api.kite.trade").rstrip("/")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_NAME = os.getenv("DB_NAME", "kite_history")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS")
 DB_PORT = os.getenv("DB_PORT", "5432")
+
+# Connection pool sizing and health checks
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+
+# Apply pending schema migrations lazily on first DB use. Set to "false" when
+# deployments run `python migrate_job.py` instead.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+# Incremental SMA maintenance: force a full 200-candle recompute after this many
+# incremental updates to shed accumulated floating-point drift.
+SMA_RECOMPUTE_EVERY = int(os.getenv("SMA_RECOMPUTE_EVERY", "48"))
+
+# "incremental" slides each symbol's stored window; "bulk" recomputes every symbol's
+# 200-candle window in one set-based statement per pipeline run.
+SMA_MODE = os.getenv("SMA_MODE", "incremental").lower()
+
+# Extra indicators computed after the SMA stage, e.g. "sma_50,ema_20,bbands_20"
+INDICATORS = [s.strip() for s in os.getenv("INDICATORS", "").split(",") if s.strip()]
+
+# Number of instruments whose candles are fetched concurrently
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+
+# Kite API request budgets (requests/second) and 429 retry policy
+KITE_HISTORICAL_RPS = float(os.getenv("KITE_HISTORICAL_RPS", "3"))
+KITE_INSTRUMENTS_RPS = float(os.getenv("KITE_INSTRUMENTS_RPS", "1"))
+KITE_MAX_RETRIES = int(os.getenv("KITE_MAX_RETRIES", "3"))
+KITE_BACKOFF_SECONDS = float(os.getenv("KITE_BACKOFF_SECONDS", "0.5"))
+
+# Kite HTTP client: timeouts (seconds) and transport-level retries for 5xx/connection resets
+KITE_CONNECT_TIMEOUT = float(os.getenv("KITE_CONNECT_TIMEOUT", "3.05"))
+KITE_READ_TIMEOUT = float(os.getenv("KITE_READ_TIMEOUT", "10"))
+KITE_HTTP_RETRIES = int(os.getenv("KITE_HTTP_RETRIES", "3"))
+
+# Historical backfill: concurrent chunk requests (throughput is still capped by KITE_HISTORICAL_RPS)
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "3"))
+
+# On-disk instrument master snapshots (one per trading date). Lambda can only write under /tmp.
+INSTRUMENT_CACHE_DIR = os.getenv("INSTRUMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "kite_instruments"))
+
+# Columnar candle store (per symbol, per month memory-mappable files) kept in sync by candle_store_job.py
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", "candle_store")
+
+# Live streaming mode (stream_job.py): Kite ticker endpoint, bar length, how long after
+# a bar's end it is closed without a newer tick, and the reconnect backoff ceiling (seconds)
+KITE_WS_URL = os.getenv("KITE_WS_URL", "wss://ws.kite.trade")
+STREAM_BAR_SECONDS = int(os.getenv("STREAM_BAR_SECONDS", "300"))
+STREAM_BAR_GRACE_SECONDS = float(os.getenv("STREAM_BAR_GRACE_SECONDS", "2"))
+STREAM_RECONNECT_MAX_SECONDS = float(os.getenv("STREAM_RECONNECT_MAX_SECONDS", "30"))
+
+# "staged" runs fetch, SMA and orders as three barriers over all instruments; "async"
+# streams each instrument through src/pipeline.py as soon as its data arrives.
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged").lower()
+# Async pipeline: workers per DB stage (fetch uses FETCH_WORKERS), bounded queue size
+# between stages, and the per-item timeout (seconds) in each stage
+PIPELINE_DB_WORKERS = int(os.getenv("PIPELINE_DB_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+PIPELINE_STAGE_TIMEOUT = float(os.getenv("PIPELINE_STAGE_TIMEOUT", "30"))
+
+# Instrumentation (src/metrics.py). Off by default: instrumented calls then skip all timing.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "KiteRunner")
+# Port for the Prometheus-style /metrics endpoint of long-running jobs (unset: no endpoint)
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+
+# Lambda warm state (target instruments, last stored candle per symbol, DB pool and
+# HTTP session) is reused by later invocations for this many seconds, then rebuilt
+LAMBDA_WARM_TTL_SECONDS = float(os.getenv("LAMBDA_WARM_TTL_SECONDS", "900"))
@@ -1,12 +1,220 @@
 import psycopg2
+import threading
+import time
+from contextlib import contextmanager
 from psycopg2.extras import execute_values
 from typing import List, Dict, Optional
-from src.config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
-from datetime import datetime
+from src.config import (
+    DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_HEALTHCHECK_SECONDS,
+    SMA_RECOMPUTE_EVERY
+)
+from src.instrument_cache import ist_today
+from src.metrics import timed, timer
+from src.schema import ensure_schema
+from datetime import date, datetime
+
+# Number of candles in the moving-average window (stored as sum_200/avg_200)
+SMA_WINDOW = 200
+
+
+class PoolExhaustedError(Exception):
+    """
+    Raised when no pooled connection becomes available within the timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections.
+
+    Idle connections stay open between calls, so a pipeline run (and every warm
+    Lambda invocation after the first) pays the TCP/TLS/auth handshake once per
+    connection instead of once per query. Connections that sat idle longer than
+    `healthcheck_seconds` are probed with `SELECT 1` before being handed out.
+    """
+
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 healthcheck_seconds: float = DB_POOL_HEALTHCHECK_SECONDS, **connect_kwargs):
+        self.minconn = max(minconn, 0)
+        self.maxconn = max(maxconn, self.minconn, 1)
+        self.healthcheck_seconds = healthcheck_seconds
+        self.connect_kwargs = connect_kwargs
+        self._idle = []  # (connection, monotonic time it was returned)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._connect(), time.monotonic()))
+            except Exception as e:
+                print(f"Failed to pre-open pooled connection: {e}")
+                break
+
+    def _connect(self):
+        with timer("db.connect"):
+            return psycopg2.connect(**self.connect_kwargs)
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @timed("db.acquire")
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Borrows a connection, opening a new one if the pool is below `maxconn`.
+        Blocks up to `timeout` seconds (forever if None) when the pool is exhausted.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolExhaustedError("Connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._in_use + len(self._idle) < self.maxconn:
+                    conn, idle_since = None, None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolExhaustedError(f"No connection available within {timeout}s (max {self.maxconn})")
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                self._close_quietly(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard: bool = False):
+        """
+        Returns a borrowed connection. Any open transaction is rolled back;
+        broken connections are closed instead of being kept.
+        """
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            if conn.closed:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager that borrows a connection and always returns it.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """
+        Closes every idle connection and refuses further borrows.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Process-wide pool. Module state survives between warm Lambda invocations,
+# so the pool (and its open connections) is reused by later runs.
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=DB_HOST,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    port=DB_PORT
+                )
+    return _pool
+
+
+def close_pool():
+    """
+    Closes the process-wide pool (e.g. at the end of a script or in tests).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrows a pooled connection for the duration of the block.
+    Yields None if no connection could be obtained, mirroring get_db_connection().
+    """
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Database connection failed: {e}")
+        yield None
+        return
+
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 
 def get_db_connection():
     """
-    Establishes a connection to the PostgreSQL database.
+    Establishes a dedicated (unpooled) connection to the PostgreSQL database.
+    The caller owns the connection and must close it; library code uses db_connection().
     """
     try:
         conn = psycopg2.connect(
@@ -21,431 +229,646 @@ def get_db_connection():
         print(f"Database connection failed: {e}")
         return None
 
-def create_table_if_not_exists(conn):
-    """
-    Creates the historical_candles table if it does not exist.
-    """
-    query = """
-    CREATE TABLE IF NOT EXISTS historical_candles (
-        id SERIAL PRIMARY KEY,
-        timestamp TIMESTAMP WITH TIME ZONE,
-        trading_symbol VARCHAR(50),
-        closed DOUBLE PRECISION,
-        instrument_token VARCHAR(50),
-        CONSTRAINT unique_candle UNIQUE (trading_symbol, timestamp)
-    );
-    """
-    with conn.cursor() as cur:
-        cur.execute(query)
-
-        # Check and add columns if they don't exist (simple migration)
-        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='historical_candles'")
-        columns = [row[0] for row in cur.fetchall()]
-
-        if 'instrument_token' not in columns:
-            cur.execute("ALTER TABLE historical_candles ADD COLUMN instrument_token VARCHAR(50)")
-        if 'trading_symbol' not in columns:
-            cur.execute("ALTER TABLE historical_candles ADD COLUMN trading_symbol VARCHAR(50)")
-
-    conn.commit()
-
-def save_historical_data(data: List[Dict]):
+@timed("db.save_candles", count_rows=True, none_is_error=True)
+def save_historical_data(data: List[Dict]) -> List[Dict]:
     """
     Saves the list of candle data to the database, skipping duplicates.
+    Returns the candles that were actually inserted (duplicates excluded),
+    or None if the save failed.
     """
     if not data:
-        return
+        return []
 
-    conn = get_db_connection()
-    if not conn:
-        return
+    with db_connection() as conn:
+        if not conn:
+            return None
 
-    try:
-        create_table_if_not_exists(conn)
+        try:
+            ensure_schema(conn)
 
-        # Prepare list of tuples for insertion
-        values = [(d['timestamp'], d['closed'], d['instrument_token'], d['trading_symbol']) for d in data]
+            # Prepare list of tuples for insertion
+            values = [(d['timestamp'], d['closed'], d['instrument_token'], d['trading_symbol']) for d in data]
 
-        query = """
-        INSERT INTO historical_candles (timestamp, closed, instrument_token, trading_symbol)
-        VALUES %s
-        ON CONFLICT (trading_symbol, timestamp) DO NOTHING;
-        """
+            query = """
+            INSERT INTO historical_candles (timestamp, closed, instrument_token, trading_symbol)
+            VALUES %s
+            ON CONFLICT (trading_symbol, timestamp) DO NOTHING
+            RETURNING timestamp, closed, instrument_token, trading_symbol;
+            """
 
-        with conn.cursor() as cur:
-            execute_values(cur, query, values)
+            with conn.cursor() as cur:
+                rows = execute_values(cur, query, values, fetch=True)
 
-        conn.commit()
-        print(f"Data saved to database. {len(values)} records processed (duplicates skipped).")
+            conn.commit()
 
-    except Exception as e:
-        print(f"Failed to save data: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+            inserted = [
+                {"timestamp": r[0], "closed": r[1], "instrument_token": r[2], "trading_symbol": r[3]}
+                for r in rows
+            ]
+            print(f"Data saved to database. {len(values)} records processed, {len(inserted)} new (duplicates skipped).")
+            return inserted
 
-def create_instruments_table_if_not_exists(conn):
-    """
-    Creates the instruments table if it does not exist.
+        except Exception as e:
+            print(f"Failed to save data: {e}")
+            conn.rollback()
+            return None
+
+def save_instruments(data: List[Dict], batch_size: int = 5000):
     """
-    query = """
-    CREATE TABLE IF NOT EXISTS instruments (
-        date DATE,
-        trading_symbol VARCHAR(255),
-        instrument_token VARCHAR(50),
-        name VARCHAR(255),
-        instrument_type VARCHAR(50),
-        exchange_token VARCHAR(50),
-        exchange VARCHAR(50),
-        PRIMARY KEY (date, trading_symbol)
-    );
+    Deprecated: use src.bulk_load.sync_instruments.
+
+    Saves the list of instruments as of their 'date' by delegating to the SCD sync
+    (COPY-based, so `batch_size` is ignored). Contracts missing from `data` are not
+    expired, matching the old insert-only behaviour.
     """
-    with conn.cursor() as cur:
-        cur.execute(query)
+    if not data:
+        return None
 
-        # Check and add instrument_type if not exists
-        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='instruments'")
-        columns = [row[0] for row in cur.fetchall()]
+    # Imported here: src.bulk_load imports this module
+    from src.bulk_load import sync_instruments
 
-        if 'instrument_type' not in columns:
-            cur.execute("ALTER TABLE instruments ADD COLUMN instrument_type VARCHAR(50)")
+    trading_date = data[0].get('date')
+    if isinstance(trading_date, str):
+        trading_date = date.fromisoformat(trading_date)
+    return sync_instruments(data, trading_date, expire=False)
 
-    conn.commit()
+def _to_datetime(value):
+    """
+    Normalises a candle timestamp (datetime or Kite ISO string) to a datetime.
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
 
-def save_instruments(data: List[Dict], batch_size: int = 5000):
+def _full_sma_window(cur, trading_symbol: str):
     """
-    Saves the list of instruments to the database in batches.
+    Recomputes the 200-candle window from scratch.
+    Returns (sum, count, window_start, window_end) or None if there are no candles.
     """
-    if not data:
-        return
+    cur.execute("""
+        SELECT closed, timestamp FROM historical_candles 
+        WHERE trading_symbol = %s 
+        ORDER BY timestamp DESC 
+        LIMIT 200
+    """, (trading_symbol,))
 
-    conn = get_db_connection()
-    if not conn:
-        return
+    rows = cur.fetchall()
+    if not rows:
+        return None
 
-    try:
-        create_instruments_table_if_not_exists(conn)
-
-        total_records = len(data)
-        print(f"Starting insertion of {total_records} records in batches of {batch_size}...")
-
-        with conn.cursor() as cur:
-            # Process in batches
-            for i in range(0, total_records, batch_size):
-                batch = data[i:i + batch_size]
-
-                # Prepare list of tuples for the current batch
-                values = [(
-                    d['date'],
-                    d['trading_symbol'],
-                    d['instrument_token'],
-                    d['name'],
-                    d['instrument_type'],
-                    d['exchange_token'],
-                    d['exchange']
-                ) for d in batch]
+    return sum(r[0] for r in rows), len(rows), rows[-1][1], rows[0][1]
 
-                query = """
-                INSERT INTO instruments (date, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange)
-                VALUES %s
-                ON CONFLICT (date, trading_symbol) DO NOTHING;
-                """
+def _incremental_sma_window(cur, trading_symbol: str, stats, new_candles: List[Dict]):
+    """
+    Slides the stored window forward using only the candles newer than window_end
+    and the ones that fall out at window_start.
+    Returns (sum, count, window_start, window_end), or None when a full recompute is needed.
+    """
+    current_sum, count, window_start, window_end = stats
+    if None in (current_sum, count, window_start, window_end):
+        return None
 
-                execute_values(cur, query, values)
-                conn.commit() # Commit after each batch to manage transaction size
+    # A newly inserted candle at or behind window_end landed inside (or before)
+    # the current window, so the stored sum no longer describes it.
+    if any(_to_datetime(c['timestamp']) <= window_end for c in new_candles):
+        return None
 
-                print(f"Processed batch {i // batch_size + 1}: {len(values)} records.")
+    # Read what actually entered the table, so duplicates skipped by
+    # ON CONFLICT DO NOTHING can never be counted twice.
+    cur.execute("""
+        SELECT closed, timestamp FROM historical_candles
+        WHERE trading_symbol = %s AND timestamp > %s
+        ORDER BY timestamp ASC
+        LIMIT %s
+    """, (trading_symbol, window_end, SMA_WINDOW + 1))
+    entering = cur.fetchall()
+
+    if not entering:
+        return current_sum, count, window_start, window_end
+    if len(entering) > SMA_WINDOW:
+        return None
 
-        print(f"All {total_records} instruments saved successfully.")
+    drop = max(0, count + len(entering) - SMA_WINDOW)
+    new_start = window_start
+    leaving_sum = 0.0
+
+    if drop:
+        # The oldest `drop` rows leave the window; the next one becomes window_start
+        cur.execute("""
+            SELECT closed, timestamp FROM historical_candles
+            WHERE trading_symbol = %s AND timestamp >= %s
+            ORDER BY timestamp ASC
+            LIMIT %s
+        """, (trading_symbol, window_start, drop + 1))
+        leaving = cur.fetchall()
+
+        if len(leaving) < drop + 1:
+            return None
 
-    except Exception as e:
-        print(f"Failed to save instruments: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        leaving_sum = sum(r[0] for r in leaving[:drop])
+        new_start = leaving[drop][1]
 
-def create_statistics_table_if_not_exists(conn):
-    """
-    Creates the instrument_statistics table if it does not exist.
-    """
-    query = """
-    CREATE TABLE IF NOT EXISTS instrument_statistics (
-        trading_symbol VARCHAR(255) PRIMARY KEY,
-        sum_200 DOUBLE PRECISION,
-        avg_200 DOUBLE PRECISION,
-        count INT
-    );
-    """
-    with conn.cursor() as cur:
-        cur.execute(query)
-    conn.commit()
+    new_sum = current_sum + sum(r[0] for r in entering) - leaving_sum
+    return new_sum, count + len(entering) - drop, new_start, entering[-1][1]
 
-def update_running_average(trading_symbol: str, new_candles: List[Dict]):
+@timed("sma.update", label_args=("trading_symbol",))
+def update_running_average(trading_symbol: str, new_candles: List[Dict], full_recompute: bool = False):
     """
     Updates the running 200-period average for a trading symbol directly using DB storage.
-    Simplified approach: Fetches the latest 200 candles and recalculates avg/sum.
-    """
-    conn = get_db_connection()
-    if not conn:
-        return
 
-    try:
-        create_statistics_table_if_not_exists(conn)
-
-        with conn.cursor() as cur:
-            # Fetch latest 200 candles
-            cur.execute("""
-                SELECT closed FROM historical_candles 
-                WHERE trading_symbol = %s 
-                ORDER BY timestamp DESC 
-                LIMIT 200
-            """, (trading_symbol,))
-
-            rows = cur.fetchall()
-            values = [r[0] for r in rows]
-
-            count = len(values)
-            if count == 0:
-                return
-
-            current_sum = sum(values)
-            avg = round(current_sum / count, 2)
-
-            # Upsert into instrument_statistics
-            cur.execute("""
-                INSERT INTO instrument_statistics (trading_symbol, sum_200, avg_200, count)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (trading_symbol) 
-                DO UPDATE SET 
-                    sum_200 = EXCLUDED.sum_200,
-                    avg_200 = EXCLUDED.avg_200,
-                    count = EXCLUDED.count;
-            """, (trading_symbol, current_sum, avg, count))
-
-            print(f"Updated stats for {trading_symbol}: SMA(200) = {avg:.2f} (Count: {count})")
-
-        conn.commit()
+    The stored sum_200/count are maintained incrementally, so a tick costs O(new candles)
+    rather than a 200-row scan. A full recompute of the latest 200 closes runs instead
+    when there are no stats yet, when `new_candles` (the rows actually inserted) contains
+    late candles, every SMA_RECOMPUTE_EVERY updates to correct float drift, or when
+    `full_recompute` is set.
+    """
+    with db_connection() as conn:
+        if not conn:
+            return
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT sum_200, count, window_start, window_end, updates_since_recompute
+                    FROM instrument_statistics
+                    WHERE trading_symbol = %s
+                    FOR UPDATE
+                """, (trading_symbol,))
+                stats = cur.fetchone()
+
+                window = None
+                updates = 0
+                if stats and not full_recompute and (stats[4] or 0) + 1 < SMA_RECOMPUTE_EVERY:
+                    window = _incremental_sma_window(cur, trading_symbol, stats[:4], new_candles)
+                    updates = (stats[4] or 0) + 1
+
+                if window is None:
+                    window = _full_sma_window(cur, trading_symbol)
+                    updates = 0
+                    if window is None:
+                        return
+
+                current_sum, count, window_start, window_end = window
+                avg = round(current_sum / count, 2)
+
+                # Upsert into instrument_statistics
+                cur.execute("""
+                    INSERT INTO instrument_statistics
+                        (trading_symbol, sum_200, avg_200, count, window_start, window_end, updates_since_recompute)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (trading_symbol) 
+                    DO UPDATE SET 
+                        sum_200 = EXCLUDED.sum_200,
+                        avg_200 = EXCLUDED.avg_200,
+                        count = EXCLUDED.count,
+                        window_start = EXCLUDED.window_start,
+                        window_end = EXCLUDED.window_end,
+                        updates_since_recompute = EXCLUDED.updates_since_recompute;
+                """, (trading_symbol, current_sum, avg, count, window_start, window_end, updates))
+
+                mode = "incremental" if updates else "full"
+                print(f"Updated stats for {trading_symbol}: SMA(200) = {avg:.2f} (Count: {count}, {mode})")
 
-    except Exception as e:
-        print(f"Failed to update running average for {trading_symbol}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+            conn.commit()
 
+        except Exception as e:
+            print(f"Failed to update running average for {trading_symbol}: {e}")
+            conn.rollback()
+
+
+@timed("sma.bulk_recompute", count_rows=True)
+def recompute_running_averages(trading_symbols: List[str]) -> Dict[str, tuple]:
+    """
+    Recomputes the 200-candle window of every given symbol server-side and upserts
+    instrument_statistics, all in one statement and one round-trip.
+
+    Returns {trading_symbol: (latest_close, avg_200)} (the shape of
+    get_latest_stats_and_close_bulk) so the order stage need not re-read them.
+    Symbols without candles are omitted.
+    """
+    if not trading_symbols:
+        return {}
+
+    with db_connection() as conn:
+        if not conn:
+            return {}
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                # LATERAL ... LIMIT 200 reads exactly the window per symbol off the
+                # (trading_symbol, timestamp) index; ROW_NUMBER() OVER (PARTITION BY ...)
+                # would number every stored candle before discarding all but 200.
+                cur.execute("""
+                    WITH windows AS (
+                        SELECT s.trading_symbol,
+                               SUM(w.closed) AS sum_200,
+                               COUNT(*) AS count,
+                               MIN(w.timestamp) AS window_start,
+                               MAX(w.timestamp) AS window_end,
+                               (ARRAY_AGG(w.closed ORDER BY w.timestamp DESC))[1] AS latest_close
+                        FROM unnest(%s::text[]) AS s(trading_symbol)
+                        CROSS JOIN LATERAL (
+                            SELECT closed, timestamp FROM historical_candles h
+                            WHERE h.trading_symbol = s.trading_symbol
+                            ORDER BY h.timestamp DESC
+                            LIMIT %s
+                        ) w
+                        GROUP BY s.trading_symbol
+                    ),
+                    upserted AS (
+                        INSERT INTO instrument_statistics
+                            (trading_symbol, sum_200, avg_200, count, window_start, window_end, updates_since_recompute)
+                        SELECT trading_symbol, sum_200, ROUND((sum_200 / count)::numeric, 2)::double precision,
+                               count, window_start, window_end, 0
+                        FROM windows
+                        ON CONFLICT (trading_symbol)
+                        DO UPDATE SET
+                            sum_200 = EXCLUDED.sum_200,
+                            avg_200 = EXCLUDED.avg_200,
+                            count = EXCLUDED.count,
+                            window_start = EXCLUDED.window_start,
+                            window_end = EXCLUDED.window_end,
+                            updates_since_recompute = EXCLUDED.updates_since_recompute
+                        RETURNING trading_symbol, avg_200
+                    )
+                    SELECT u.trading_symbol, w.latest_close, u.avg_200
+                    FROM upserted u
+                    JOIN windows w ON w.trading_symbol = u.trading_symbol
+                """, (list(trading_symbols), SMA_WINDOW))
+                results = {symbol: (latest_close, avg_200) for symbol, latest_close, avg_200 in cur.fetchall()}
 
+            conn.commit()
+            print(f"Recomputed stats for {len(results)}/{len(trading_symbols)} symbols in one statement.")
+            return results
+
+        except Exception as e:
+            print(f"Failed to recompute running averages: {e}")
+            conn.rollback()
+            return {}
+
+
+@timed("db.latest_stats", label_args=("trading_symbol",))
 def get_latest_stats_and_close(trading_symbol: str):
     """
     Retrieves the latest 200 SMA stats and the most recent candle close price.
     Returns a tuple (latest_close, avg_200) or None if data is missing.
     """
-    conn = get_db_connection()
-    if not conn:
-        return None
-
-    try:
-        with conn.cursor() as cur:
-            # 1. Fetch avg_200
-            cur.execute("SELECT avg_200 FROM instrument_statistics WHERE trading_symbol = %s", (trading_symbol,))
-            stats_row = cur.fetchone()
-
-            if not stats_row:
-                return None
-
-            avg_200 = stats_row[0]
-
-            # 2. Fetch latest close
-            cur.execute("""
-                SELECT closed FROM historical_candles 
-                WHERE trading_symbol = %s 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (trading_symbol,))
-            price_row = cur.fetchone()
+    with db_connection() as conn:
+        if not conn:
+            return None
 
-            if not price_row:
-                return None
+        try:
+            with conn.cursor() as cur:
+                # 1. Fetch avg_200
+                cur.execute("SELECT avg_200 FROM instrument_statistics WHERE trading_symbol = %s", (trading_symbol,))
+                stats_row = cur.fetchone()
 
-            latest_close = price_row[0]
+                if not stats_row:
+                    return None
 
-            return latest_close, avg_200
+                avg_200 = stats_row[0]
 
-    except Exception as e:
-        print(f"Failed to get latest stats for {trading_symbol}: {e}")
-        return None
-    finally:
-        conn.close()
+                # 2. Fetch latest close
+                cur.execute("""
+                    SELECT closed FROM historical_candles 
+                    WHERE trading_symbol = %s 
+                    ORDER BY timestamp DESC 
+                    LIMIT 1
+                """, (trading_symbol,))
+                price_row = cur.fetchone()
 
-def create_orders_table_if_not_exists(conn):
-    """
-    Creates the orders table if it does not exist.
-    """
-    query = """
-    CREATE TABLE IF NOT EXISTS orders (
-        id SERIAL PRIMARY KEY,
-        order_type VARCHAR(10),
-        trading_symbol VARCHAR(255),
-        price DOUBLE PRECISION,
-        status VARCHAR(20),
-        created_at TIMESTAMP
-    );
-    """
-    with conn.cursor() as cur:
-        cur.execute(query)
+                if not price_row:
+                    return None
 
-        # Check and add columns if they don't exist
-        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='orders'")
-        columns = [row[0] for row in cur.fetchall()]
+                latest_close = price_row[0]
 
-        if 'close' not in columns:
-            cur.execute("ALTER TABLE orders ADD COLUMN close DOUBLE PRECISION")
-        if 'avg_200' not in columns:
-            cur.execute("ALTER TABLE orders ADD COLUMN avg_200 DOUBLE PRECISION")
+                return latest_close, avg_200
 
-    conn.commit()
+        except Exception as e:
+            print(f"Failed to get latest stats for {trading_symbol}: {e}")
+            return None
 
+@timed("db.latest_stats_bulk", count_rows=True)
+def get_latest_stats_and_close_bulk(trading_symbols: List[str]) -> Dict[str, tuple]:
+    """
+    Batched get_latest_stats_and_close: returns {trading_symbol: (latest_close, avg_200)}
+    for all given symbols in one round-trip. Symbols without stats or candles are omitted.
+    """
+    if not trading_symbols:
+        return {}
+
+    with db_connection() as conn:
+        if not conn:
+            return {}
+
+        try:
+            with conn.cursor() as cur:
+                # The LATERAL probe walks the unique (trading_symbol, timestamp) index
+                # backwards, so each latest close is a single index lookup.
+                cur.execute("""
+                    SELECT s.trading_symbol, c.closed, s.avg_200
+                    FROM instrument_statistics s
+                    CROSS JOIN LATERAL (
+                        SELECT closed FROM historical_candles h
+                        WHERE h.trading_symbol = s.trading_symbol
+                        ORDER BY h.timestamp DESC
+                        LIMIT 1
+                    ) c
+                    WHERE s.trading_symbol = ANY(%s)
+                """, (list(trading_symbols),))
+
+                return {symbol: (latest_close, avg_200) for symbol, latest_close, avg_200 in cur.fetchall()}
+
+        except Exception as e:
+            print(f"Failed to get latest stats for {len(trading_symbols)} symbols: {e}")
+            return {}
+
+def get_recent_closes_bulk(trading_symbols: List[str], limit: int = SMA_WINDOW) -> Dict[str, tuple]:
+    """
+    Returns {trading_symbol: (closes oldest first, latest timestamp)} with up to `limit`
+    most recent closes per symbol, in one round-trip. Symbols without candles are omitted.
+    """
+    if not trading_symbols:
+        return {}
+
+    with db_connection() as conn:
+        if not conn:
+            return {}
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT s.trading_symbol, c.closed, c.timestamp
+                    FROM unnest(%s::text[]) AS s(trading_symbol)
+                    CROSS JOIN LATERAL (
+                        SELECT closed, timestamp FROM historical_candles h
+                        WHERE h.trading_symbol = s.trading_symbol
+                        ORDER BY h.timestamp DESC
+                        LIMIT %s
+                    ) c
+                    ORDER BY s.trading_symbol, c.timestamp
+                """, (list(trading_symbols), limit))
+
+                recent = {}
+                for symbol, closed, timestamp in cur.fetchall():
+                    closes, _ = recent.get(symbol, ([], None))
+                    closes.append(closed)
+                    recent[symbol] = (closes, timestamp)
+                return recent
+
+        except Exception as e:
+            print(f"Failed to get recent closes for {len(trading_symbols)} symbols: {e}")
+            return {}
+
+@timed("orders.write", label_args=("trading_symbol",), none_is_error=True, labels={"op": "create"})
 def create_order(order_type: str, trading_symbol: str, price: float, close: float = None, avg_200: float = None, status: str = "created"):
     """
     Creates a new order in the database.
     """
-    conn = get_db_connection()
-    if not conn:
-        return None
+    with db_connection() as conn:
+        if not conn:
+            return None
 
-    try:
-        create_orders_table_if_not_exists(conn)
+        try:
+            ensure_schema(conn)
 
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO orders (order_type, trading_symbol, price, close, avg_200, status, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id;
-            """, (order_type, trading_symbol, price, close, avg_200, status, datetime.now()))
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO orders (order_type, trading_symbol, price, close, avg_200, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id;
+                """, (order_type, trading_symbol, price, close, avg_200, status, datetime.now()))
 
-            order_id = cur.fetchone()[0]
-            conn.commit()
-            print(f"Created {order_type} order for {trading_symbol} at {price}. ID: {order_id}")
-            return order_id
+                order_id = cur.fetchone()[0]
+                conn.commit()
+                print(f"Created {order_type} order for {trading_symbol} at {price}. ID: {order_id}")
+                return order_id
 
-    except Exception as e:
-        print(f"Failed to create order for {trading_symbol}: {e}")
-        conn.rollback()
-        return None
-    finally:
-        conn.close()
+        except Exception as e:
+            print(f"Failed to create order for {trading_symbol}: {e}")
+            conn.rollback()
+            return None
 
+@timed("db.open_order", label_args=("trading_symbol",))
 def get_open_sell_order(trading_symbol: str):
     """
     Returns the open SELL order for the given symbol if it exists.
     """
-    conn = get_db_connection()
-    if not conn:
-        return None
-
-    try:
-        # Check if table exists first to avoid errors on fresh start
-        create_orders_table_if_not_exists(conn)
-
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, order_type, trading_symbol, price, status, created_at 
-                FROM orders 
-                WHERE trading_symbol = %s AND order_type = 'SELL' AND status = 'created'
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (trading_symbol,))
-
-            row = cur.fetchone()
-            if row:
-                return {
-                    "id": row[0],
-                    "order_type": row[1],
-                    "trading_symbol": row[2],
-                    "price": row[3],
-                    "status": row[4],
-                    "created_at": row[5]
-                }
+    with db_connection() as conn:
+        if not conn:
             return None
 
-    except Exception as e:
-        print(f"Failed to get open order for {trading_symbol}: {e}")
-        return None
-    finally:
-        conn.close()
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, order_type, trading_symbol, price, status, created_at 
+                    FROM orders 
+                    WHERE trading_symbol = %s AND order_type = 'SELL' AND status = 'created'
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (trading_symbol,))
+
+                row = cur.fetchone()
+                if row:
+                    return {
+                        "id": row[0],
+                        "order_type": row[1],
+                        "trading_symbol": row[2],
+                        "price": row[3],
+                        "status": row[4],
+                        "created_at": row[5]
+                    }
+                return None
+
+        except Exception as e:
+            print(f"Failed to get open order for {trading_symbol}: {e}")
+            return None
 
 def close_order(order_id: int):
     """
     Marks an order as completed.
     """
-    conn = get_db_connection()
-    if not conn:
-        return
+    with db_connection() as conn:
+        if not conn:
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE orders SET status = 'completed' WHERE id = %s", (order_id,))
+                conn.commit()
+                print(f"Closed order ID: {order_id}")
+
+        except Exception as e:
+            print(f"Failed to close order {order_id}: {e}")
+            conn.rollback()
+
+@timed("orders.write", label_args=("trading_symbol",), none_is_error=True, labels={"op": "reverse"})
+def reverse_position(sell_order_id: int, trading_symbol: str, price: float, close: float = None,
+                     avg_200: float = None, new_entry_type: str = None) -> Optional[Dict]:
+    """
+    Closes an open SELL order, records the completed BUY that covers it and, if
+    `new_entry_type` is given, opens a new order of that type, all in one statement
+    (one round-trip, one commit). The inserts are conditional on the close, so a
+    SELL already closed elsewhere produces no orders.
+
+    Returns {"closed_id", "buy_id", "entry_id"}, or None if nothing was reversed.
+    """
+    with db_connection() as conn:
+        if not conn:
+            return None
+
+        try:
+            ensure_schema(conn)
+            now = datetime.now()
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH closed AS (
+                        UPDATE orders SET status = 'completed'
+                        WHERE id = %s AND status = 'created'
+                        RETURNING id
+                    ),
+                    covered AS (
+                        INSERT INTO orders (order_type, trading_symbol, price, close, avg_200, status, created_at)
+                        SELECT 'BUY', %s, %s, %s, %s, 'completed', %s FROM closed
+                        RETURNING id
+                    ),
+                    entry AS (
+                        INSERT INTO orders (order_type, trading_symbol, price, close, avg_200, status, created_at)
+                        SELECT %s, %s, %s, %s, %s, 'created', %s FROM closed
+                        WHERE %s::text IS NOT NULL
+                        RETURNING id
+                    )
+                    SELECT (SELECT id FROM closed), (SELECT id FROM covered), (SELECT id FROM entry);
+                """, (
+                    sell_order_id,
+                    trading_symbol, price, close, avg_200, now,
+                    new_entry_type, trading_symbol, price, close, avg_200, now,
+                    new_entry_type
+                ))
+                closed_id, buy_id, entry_id = cur.fetchone()
 
-    try:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE orders SET status = 'completed' WHERE id = %s", (order_id,))
             conn.commit()
-            print(f"Closed order ID: {order_id}")
 
-    except Exception as e:
-        print(f"Failed to close order {order_id}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+            if closed_id is None:
+                print(f"Order ID {sell_order_id} for {trading_symbol} is no longer open; nothing reversed.")
+                return None
+
+            print(f"Reversed {trading_symbol}: closed order ID {closed_id} with BUY at {price}. ID: {buy_id}")
+            return {"closed_id": closed_id, "buy_id": buy_id, "entry_id": entry_id}
 
-def get_instruments_by_pattern(pattern: str, date_str: str = None) -> List[Dict]:
+        except Exception as e:
+            print(f"Failed to reverse position for {trading_symbol}: {e}")
+            conn.rollback()
+            return None
+
+# Pattern lookups for the current trading day, keyed by (pattern, as-of date or None)
+_instrument_lookup_cache: Dict[tuple, List[Dict]] = {}
+_instrument_lookup_day: Optional[str] = None
+_instrument_lookup_lock = threading.Lock()
+
+
+def clear_instrument_cache():
+    """
+    Drops cached get_instruments_by_pattern results (called after an instrument sync).
     """
-    Fetches instruments matching a trading symbol pattern for a specific date.
+    global _instrument_lookup_day
+    with _instrument_lookup_lock:
+        _instrument_lookup_cache.clear()
+        _instrument_lookup_day = None
+
+
+@timed("db.instruments_lookup", count_rows=True)
+def get_instruments_by_pattern(pattern: str, date_str: str = None, use_cache: bool = True) -> List[Dict]:
+    """
+    Fetches instruments matching a trading symbol pattern, one per instrument_token.
     
     Args:
         pattern: SQL LIKE pattern (e.g. 'NIFTY26%')
-        date_str: Date string (YYYY-MM-DD). Defaults to current date if None.
+        date_str: Date string (YYYY-MM-DD) to get the instruments as listed on that day.
+            Defaults to the latest snapshot (the instruments_current view) if None.
+        use_cache: Serve repeated lookups from an in-process cache that lives for the
+            current trading day. Empty results are never cached.
         
     Returns:
-        List of dictionaries containing instrument details.
-    """
-    from datetime import date # Import locally to avoid circular deps or just top level if preferred
-
-    if date_str is None:
-        date_str = date.today().isoformat()
-
-    conn = get_db_connection()
-    if not conn:
-        return []
-
-    try:
-        query = """
-        SELECT date, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange
-        FROM instruments
-        WHERE trading_symbol LIKE %s;
-        """
-
-        with conn.cursor() as cur:
-            cur.execute(query, (pattern,))
-            rows = cur.fetchall()
-
-            instruments = []
-            for row in rows:
-                instruments.append({
-                    "date": row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
-                    "trading_symbol": row[1],
-                    "instrument_token": row[2],
-                    "name": row[3],
-                    "instrument_type": row[4],
-                    "exchange_token": row[5],
-                    "exchange": row[6]
-                })
+        List of dictionaries containing instrument details. Each record's 'date'
+        is the day its version became valid.
+    """
+    global _instrument_lookup_day
+    key = (pattern, date_str)
+
+    if use_cache:
+        today = ist_today().isoformat()
+        with _instrument_lookup_lock:
+            if _instrument_lookup_day != today:
+                _instrument_lookup_cache.clear()
+                _instrument_lookup_day = today
+            cached = _instrument_lookup_cache.get(key)
+        if cached is not None:
+            return [dict(instrument) for instrument in cached]
+
+    with db_connection() as conn:
+        if not conn:
+            return []
+
+        try:
+            ensure_schema(conn)
+
+            # Anchored patterns become range scans on the trading_symbol text_pattern_ops indexes
+            if date_str is None:
+                query = """
+                SELECT valid_from, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange
+                FROM instruments_current
+                WHERE trading_symbol LIKE %s
+                ORDER BY trading_symbol;
+                """
+                params = (pattern,)
+            else:
+                query = """
+                SELECT DISTINCT ON (instrument_token)
+                       valid_from, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange
+                FROM instruments_scd
+                WHERE trading_symbol LIKE %s
+                  AND valid_from <= %s AND (valid_to IS NULL OR valid_to > %s)
+                ORDER BY instrument_token, valid_from DESC;
+                """
+                params = (pattern, date_str, date_str)
+
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                rows = cur.fetchall()
+
+                instruments = []
+                for row in rows:
+                    instruments.append({
+                        "date": row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
+                        "trading_symbol": row[1],
+                        "instrument_token": row[2],
+                        "name": row[3],
+                        "instrument_type": row[4],
+                        "exchange_token": row[5],
+                        "exchange": row[6]
+                    })
+
+            if use_cache and instruments:
+                with _instrument_lookup_lock:
+                    _instrument_lookup_cache[key] = [dict(instrument) for instrument in instruments]
 
             return instruments
 
-    except Exception as e:
-        print(f"Failed to fetch instruments by pattern: {e}")
-        return []
-    finally:
-        conn.close()
+        except Exception as e:
+            print(f"Failed to fetch instruments by pattern: {e}")
+            return []
 
 def check_instruments_exist(date_str: str = None) -> bool:
     """
-    Checks if instruments data exists for the given date.
+    Checks if the current instrument set was already in place on the given date.
     
     Args:
         date_str: Date string (YYYY-MM-DD). Defaults to current date if None.
@@ -453,25 +876,23 @@ def check_instruments_exist(date_str: str = None) -> bool:
     Returns:
         True if data exists, False otherwise.
     """
-    from datetime import date
-
     if date_str is None:
-        date_str = date.today().isoformat()
+        date_str = ist_today().isoformat()
 
-    conn = get_db_connection()
-    if not conn:
-        return False
+    with db_connection() as conn:
+        if not conn:
+            return False
 
-    try:
-        query = "SELECT 1 FROM instruments WHERE date = %s LIMIT 1;"
+        try:
+            ensure_schema(conn)
 
-        with conn.cursor() as cur:
-            cur.execute(query, (date_str,))
-            result = cur.fetchone()
-            return result is not None
+            query = "SELECT 1 FROM instruments_current WHERE valid_from <= %s LIMIT 1;"
 
-    except Exception as e:
-        print(f"Failed to check instruments existence: {e}")
-        return False
-    finally:
-        conn.close()
+            with conn.cursor() as cur:
+                cur.execute(query, (date_str,))
+                result = cur.fetchone()
+                return result is not None
+
+        except Exception as e:
+            print(f"Failed to check instruments existence: {e}")
+            return False
@@ -0,0 +1,153 @@
+import numpy as np
+from psycopg2.extras import execute_values
+from typing import Callable, Dict, List, Optional, Tuple
+from src.config import INDICATORS
+from src.database import db_connection, get_recent_closes_bulk
+from src.schema import ensure_schema
+
+# kind -> {"func", "lookback", "requires_volume"}
+_REGISTRY: Dict[str, Dict] = {}
+
+
+def register_indicator(kind: str, lookback: Callable[[int], int] = lambda period: period,
+                       requires_volume: bool = False):
+    """
+    Registers an indicator function under `kind` (used as the spec prefix, e.g. "sma_200").
+
+    The function receives the closes as a 1-D NumPy array (oldest first), the period
+    and the matching volumes (or None), and returns a dict of {output_suffix: value}.
+    `lookback` maps the period to the number of candles the indicator needs.
+    """
+    def decorator(func):
+        _REGISTRY[kind] = {"func": func, "lookback": lookback, "requires_volume": requires_volume}
+        return func
+    return decorator
+
+
+def parse_indicator_spec(spec: str) -> Tuple[str, int]:
+    """
+    Splits a spec such as "ema_50" into ("ema", 50).
+    """
+    kind, _, period = spec.rpartition("_")
+    if kind not in _REGISTRY or not period.isdigit() or int(period) <= 0:
+        raise ValueError(f"Unknown indicator spec '{spec}'. Registered kinds: {sorted(_REGISTRY)}")
+    return kind, int(period)
+
+
+@register_indicator("sma")
+def _sma(closes: np.ndarray, period: int, volumes=None) -> Dict[str, float]:
+    return {"": float(closes[-period:].mean())}
+
+
+@register_indicator("ema", lookback=lambda period: 3 * period)
+def _ema(closes: np.ndarray, period: int, volumes=None) -> Dict[str, float]:
+    # Seeded with the SMA of the first `period` closes, then unrolled:
+    # ema_m = (1-a)^m * seed + a * sum((1-a)^(m-j) * x_j)
+    alpha = 2.0 / (period + 1)
+    seed = closes[:period].mean()
+    tail = closes[period:]
+    decay = (1.0 - alpha) ** np.arange(len(tail) - 1, -1, -1)
+    return {"": float((1.0 - alpha) ** len(tail) * seed + alpha * np.dot(decay, tail))}
+
+
+@register_indicator("std")
+def _std(closes: np.ndarray, period: int, volumes=None) -> Dict[str, float]:
+    return {"": float(closes[-period:].std())}
+
+
+@register_indicator("bbands")
+def _bollinger(closes: np.ndarray, period: int, volumes=None) -> Dict[str, float]:
+    window = closes[-period:]
+    middle = window.mean()
+    band = 2.0 * window.std()
+    return {"_upper": float(middle + band), "_middle": float(middle), "_lower": float(middle - band)}
+
+
+@register_indicator("vwap", requires_volume=True)
+def _vwap(closes: np.ndarray, period: int, volumes=None) -> Dict[str, float]:
+    window_volume = volumes[-period:]
+    total = window_volume.sum()
+    if total <= 0:
+        return {}
+    return {"": float(np.dot(closes[-period:], window_volume) / total)}
+
+
+def required_lookback(specs: List[str]) -> int:
+    """
+    Number of latest candles needed to evaluate every spec.
+    """
+    lookbacks = [_REGISTRY[kind]["lookback"](period) for kind, period in map(parse_indicator_spec, specs)]
+    return max(lookbacks, default=0)
+
+
+def compute_indicators(closes: np.ndarray, specs: List[str], volumes: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """
+    Evaluates every spec over one array of closes (oldest first).
+    Specs without enough candles, or needing volume when none is available, are skipped.
+    """
+    results = {}
+    for spec in specs:
+        kind, period = parse_indicator_spec(spec)
+        entry = _REGISTRY[kind]
+
+        if len(closes) < period:
+            continue
+        if entry["requires_volume"] and volumes is None:
+            continue
+
+        for suffix, value in entry["func"](closes, period, volumes).items():
+            results[f"{spec}{suffix}"] = value
+
+    return results
+
+
+def update_indicators(trading_symbols: List[str], specs: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Computes the configured indicators for all symbols and upserts them into
+    instrument_indicators. Candles are read once for all symbols (enough for the
+    longest lookback), so adding an indicator costs no extra table scan.
+    historical_candles stores no volume yet, so volume-based kinds are skipped.
+    """
+    specs = INDICATORS if specs is None else specs
+    if not trading_symbols or not specs:
+        return {}
+
+    # Enough closes for the longest lookback, for every symbol in one round-trip
+    series = get_recent_closes_bulk(trading_symbols, required_lookback(specs))
+    if not series:
+        return {}
+
+    with db_connection() as conn:
+        if not conn:
+            return {}
+
+        try:
+            ensure_schema(conn)
+
+            with conn.cursor() as cur:
+                results = {}
+                rows = []
+                for symbol, (closes, as_of) in series.items():
+                    values = compute_indicators(np.asarray(closes, dtype=np.float64), specs)
+                    results[symbol] = values
+                    rows.extend((symbol, name, value, as_of) for name, value in values.items())
+
+                if rows:
+                    execute_values(cur, """
+                        INSERT INTO instrument_indicators (trading_symbol, indicator, value, as_of)
+                        VALUES %s
+                        ON CONFLICT (trading_symbol, indicator)
+                        DO UPDATE SET
+                            value = EXCLUDED.value,
+                            as_of = EXCLUDED.as_of,
+                            updated_at = now();
+                    """, rows)
+
+            conn.commit()
+            print(f"Updated {len(rows)} indicator values for {len(results)} instruments.")
+            return results
+
+        except Exception as e:
+            print(f"Failed to update indicators: {e}")
+            conn.rollback()
+            return {}
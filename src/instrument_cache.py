@@ -0,0 +1,163 @@
+import glob
+import json
+import os
+import re
+import zlib
+from bisect import bisect_left
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+from zoneinfo import ZoneInfo
+from src.config import INSTRUMENT_CACHE_DIR
+
+SNAPSHOT_MAGIC = b"KIS1"
+SNAPSHOT_FIELDS = ("trading_symbol", "instrument_token", "name", "instrument_type", "exchange_token", "exchange")
+SNAPSHOTS_KEPT = 2
+IST = ZoneInfo("Asia/Kolkata")
+
+
+def ist_today() -> date:
+    """
+    The current trading date in IST. Lambda's clock (and date.today()) is UTC, which
+    is still the previous day until 05:30 IST.
+    """
+    return datetime.now(IST).date()
+
+
+def like_to_regex(pattern: str):
+    """
+    Compiles a SQL LIKE pattern (% and _ wildcards) into an anchored regex.
+    """
+    parts = [".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern]
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+class InstrumentSnapshot:
+    """
+    The instrument master for one trading date, held as rows sorted by trading symbol.
+    The sorted symbol column doubles as the lookup index: a LIKE pattern's literal
+    prefix is bisected to a contiguous slice before the wildcard part is matched.
+    """
+
+    def __init__(self, trading_date: date, rows: List[list], etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.trading_date = trading_date
+        self.rows = rows
+        self.symbols = [row[0] for row in rows]
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_records(cls, trading_date: date, records: Iterator[Dict], etag: Optional[str] = None, last_modified: Optional[str] = None) -> "InstrumentSnapshot":
+        rows = sorted(([record.get(field) for field in SNAPSHOT_FIELDS] for record in records), key=lambda row: row[0])
+        return cls(trading_date, rows, etag, last_modified)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def restamped(self, trading_date: date) -> "InstrumentSnapshot":
+        """
+        The same rows and validators, valid for another trading date (after a 304).
+        """
+        return InstrumentSnapshot(trading_date, self.rows, self.etag, self.last_modified)
+
+    def _record(self, row: list) -> Dict:
+        record = dict(zip(SNAPSHOT_FIELDS, row))
+        record["date"] = self.trading_date.isoformat()
+        return record
+
+    def records(self) -> Iterator[Dict]:
+        """
+        Yields the rows as instrument dicts one at a time, so a consumer such as the
+        COPY-based sync never holds more than the snapshot's compact rows.
+        """
+        for row in self.rows:
+            yield self._record(row)
+
+    def lookup(self, pattern: str) -> List[Dict]:
+        """
+        Returns the instruments whose trading symbol matches the SQL LIKE `pattern`.
+        """
+        prefix = re.split(r"[%_]", pattern, maxsplit=1)[0]
+        match = like_to_regex(pattern).match
+
+        results = []
+        for i in range(bisect_left(self.symbols, prefix), len(self.symbols)):
+            symbol = self.symbols[i]
+            if not symbol.startswith(prefix):
+                break
+            if match(symbol):
+                results.append(self._record(self.rows[i]))
+        return results
+
+    def to_bytes(self) -> bytes:
+        payload = {
+            "trading_date": self.trading_date.isoformat(),
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fields": SNAPSHOT_FIELDS,
+            "rows": self.rows,
+        }
+        return SNAPSHOT_MAGIC + zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "InstrumentSnapshot":
+        if not blob.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("Not an instrument snapshot")
+        payload = json.loads(zlib.decompress(blob[len(SNAPSHOT_MAGIC):]).decode("utf-8"))
+        if tuple(payload["fields"]) != SNAPSHOT_FIELDS:
+            raise ValueError("Snapshot was written with a different field layout")
+        return cls(date.fromisoformat(payload["trading_date"]), payload["rows"], payload.get("etag"), payload.get("last_modified"))
+
+
+def snapshot_path(trading_date: date) -> str:
+    return os.path.join(INSTRUMENT_CACHE_DIR, f"instruments-{trading_date.isoformat()}.bin")
+
+
+def _read_snapshot(path: str) -> Optional[InstrumentSnapshot]:
+    try:
+        with open(path, "rb") as f:
+            return InstrumentSnapshot.from_bytes(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, zlib.error) as e:
+        print(f"Ignoring unreadable instrument snapshot {path}: {e}")
+        return None
+
+
+def load_snapshot(trading_date: Optional[date] = None) -> Optional[InstrumentSnapshot]:
+    """
+    Returns the snapshot for `trading_date` (default today in IST) if one is on disk.
+    """
+    return _read_snapshot(snapshot_path(trading_date or ist_today()))
+
+
+def load_latest_snapshot() -> Optional[InstrumentSnapshot]:
+    """
+    Returns the most recent snapshot on disk, whatever its date.
+    """
+    for path in sorted(glob.glob(os.path.join(INSTRUMENT_CACHE_DIR, "instruments-*.bin")), reverse=True):
+        snapshot = _read_snapshot(path)
+        if snapshot is not None:
+            return snapshot
+    return None
+
+
+def save_snapshot(snapshot: InstrumentSnapshot) -> bool:
+    """
+    Atomically writes the snapshot and prunes all but the newest SNAPSHOTS_KEPT files.
+    Returns False (and leaves the cache as it was) if the directory is not writable.
+    """
+    path = snapshot_path(snapshot.trading_date)
+    try:
+        os.makedirs(INSTRUMENT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(snapshot.to_bytes())
+        os.replace(tmp_path, path)
+
+        for old in sorted(glob.glob(os.path.join(INSTRUMENT_CACHE_DIR, "instruments-*.bin")), reverse=True)[SNAPSHOTS_KEPT:]:
+            os.remove(old)
+        return True
+
+    except OSError as e:
+        print(f"Failed to write instrument snapshot {path}: {e}")
+        return False
@@ -1,25 +1,130 @@
 import requests
 import csv
 import io
-from datetime import date
-from typing import List, Dict
-from src.config import KITE_AUTH_TOKEN, KITE_API_KEY
+import threading
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib3.util.retry import Retry
+from src.config import (
+    KITE_AUTH_TOKEN, KITE_API_KEY, KITE_API_BASE_URL, KITE_MAX_RETRIES, KITE_BACKOFF_SECONDS,
+    KITE_CONNECT_TIMEOUT, KITE_READ_TIMEOUT, KITE_HTTP_RETRIES, FETCH_WORKERS
+)
+from src.metrics import timed
+from src.instrument_cache import InstrumentSnapshot, ist_today, like_to_regex, load_snapshot, load_latest_snapshot, save_snapshot
+from src.rate_limiter import get_rate_limiter
 
+# Module-owned HTTP client; survives between warm Lambda invocations
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
 
-def fetch_kite_historical_data(
-    instrument_token: str = "12602626",
-    trading_symbol: str = "ACC",
-    interval: str = "5minute",
-    from_date: str = "2026-01-13 13:00:00",
-    to_date: str = "2026-01-14 15:20:00"
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the shared keep-alive session for the Kite API, creating it on first use.
+
+    The connection pool is sized to FETCH_WORKERS so concurrent fetches reuse
+    sockets instead of handshaking. 5xx responses and connection resets are retried
+    by urllib3; 429s are left to _rate_limited_get so the token bucket sees them.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=KITE_HTTP_RETRIES,
+                    backoff_factor=0.3,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    respect_retry_after_header=False,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(FETCH_WORKERS, 1), max_retries=retry)
+
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"X-Kite-Version": "3", "Accept-Encoding": "gzip, deflate"})
+                _session = session
+    return _session
+
+
+def close_http_session():
+    """
+    Closes the shared session; the next request opens a fresh one.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _retry_after_seconds(response, attempt: int) -> float:
+    """
+    Seconds to back off after a 429: the server's Retry-After (delta-seconds or
+    HTTP date) when present, otherwise exponential backoff.
+    """
+    value = response.headers.get("Retry-After") if response.headers else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return KITE_BACKOFF_SECONDS * (2 ** attempt)
+
+
+def _rate_limited_get(endpoint: str, url: str, **kwargs):
+    """
+    GETs `url` under the endpoint's shared token bucket, retrying 429 responses
+    up to KITE_MAX_RETRIES times. The final response is returned either way;
+    the rejected ones are closed.
+    """
+    limiter = get_rate_limiter(endpoint)
+
+    for attempt in range(KITE_MAX_RETRIES + 1):
+        limiter.acquire()
+        response = get_http_session().get(url, timeout=(KITE_CONNECT_TIMEOUT, KITE_READ_TIMEOUT), **kwargs)
+        if response.status_code != 429 or attempt == KITE_MAX_RETRIES:
+            return response
+
+        delay = _retry_after_seconds(response, attempt)
+        # Hand the connection back to the pool (stream=True responses hold it until closed)
+        response.close()
+        # Pause the whole bucket so concurrent callers back off too
+        limiter.penalize(delay)
+        print(f"Rate limited on {endpoint} (attempt {attempt + 1}/{KITE_MAX_RETRIES}), backing off {delay:.2f}s")
+
+    return response
+
+
+class KiteAPIError(Exception):
+    """
+    Raised when the Kite API answers with a non-success status payload.
+    """
+
+
+@timed("kite.historical", label_args=("trading_symbol",), count_rows=True)
+def request_historical_candles(
+    instrument_token: str,
+    trading_symbol: str,
+    interval: str,
+    from_date: str,
+    to_date: str
 ) -> List[Dict]:
     """
-    Fetches historical candle data from Kite API and returns it as a list of dicts.
+    Fetches historical candle data from Kite API, raising on any failure
+    (requests.RequestException, KiteAPIError or parsing errors).
+    Used by callers such as the backfill that must not mistake an error for "no data".
     """
     if not KITE_AUTH_TOKEN:
         raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
 
-    url = f"https://api.kite.trade/instruments/historical/{instrument_token}/{interval}"
+    url = f"{KITE_API_BASE_URL}/instruments/historical/{instrument_token}/{interval}"
     params = {
         "from": from_date,
         "to": to_date,
@@ -32,79 +137,221 @@ def fetch_kite_historical_data(
         "Authorization": f"token {KITE_AUTH_TOKEN}"
     }
 
+    response = _rate_limited_get("historical", url, params=params, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+
+    if data.get("status") != "success":
+        raise KiteAPIError(data.get('message', 'Unknown error'))
+
+    candles = data.get("data", {}).get("candles", [])
+
+    # Format the response as a list of dicts with timestamp, closed value, token, and symbol
+    return [
+        {
+            "timestamp": candle[0],
+            "closed": candle[4],
+            "instrument_token": instrument_token,
+            "trading_symbol": trading_symbol
+        }
+        for candle in candles
+    ]
+
+
+def fetch_kite_historical_data(
+    instrument_token: str = "12602626",
+    trading_symbol: str = "ACC",
+    interval: str = "5minute",
+    from_date: str = "2026-01-13 13:00:00",
+    to_date: str = "2026-01-14 15:20:00"
+) -> List[Dict]:
+    """
+    Fetches historical candle data from Kite API and returns it as a list of dicts.
+    Returns an empty list on HTTP, API or parsing errors.
+    """
+    if not KITE_AUTH_TOKEN:
+        raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
+
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get("status") != "success":
-            print(f"Error from API: {data.get('message', 'Unknown error')}")
-            return []
-
-        candles = data.get("data", {}).get("candles", [])
-        
-        # Format the response as a list of dicts with timestamp, closed value, token, and symbol
-        formatted_data = [
-            {
-                "timestamp": candle[0],
-                "closed": candle[4],
-                "instrument_token": instrument_token,
-                "trading_symbol": trading_symbol
-            }
-            for candle in candles
-        ]
-        
-        return formatted_data
+        return request_historical_candles(instrument_token, trading_symbol, interval, from_date, to_date)
 
     except requests.exceptions.RequestException as e:
         print(f"HTTP Request failed: {e}")
         return []
+    except KiteAPIError as e:
+        print(f"Error from API: {e}")
+        return []
     except (IndexError, KeyError, ValueError) as e:
         print(f"Data parsing failed: {e}")
         return []
 
-def fetch_instruments() -> List[Dict]:
+INSTRUMENT_FIELDS = ("instrument_token", "tradingsymbol", "name", "instrument_type", "exchange_token", "exchange")
+
+
+def _open_instruments_dump(extra_headers: Optional[Dict[str, str]] = None):
     """
-    Fetches the instruments dump from Kite API and parses the CSV.
-    Adds a 'date' field to each record.
+    Starts a streamed GET of the instruments dump; the caller must close the response.
     """
     if not KITE_API_KEY:
         raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
 
-    url = "https://api.kite.trade/instruments"
+    url = f"{KITE_API_BASE_URL}/instruments"
     headers = {
         "X-Kite-Version": "3",
-        "Authorization": f"token {KITE_AUTH_TOKEN}"
+        "Authorization": f"token {KITE_AUTH_TOKEN}",
+        **(extra_headers or {})
     }
+    return _rate_limited_get("instruments", url, headers=headers, stream=True)
+
+
+def _parse_instruments(
+    response,
+    instrument_types: Optional[Iterable[str]] = ("FUT",),
+    exchanges: Optional[Iterable[str]] = None,
+    pattern: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Parses a streamed instruments dump row by row, yielding the matching records,
+    and closes the response when done. The body is gunzipped and parsed straight off
+    the socket, so only one row is held at a time.
+    """
+    types = set(instrument_types) if instrument_types is not None else None
+    venues = set(exchanges) if exchanges is not None else None
+    symbol_match = like_to_regex(pattern).match if pattern else None
 
     try:
-        response = requests.get(url, headers=headers)
         response.raise_for_status()
-        
-        # requests automatically decodes gzip if Content-Encoding is set
-        # If it doesn't, we might need gzip module, but standard Kite API usually works with requests text
-        csv_content = response.text
-        
-        csv_reader = csv.DictReader(io.StringIO(csv_content))
-        
-        current_date_str = date.today().isoformat()
-        
-        instruments = []
-        for row in csv_reader:
-            # We only need specific columns + current date
-            if row.get("instrument_type") == "FUT":
-                instruments.append({
-                    "date": current_date_str,
-                    "instrument_token": row.get("instrument_token"),
-                    "trading_symbol": row.get("tradingsymbol"),
-                    "name": row.get("name"),
-                    "instrument_type": row.get("instrument_type"),
-                    "exchange_token": row.get("exchange_token"),
-                    "exchange": row.get("exchange")
-                })
-            
-        return instruments
 
+        # Let urllib3 undo Content-Encoding chunk by chunk as the text layer reads, and keep
+        # the stream open at EOF (auto_close would make the wrapper's final read raise)
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        reader = csv.reader(io.TextIOWrapper(response.raw, encoding="utf-8", newline=""))
+
+        header = next(reader, None)
+        if not header:
+            return
+        index = {column: position for position, column in enumerate(header)}
+        token_i, symbol_i, name_i, type_i, exchange_token_i, exchange_i = (index[field] for field in INSTRUMENT_FIELDS)
+
+        current_date_str = ist_today().isoformat()
+
+        for row in reader:
+            if types is not None and row[type_i] not in types:
+                continue
+            if venues is not None and row[exchange_i] not in venues:
+                continue
+            if symbol_match is not None and not symbol_match(row[symbol_i]):
+                continue
+
+            yield {
+                "date": current_date_str,
+                "instrument_token": row[token_i],
+                "trading_symbol": row[symbol_i],
+                "name": row[name_i],
+                "instrument_type": row[type_i],
+                "exchange_token": row[exchange_token_i],
+                "exchange": row[exchange_i]
+            }
+    finally:
+        response.close()
+
+
+def iter_instruments(
+    instrument_types: Optional[Iterable[str]] = ("FUT",),
+    exchanges: Optional[Iterable[str]] = None,
+    pattern: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Streams the instruments dump from Kite API, yielding one record per matching row.
+
+    Rows are filtered while parsing by instrument type, exchange and a SQL LIKE
+    `pattern` on the trading symbol (None disables a filter), so memory stays at one
+    row no matter how large the dump is. Nothing is cached; see
+    fetch_instrument_snapshot() for the once-per-day snapshot. Raises on HTTP or parsing errors.
+    """
+    yield from _parse_instruments(_open_instruments_dump(), instrument_types, exchanges, pattern)
+
+
+@timed("kite.instruments", none_is_error=True)
+def fetch_instrument_snapshot(trading_date: Optional[date] = None) -> Optional[InstrumentSnapshot]:
+    """
+    Returns the FUT instrument master for `trading_date` (default today in IST), downloading
+    it at most once per trading date.
+
+    A snapshot already on disk for the date is used as is. Otherwise the dump is
+    requested conditionally with the validators of the newest older snapshot, so an
+    unchanged dump costs a 304 and the old rows are carried forward. A 304 to an
+    unconditional request is retried once with no-cache and never saved as a snapshot.
+    Returns None if the dump could not be fetched or parsed.
+    """
+    trading_date = trading_date or ist_today()
+
+    snapshot = load_snapshot(trading_date)
+    if snapshot is not None:
+        return snapshot
+
+    previous = load_latest_snapshot()
+    validators = {}
+    if previous is not None:
+        if previous.etag:
+            validators["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            validators["If-Modified-Since"] = previous.last_modified
+
+    if not KITE_API_KEY:
+        raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
+
+    try:
+        response = _open_instruments_dump(validators)
+
+        if response.status_code == 304 and not validators:
+            # Nothing of ours to revalidate (e.g. a cache in between answered); ask for the body
+            response.close()
+            response = _open_instruments_dump({"Cache-Control": "no-cache"})
+
+        if response.status_code == 304:
+            response.close()
+            if not validators:
+                print("Instrument dump request returned 304 with no snapshot to reuse.")
+                return None
+            print(f"Instrument dump unchanged since {previous.trading_date}; reusing snapshot.")
+            snapshot = previous.restamped(trading_date)
+        else:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            snapshot = InstrumentSnapshot.from_records(trading_date, _parse_instruments(response), etag, last_modified)
+            print(f"Downloaded instrument dump: {len(snapshot)} FUT instruments.")
+
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch instruments: {e}")
+        return None
+    except Exception as e:
+        print(f"Error parsing instruments CSV: {e}")
+        return None
+
+    save_snapshot(snapshot)
+    return snapshot
+
+
+def fetch_instruments(pattern: Optional[str] = None) -> List[Dict]:
+    """
+    Returns the FUT instruments (optionally only trading symbols matching the SQL LIKE
+    `pattern`) as a list, each with a 'date' field.
+
+    Served from the day's on-disk snapshot when there is one. Otherwise the dump is
+    streamed with the pattern applied per row, so only the matches are ever held and
+    no snapshot is built (fetch_instruments_job.py does that).
+    """
+    if not KITE_API_KEY:
+        raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
+
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        return snapshot.lookup(pattern) if pattern else list(snapshot.records())
+
+    try:
+        return list(iter_instruments(pattern=pattern))
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch instruments: {e}")
         return []
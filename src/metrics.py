@@ -0,0 +1,304 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from src.config import METRICS_ENABLED, METRICS_NAMESPACE
+
+# Latency histogram bucket upper bounds (milliseconds); +Inf is implied
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Recent raw samples kept per histogram for EMF (CloudWatch accepts up to 100 values per metric)
+EMF_SAMPLES = 100
+
+# Read on every instrumented call: with metrics off, a wrapper costs one global
+# lookup and a branch, and timer() hands back a shared no-op context manager.
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Tuple], Dict] = {}
+_counters: Dict[Tuple[str, Tuple], float] = {}
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """
+    Drops everything recorded so far (e.g. between warm Lambda invocations).
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(name: str, value_ms: float, **labels):
+    """
+    Records one latency sample (milliseconds) in the `name` histogram.
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": [0] * (len(BUCKETS_MS) + 1), "count": 0, "sum": 0.0,
+                                    "min": value_ms, "max": value_ms, "samples": deque(maxlen=EMF_SAMPLES)}
+        i = 0
+        while i < len(BUCKETS_MS) and value_ms > BUCKETS_MS[i]:
+            i += 1
+        h["buckets"][i] += 1
+        h["count"] += 1
+        h["sum"] += value_ms
+        h["min"] = min(h["min"], value_ms)
+        h["max"] = max(h["max"], value_ms)
+        h["samples"].append(value_ms)
+
+
+def increment(name: str, value: float = 1, **labels):
+    """
+    Adds `value` to the `name` counter (row counts, errors, outcomes).
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started", "rows")
+
+    def __init__(self, name: str, labels: Dict):
+        self.name = name
+        self.labels = labels
+        self.rows = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, (time.perf_counter() - self.started) * 1000.0, **self.labels)
+        if exc_type is not None:
+            increment(f"{self.name}.errors", **self.labels)
+        if self.rows is not None:
+            increment(f"{self.name}.rows", self.rows, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels):
+    """
+    Context manager timing its block into the `name` histogram; an exception leaving
+    the block counts in `name.errors`. Set `.rows` on it to count rows in `name.rows`.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def _row_count(result) -> Optional[int]:
+    if isinstance(result, (list, tuple, dict, set)):
+        return len(result)
+    return None
+
+
+def timed(name: str, label_args: Sequence[str] = (), count_rows: bool = False, none_is_error: bool = False,
+          labels: Optional[Dict[str, str]] = None):
+    """
+    Decorator form of timer(). `labels` are fixed labels; `label_args` names arguments whose
+    values become labels (e.g. ("trading_symbol",) for per-instrument series); `count_rows` counts the
+    length of a list/dict result; `none_is_error` counts a None result as an error,
+    for functions that report failures by returning None.
+    """
+    def decorator(func: Callable):
+        signature = inspect.signature(func)
+        positions = {arg: list(signature.parameters).index(arg) for arg in label_args}
+        fixed = dict(labels or {})
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            call_labels = dict(fixed)
+            for arg, position in positions.items():
+                if arg in kwargs:
+                    call_labels[arg] = kwargs[arg]
+                elif position < len(args):
+                    call_labels[arg] = args[position]
+
+            with _Timer(name, call_labels) as t:
+                result = func(*args, **kwargs)
+                if count_rows:
+                    t.rows = _row_count(result)
+            if none_is_error and result is None:
+                increment(f"{name}.errors", **call_labels)
+            return result
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[str, List[Dict]]:
+    """
+    A copy of everything recorded: {"histograms": [...], "counters": [...]}.
+    """
+    with _lock:
+        histograms = [
+            {"name": name, "labels": dict(labels), "count": h["count"], "sum_ms": h["sum"], "min_ms": h["min"],
+             "max_ms": h["max"], "buckets": list(h["buckets"]), "samples": list(h["samples"])}
+            for (name, labels), h in _histograms.items()
+        ]
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()]
+    return {"histograms": histograms, "counters": counters}
+
+
+def to_json_lines() -> List[str]:
+    """
+    One structured JSON log line per series.
+    """
+    data = snapshot()
+    lines = []
+    for h in data["histograms"]:
+        lines.append(json.dumps({
+            "type": "histogram", "metric": h["name"], "labels": h["labels"], "count": h["count"],
+            "sum_ms": round(h["sum_ms"], 3), "avg_ms": round(h["sum_ms"] / h["count"], 3),
+            "min_ms": round(h["min_ms"], 3), "max_ms": round(h["max_ms"], 3),
+            "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["+Inf"], h["buckets"]))
+        }))
+    for c in data["counters"]:
+        lines.append(json.dumps({"type": "counter", "metric": c["name"], "labels": c["labels"], "value": c["value"]}))
+    return lines
+
+
+def to_emf(namespace: str = METRICS_NAMESPACE) -> List[str]:
+    """
+    CloudWatch Embedded Metric Format documents, one per series; printed to stdout
+    from Lambda, they become metrics with the labels as dimensions.
+    """
+    data = snapshot()
+    timestamp = int(time.time() * 1000)
+    docs = []
+
+    def doc(name, labels, value, unit):
+        return json.dumps({
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [sorted(labels)],
+                    "Metrics": [{"Name": name, "Unit": unit}]
+                }]
+            },
+            **labels,
+            name: value
+        })
+
+    for h in data["histograms"]:
+        docs.append(doc(h["name"], h["labels"], [round(v, 3) for v in h["samples"]], "Milliseconds"))
+    for c in data["counters"]:
+        docs.append(doc(c["name"], c["labels"], c["value"], "Count"))
+    return docs
+
+
+def _prom_name(name: str) -> str:
+    return "kite_" + "".join(ch if ch.isalnum() else "_" for ch in name)
+
+
+def _prom_labels(labels: Dict, extra: Optional[Dict] = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in items.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(items, escaped)) + "}"
+
+
+def to_prometheus() -> str:
+    """
+    Everything recorded, in the Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = []
+    typed = set()
+
+    for h in sorted(data["histograms"], key=lambda h: h["name"]):
+        metric = _prom_name(h["name"]) + "_ms"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        cumulative = 0
+        for bound, count in zip([str(b) for b in BUCKETS_MS] + ["+Inf"], h["buckets"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_prom_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{metric}_sum{_prom_labels(h['labels'])} {h['sum_ms']}")
+        lines.append(f"{metric}_count{_prom_labels(h['labels'])} {h['count']}")
+
+    for c in sorted(data["counters"], key=lambda c: c["name"]):
+        metric = _prom_name(c["name"]) + "_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_prom_labels(c['labels'])} {c['value']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def emit(fmt: str = "json"):
+    """
+    Prints the recorded metrics as JSON lines ("json") or EMF documents ("emf").
+    """
+    for line in (to_emf() if fmt == "emf" else to_json_lines()):
+        print(line)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves /metrics in the Prometheus text format from a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
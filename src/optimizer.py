@@ -0,0 +1,151 @@
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+from src.backtest import load_candle_series, max_drawdown, replay, rolling_sma
+from src.candle_store import load_candles
+
+# Set in each worker by _init_worker: the memory-mapped closes of every symbol
+_closes: Optional[np.ndarray] = None
+
+
+def write_close_store(trading_symbols: Sequence[str], path: str, use_store: bool = False) -> Dict[str, Tuple[int, int]]:
+    """
+    Loads each symbol's closes once (from Postgres, or the local candle store if
+    `use_store`) and appends them to a raw float64 file at `path`.
+    Returns {trading_symbol: (offset, length)} for the symbols that have candles.
+    """
+    load = load_candles if use_store else load_candle_series
+    spans = {}
+    offset = 0
+    with open(path, "wb") as f:
+        for symbol in trading_symbols:
+            _, closes = load(symbol)
+            if not len(closes):
+                continue
+            f.write(closes.tobytes())
+            spans[symbol] = (offset, len(closes))
+            offset += len(closes)
+    return spans
+
+
+def _init_worker(path: str, length: int):
+    global _closes
+    _closes = np.memmap(path, dtype=np.float64, mode="r", shape=(length,))
+
+
+def _evaluate(closes: np.ndarray, window: int, take_profits: Sequence[float],
+              stops: Sequence[Optional[float]]) -> Dict[Tuple[float, Optional[float]], Dict]:
+    """
+    Scores every (take_profit, stop) pair for one symbol and window; the SMA is computed once.
+    """
+    sma = rolling_sma(closes, window)
+    scale = float(closes.mean())
+    stats = {}
+
+    for take_profit, stop_loss in product(take_profits, stops):
+        trades, open_entry = replay(closes, sma, take_profit, stop_loss)
+        returns = [(closes[entry] - closes[exit_]) / closes[entry] for entry, exit_, _ in trades]
+        stats[(take_profit, stop_loss)] = {
+            "trades": len(trades),
+            "wins": sum(1 for r in returns if r > 0),
+            "total_return": float(sum(returns)),
+            # In price points, so normalised by the symbol's price level
+            "max_drawdown": max_drawdown(closes, trades, open_entry) / scale
+        }
+    return stats
+
+
+def _run_task(offset: int, length: int, window: int, take_profits: Sequence[float],
+              stops: Sequence[Optional[float]]):
+    return _evaluate(np.asarray(_closes[offset:offset + length]), window, take_profits, stops)
+
+
+def sweep(spans: Dict[str, Tuple[int, int]], path: str, windows: Sequence[int], take_profits: Sequence[float],
+          stops: Sequence[Optional[float]] = (None,), max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    Evaluates the grid over the close store at `path`, one (symbol, window) task per
+    worker process. Workers map the store read-only instead of querying Postgres.
+
+    Returns one row per (window, take_profit, stop_loss), aggregated across symbols and
+    ranked by total return (the sum of every trade's return), best first.
+    """
+    length = sum(n for _, n in spans.values())
+    totals = {
+        (window, take_profit, stop_loss): {"trades": 0, "wins": 0, "total_return": 0.0, "max_drawdown": 0.0, "symbols": 0}
+        for window, take_profit, stop_loss in product(windows, take_profits, stops)
+    }
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(path, length)) as executor:
+        futures = {
+            executor.submit(_run_task, offset, n, window, list(take_profits), list(stops)): (symbol, window)
+            for (symbol, (offset, n)), window in product(spans.items(), windows)
+        }
+
+        for future in as_completed(futures):
+            symbol, window = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"Sweep failed for {symbol} (window {window}): {e}")
+                continue
+
+            for (take_profit, stop_loss), s in stats.items():
+                total = totals[(window, take_profit, stop_loss)]
+                total["trades"] += s["trades"]
+                total["wins"] += s["wins"]
+                total["total_return"] += s["total_return"]
+                total["max_drawdown"] = max(total["max_drawdown"], s["max_drawdown"])
+                total["symbols"] += 1
+
+    results = []
+    for (window, take_profit, stop_loss), total in totals.items():
+        results.append({
+            "window": window,
+            "take_profit": take_profit,
+            "stop_loss": stop_loss,
+            "symbols": total["symbols"],
+            "trades": total["trades"],
+            "win_rate": total["wins"] / total["trades"] if total["trades"] else 0.0,
+            "total_return": total["total_return"],
+            "max_drawdown": total["max_drawdown"]
+        })
+    results.sort(key=lambda r: r["total_return"], reverse=True)
+    return results
+
+
+def run_sweep(trading_symbols: Sequence[str], windows: Sequence[int], take_profits: Sequence[float],
+              stops: Sequence[Optional[float]] = (None,), max_workers: Optional[int] = None,
+              use_store: bool = False) -> List[Dict]:
+    """
+    Loads the symbols' stored closes into a temporary memory-mapped store and sweeps the grid.
+    """
+    fd, path = tempfile.mkstemp(prefix="sweep-closes-", suffix=".f64")
+    os.close(fd)
+    try:
+        spans = write_close_store(trading_symbols, path, use_store)
+        if not spans:
+            print("Sweep: no candles stored for the given symbols.")
+            return []
+
+        print(f"Sweep: {len(spans)} symbol(s), {sum(n for _, n in spans.values())} candles, "
+              f"{len(windows) * len(take_profits) * len(stops)} combination(s)...")
+        return sweep(spans, path, windows, take_profits, stops, max_workers)
+    finally:
+        os.remove(path)
+
+
+def format_table(results: List[Dict], top: Optional[int] = None) -> str:
+    """
+    Renders sweep results as a ranked plain-text table.
+    """
+    lines = [f"{'rank':>4}  {'window':>6}  {'take_profit':>11}  {'stop_loss':>9}  {'trades':>7}  {'win_rate':>8}  {'total_return':>12}  {'max_dd':>7}"]
+    for rank, r in enumerate(results[:top] if top else results, start=1):
+        stop = f"{r['stop_loss']:.2%}" if r["stop_loss"] is not None else "-"
+        lines.append(
+            f"{rank:>4}  {r['window']:>6}  {r['take_profit']:>11.2%}  {stop:>9}  {r['trades']:>7}  "
+            f"{r['win_rate']:>8.1%}  {r['total_return']:>12.2%}  {r['max_drawdown']:>7.2%}"
+        )
+    return "\n".join(lines)
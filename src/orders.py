@@ -1,51 +1,90 @@
-from src.database import create_order, get_open_sell_order, close_order
+from typing import Dict, Optional
+from src.database import create_order, get_open_sell_order, reverse_position
+from src.metrics import timed
 
-def process_order_logic(trading_symbol: str, current_close: float, avg_200: float):
+# Actions returned by decide_order_action
+OPEN_SHORT = "open_short"
+REVERSAL = "reversal"
+TAKE_PROFIT = "take_profit"
+STOP_LOSS = "stop_loss"
+
+# Profit ratio on an open short that triggers the take-profit BUY
+TAKE_PROFIT_PCT = 0.02
+
+def decide_order_action(current_close: float, avg_200: float, open_order: Optional[Dict],
+                        take_profit: float = TAKE_PROFIT_PCT, stop_loss: Optional[float] = None) -> Optional[str]:
+    """
+    The 200 SMA strategy as a pure state transition: given the latest close, the SMA and
+    the open SELL order (or None), returns OPEN_SHORT, REVERSAL, TAKE_PROFIT, STOP_LOSS
+    or None (hold). The stop (a loss ratio on the short) is off unless `stop_loss` is set.
+    src/backtest.py replays these same rules over whole candle series.
+    """
+    if not open_order:
+        # Case A: No open order
+        if current_close < avg_200:
+            return OPEN_SHORT
+        return None
+
+    # Case B: Existing Open SELL order
+    # 1. Check for Stop Loss / Reversal (Close > SMA)
+    if current_close > avg_200:
+        return REVERSAL
+
+    if stop_loss is not None:
+        entry_price = open_order['price']
+        if (current_close - entry_price) / entry_price >= stop_loss:
+            return STOP_LOSS
+
+    # 2. Check for Profit Taking (Profit >= TAKE_PROFIT_PCT, 2%)
+    # Profit on Short = (Entry - Current) / Entry
+    # Note: If current_close < avg_200 is implicitly true if we are in profit on a short initiated below SMA?
+    # Not necessarily, price could be < entry but > SMA if SMA moved down?
+    # The condition "current_close < avg_200" is explicitly requested.
+    if current_close < avg_200:
+        entry_price = open_order['price']
+        profit_pct = (entry_price - current_close) / entry_price
+        if profit_pct >= take_profit:
+            return TAKE_PROFIT
+
+    return None
+
+@timed("orders.process", label_args=("trading_symbol",))
+def process_order_logic(trading_symbol: str, current_close: float, avg_200: float, book=None):
     """
     Processes the order logic based on 200 SMA strategy.
-    
+
     Logic:
     1. Check if there is an open SELL order.
     2. If NO open order:
        - If current_close < avg_200: Create SELL order.
     3. If YES open SELL order:
        - If current_close > avg_200: Create BUY order, close open SELL order.
-       - If current_close < avg_200 AND (entry_price - current_close) / entry_price >= 0.20:
+       - If current_close < avg_200 AND (entry_price - current_close) / entry_price >= TAKE_PROFIT_PCT (2%):
          Create BUY order and close open SELL order.
+
+    With a PositionBook (`book`), positions are read from and transitions recorded
+    in the book, to be written by book.flush(); otherwise each step hits the DB.
     """
-    
-    existing_order = get_open_sell_order(trading_symbol)
-    
-    if not existing_order:
-        # Case A: No open order
-        if current_close < avg_200:
-            print(f"[SIGNAL] SELL for {trading_symbol}: Close ({current_close}) < SMA ({avg_200})")
+
+    existing_order = book.open_position(trading_symbol) if book else get_open_sell_order(trading_symbol)
+    action = decide_order_action(current_close, avg_200, existing_order)
+
+    if action == OPEN_SHORT:
+        print(f"[SIGNAL] SELL for {trading_symbol}: Close ({current_close}) < SMA ({avg_200})")
+        if book:
+            book.open_short(trading_symbol, current_close, avg_200)
+        else:
             create_order("SELL", trading_symbol, current_close, close=current_close, avg_200=avg_200)
-    else:
-        # Case B: Existing Open SELL order
-        entry_price = existing_order['price']
-        
-        # 1. Check for Stop Loss / Reversal (Close > SMA)
-        if current_close > avg_200:
+
+    elif action in (REVERSAL, TAKE_PROFIT):
+        if action == REVERSAL:
             print(f"[SIGNAL] BUY (Reversal) for {trading_symbol}: Close ({current_close}) > SMA ({avg_200})")
-            # Create BUY order to pair with the SELL
-            create_order("BUY", trading_symbol, current_close, close=current_close, avg_200=avg_200, status="completed")
-            # Close the original SELL order
-            close_order(existing_order['id'])
-            
-        # 2. Check for Profit Taking (Profit >= 20%)
-        # Profit on Short = (Entry - Current) / Entry
-        # Note: If current_close < avg_200 is implicitly true if we are in profit on a short initiated below SMA? 
-        # Not necessarily, price could be < entry but > SMA if SMA moved down?
-        # The condition "current_close < avg_200" is explicitly requested.
-        elif current_close < avg_200:
-            profit_pct = (entry_price - current_close) / entry_price
-            
-            if profit_pct >= 0.02:
-                print(f"[SIGNAL] BUY (Take Profit) for {trading_symbol}: Profit {profit_pct*100:.2f}% >= 20%")
-                # "Create a sell order and mark both as completed" - As requested.
-                # Usually closing a short is a BUY, but user requested SELL.
-                create_order("BUY", trading_symbol, current_close, close=current_close, avg_200=avg_200, status="completed")
-                
-                # Close the original SELL order
-                close_order(existing_order['id'])
+        else:
+            profit_pct = (existing_order['price'] - current_close) / existing_order['price']
+            print(f"[SIGNAL] BUY (Take Profit) for {trading_symbol}: Profit {profit_pct*100:.2f}% >= {TAKE_PROFIT_PCT*100:.0f}%")
+
+        if book:
+            book.cover(trading_symbol, current_close, avg_200)
+        else:
+            # Create the BUY that pairs with the SELL and close the SELL atomically
+            reverse_position(existing_order['id'], trading_symbol, current_close, close=current_close, avg_200=avg_200)
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+from src.config import (
+    FETCH_WORKERS, INDICATORS, PIPELINE_DB_WORKERS, PIPELINE_QUEUE_SIZE, PIPELINE_STAGE_TIMEOUT
+)
+from src.database import get_latest_stats_and_close, save_historical_data, update_running_average
+from src.kite_api import fetch_kite_historical_data
+from src.metrics import increment, observe
+from src.orders import process_order_logic
+
+STAGES = ("fetch", "persist", "indicator", "order")
+
+
+def _candle_window(interval: str = "5minute"):
+    # Same window as main.fetch_and_save_historical_data: the candle forming now, in IST
+    now_ist = datetime.now(timezone.utc) + timedelta(hours=5, minutes=30)
+    return (
+        (now_ist - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        (now_ist + timedelta(minutes=4)).strftime("%Y-%m-%d %H:%M:%S"),
+        interval
+    )
+
+
+def _fetch(instrument: Dict, window) -> Optional[Dict]:
+    from_date, to_date, interval = window
+    candles = fetch_kite_historical_data(
+        instrument_token=instrument['instrument_token'],
+        trading_symbol=instrument['trading_symbol'],
+        from_date=from_date,
+        to_date=to_date,
+        interval=interval
+    )
+    if not candles:
+        print(f"No candles fetched for {instrument['trading_symbol']}.")
+        return None
+    return {**instrument, "candles": candles}
+
+
+def _persist(item: Dict) -> Optional[Dict]:
+    inserted = save_historical_data(item.pop("candles"))
+    if inserted is None:
+        raise RuntimeError("save failed")
+    return {**item, "new_candles": inserted}
+
+
+def update_average(item: Dict) -> Dict:
+    """
+    The indicator stage's per-item running-average update only. main.py's staged mode
+    runs this per instrument and then reads indicators and stats in bulk.
+    """
+    update_running_average(item['trading_symbol'], item.get("new_candles", []))
+    return item
+
+
+def _indicator(item: Dict) -> Optional[Dict]:
+    symbol = item['trading_symbol']
+    update_average(item)
+    if INDICATORS:
+        from src.indicators import update_indicators  # numpy is only loaded when indicators are configured
+        update_indicators([symbol])
+
+    latest = get_latest_stats_and_close(symbol)
+    if not latest:
+        print(f"No sufficient data (stats/candles) found for {symbol}. Skipping orders.")
+        return None
+    return {**item, "latest": latest}
+
+
+def _order(item: Dict, book=None) -> Dict:
+    latest_close, avg_200 = item["latest"]
+    process_order_logic(item['trading_symbol'], latest_close, avg_200, book)
+    return item
+
+
+async def run_pipeline(instruments: List[Dict], concurrency: Optional[Dict[str, int]] = None,
+                       timeout: Optional[float] = PIPELINE_STAGE_TIMEOUT, queue_size: int = PIPELINE_QUEUE_SIZE,
+                       stages: Optional[Dict[str, Callable]] = None, only: Optional[Sequence[str]] = None,
+                       book=None, results: Optional[List[Dict]] = None) -> Dict:
+    """
+    Runs fetch -> persist -> indicator -> order with every instrument flowing through
+    on its own, so a slow instrument only delays itself.
+
+    Stages are connected by bounded queues (a full queue holds back the stage before it)
+    and each runs `concurrency[stage]` workers (fetch: FETCH_WORKERS, others:
+    PIPELINE_DB_WORKERS). The blocking stage functions run on a thread pool; an item
+    taking longer than `timeout` seconds (None: no limit) in a stage is dropped from the
+    pipeline (its thread is left to finish). A stage returning None ends the item without error.
+
+    `only` runs a contiguous part of STAGES, e.g. ("fetch", "persist"); instruments enter
+    at its first stage. Items coming out of the last stage are appended to `results` if
+    given. `book` (a PositionBook) is passed to the order stage.
+
+    Returns {"instruments", "completed", "elapsed", "<stage>": {"ok", "skipped", "failed", "timed_out"}}.
+    """
+    selected = tuple(only or STAGES)
+    start = STAGES.index(selected[0]) if selected[0] in STAGES else -1
+    if start < 0 or STAGES[start:start + len(selected)] != selected:
+        raise ValueError(f"Pipeline stages must be a contiguous part of {STAGES}, got {selected}")
+
+    limits = {"fetch": FETCH_WORKERS, "persist": PIPELINE_DB_WORKERS, "indicator": PIPELINE_DB_WORKERS, "order": PIPELINE_DB_WORKERS}
+    limits.update(concurrency or {})
+    window = _candle_window()
+    funcs = {"fetch": lambda item: _fetch(item, window), "persist": _persist, "indicator": _indicator,
+             "order": lambda item: _order(item, book)}
+    funcs.update(stages or {})
+
+    summary = {"instruments": len(instruments), "completed": 0, "elapsed": 0.0}
+    for stage in selected:
+        summary[stage] = {"ok": 0, "skipped": 0, "failed": 0, "timed_out": 0}
+
+    if not instruments:
+        print("No target instruments available for the pipeline.")
+        return summary
+
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in selected]
+
+    async def worker(index: int, stage: str):
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(selected) else None
+        counts = summary[stage]
+        while True:
+            item = await inbox.get()
+            item_started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(loop.run_in_executor(executor, funcs[stage], item), timeout)
+            except asyncio.TimeoutError:
+                print(f"Pipeline {stage} timed out for {item['trading_symbol']} after {timeout}s.")
+                outcome = "timed_out"
+                result = None
+            except Exception as e:
+                print(f"Pipeline {stage} failed for {item['trading_symbol']}: {e}")
+                outcome = "failed"
+                result = None
+            else:
+                outcome = "ok" if result is not None else "skipped"
+                if outbox is None and result is not None:
+                    summary["completed"] += 1
+                    if results is not None:
+                        results.append(result)
+
+            counts[outcome] += 1
+            # Per item; main.py's staged functions time whole stages as pipeline.stage
+            observe("pipeline.item", (time.perf_counter() - item_started) * 1000.0, stage=stage)
+            increment("pipeline.items", stage=stage, outcome=outcome)
+
+            try:
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+            finally:
+                inbox.task_done()
+
+    executor = ThreadPoolExecutor(max_workers=sum(max(1, limits[s]) for s in selected))
+    workers = []
+    for index, stage in enumerate(selected):
+        workers += [asyncio.ensure_future(worker(index, stage)) for _ in range(max(1, limits[stage]))]
+
+    try:
+        for instrument in instruments:
+            await queues[0].put(instrument)
+        # Items only move downstream, so each queue drains after the one before it
+        for queue in queues:
+            await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # Don't wait here for threads still running a timed-out item
+        executor.shutdown(wait=False)
+
+    summary["elapsed"] = round(time.monotonic() - started, 3)
+    print(f"Pipeline completed: {summary}")
+    return summary
+
+
+def run_pipeline_sync(instruments: List[Dict], **kwargs) -> Dict:
+    """
+    Blocking wrapper around run_pipeline for scripts and Lambda.
+    """
+    return asyncio.run(run_pipeline(instruments, **kwargs))
+
+
+def run_stages(instruments: List[Dict], only: Sequence[str], **kwargs) -> List[Dict]:
+    """
+    Runs `only` of the pipeline to completion (see run_pipeline) and returns the items
+    that came out of its last stage, in input order. Backs main.py's staged functions.
+    """
+    results: List[Dict] = []
+    run_pipeline_sync(instruments, only=only, results=results, **kwargs)
+    position = {instrument['trading_symbol']: n for n, instrument in enumerate(instruments)}
+    results.sort(key=lambda item: position.get(item['trading_symbol'], len(position)))
+    return results
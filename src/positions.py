@@ -0,0 +1,178 @@
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from src.database import db_connection
+from src.metrics import timed
+from src.schema import ensure_schema
+
+
+class PositionBook:
+    """
+    In-memory view of the open SELL positions for one pipeline run.
+
+    All open positions are loaded with a single query; the strategy's transitions are
+    applied to the book locally, and the resulting order inserts and status updates
+    are written by flush() in one transaction. The book is shared by the order stage's
+    worker threads, so its pending lists are guarded by a lock.
+    """
+
+    def __init__(self, positions: Optional[Dict[str, Dict]] = None):
+        self.positions: Dict[str, Dict] = positions or {}
+        self._new_orders: List[Dict] = []
+        # (id of the SELL being closed, the BUY that covers it)
+        self._covers: List[Tuple[int, Dict]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    @timed("orders.load_positions")
+    def load(cls, trading_symbols: Optional[List[str]] = None) -> Optional["PositionBook"]:
+        """
+        Loads the latest open SELL order per symbol (all symbols if None).
+        Returns None if the positions could not be read.
+        """
+        query = """
+            SELECT DISTINCT ON (trading_symbol) id, order_type, trading_symbol, price, status, created_at
+            FROM orders
+            WHERE order_type = 'SELL' AND status = 'created'
+        """
+        params = ()
+        if trading_symbols is not None:
+            query += " AND trading_symbol = ANY(%s)"
+            params = (list(trading_symbols),)
+        query += " ORDER BY trading_symbol, created_at DESC"
+
+        with db_connection() as conn:
+            if not conn:
+                return None
+
+            try:
+                ensure_schema(conn)
+
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+                    rows = cur.fetchall()
+
+                return cls({
+                    row[2]: {
+                        "id": row[0],
+                        "order_type": row[1],
+                        "trading_symbol": row[2],
+                        "price": row[3],
+                        "status": row[4],
+                        "created_at": row[5]
+                    }
+                    for row in rows
+                })
+
+            except Exception as e:
+                print(f"Failed to load open positions: {e}")
+                return None
+
+    def open_position(self, trading_symbol: str) -> Optional[Dict]:
+        return self.positions.get(trading_symbol)
+
+    def _order(self, order_type: str, trading_symbol: str, price: float, avg_200: float, status: str) -> Dict:
+        return {
+            "order_type": order_type,
+            "trading_symbol": trading_symbol,
+            "price": price,
+            "close": price,
+            "avg_200": avg_200,
+            "status": status,
+            "created_at": datetime.now()
+        }
+
+    def open_short(self, trading_symbol: str, price: float, avg_200: float):
+        """
+        Records a new SELL order and makes it the symbol's open position.
+        """
+        order = self._order("SELL", trading_symbol, price, avg_200, "created")
+        with self._lock:
+            self._new_orders.append(order)
+            self.positions[trading_symbol] = {"id": None, **order}
+
+    def cover(self, trading_symbol: str, price: float, avg_200: float):
+        """
+        Records the completed BUY that closes the symbol's open SELL position.
+        """
+        buy = self._order("BUY", trading_symbol, price, avg_200, "completed")
+        with self._lock:
+            position = self.positions.pop(trading_symbol, None)
+            if position is None:
+                return
+
+            if position["id"] is not None:
+                # Written by flush() only if the SELL is still open then
+                self._covers.append((position["id"], buy))
+                return
+
+            # Opened and closed within this run: it is inserted already completed
+            self._new_orders.append(buy)
+            for order in self._new_orders:
+                if order["trading_symbol"] == trading_symbol and order["order_type"] == "SELL" and order["status"] == "created":
+                    order["status"] = "completed"
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._new_orders) + len(self._covers)
+
+    @timed("orders.flush")
+    def flush(self) -> bool:
+        """
+        Writes all recorded order inserts and closes in one transaction.
+        A loaded SELL is only closed (and its BUY cover inserted) if it is still
+        'created', as in reverse_position. On failure everything is rolled back
+        and kept pending; returns False.
+        """
+        with self._lock:
+            if not self._new_orders and not self._covers:
+                return True
+
+            with db_connection() as conn:
+                if not conn:
+                    return False
+
+                try:
+                    ensure_schema(conn)
+                    ids = []
+                    closed = set()
+
+                    with conn.cursor() as cur:
+                        if self._covers:
+                            cur.execute(
+                                "UPDATE orders SET status = 'completed' WHERE id = ANY(%s) AND status = 'created' RETURNING id",
+                                ([sell_id for sell_id, _ in self._covers],)
+                            )
+                            closed = {row[0] for row in cur.fetchall()}
+
+                        orders = self._new_orders + [buy for sell_id, buy in self._covers if sell_id in closed]
+                        if orders:
+                            ids = execute_values(cur, """
+                                INSERT INTO orders (order_type, trading_symbol, price, close, avg_200, status, created_at)
+                                VALUES %s
+                                RETURNING id;
+                            """, [
+                                (o["order_type"], o["trading_symbol"], o["price"], o["close"], o["avg_200"], o["status"], o["created_at"])
+                                for o in orders
+                            ], fetch=True)
+
+                    conn.commit()
+
+                except Exception as e:
+                    print(f"Failed to flush position book: {e}")
+                    conn.rollback()
+                    return False
+
+            # Newly opened positions now have ids
+            for order, row in zip(self._new_orders, ids):
+                position = self.positions.get(order["trading_symbol"])
+                if order["order_type"] == "SELL" and order["status"] == "created" and position and position["id"] is None:
+                    position["id"] = row[0]
+
+            skipped = len(self._covers) - len(closed)
+            print(f"Position book flushed: {len(orders)} orders created, {len(closed)} closed, {skipped} already closed elsewhere.")
+            self._new_orders = []
+            self._covers = []
+            return True
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from src.config import KITE_HISTORICAL_RPS, KITE_INSTRUMENTS_RPS
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts up to `capacity`.
+
+    Callers reserve a token under a short lock and then sleep outside it, so the
+    bucket can be shared by threads and by asyncio tasks (acquire_async) alike.
+    Reservations may drive the balance negative; later callers queue behind that debt.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Takes `tokens` from the bucket and returns how long the caller must wait.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Blocks the current thread until `tokens` are available.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        """
+        Waits without blocking the event loop until `tokens` are available.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """
+        Pauses the bucket for `seconds` (e.g. a server's Retry-After) on top of any
+        existing debt, so every caller reserving after this point waits it out.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+# Per-endpoint request budgets (requests/second), shared process-wide
+ENDPOINT_BUDGETS: Dict[str, float] = {
+    "historical": KITE_HISTORICAL_RPS,
+    "instruments": KITE_INSTRUMENTS_RPS,
+}
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint: str) -> TokenBucket:
+    """
+    Returns the shared bucket for an endpoint, creating it from ENDPOINT_BUDGETS.
+    """
+    limiter = _limiters.get(endpoint)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(endpoint)
+            if limiter is None:
+                if endpoint not in ENDPOINT_BUDGETS:
+                    raise ValueError(f"No rate budget configured for endpoint '{endpoint}'")
+                limiter = TokenBucket(ENDPOINT_BUDGETS[endpoint])
+                _limiters[endpoint] = limiter
+    return limiter
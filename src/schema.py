@@ -0,0 +1,217 @@
+import threading
+from typing import List, Tuple
+from src.config import DB_AUTO_MIGRATE
+from src.metrics import timer
+
+# Ordered list of (version, description, statements). Never edit an applied
+# migration; append a new one instead.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Baseline tables", [
+        """
+        CREATE TABLE IF NOT EXISTS historical_candles (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP WITH TIME ZONE,
+            trading_symbol VARCHAR(50),
+            closed DOUBLE PRECISION,
+            instrument_token VARCHAR(50),
+            CONSTRAINT unique_candle UNIQUE (trading_symbol, timestamp)
+        );
+        """,
+        "ALTER TABLE historical_candles ADD COLUMN IF NOT EXISTS instrument_token VARCHAR(50);",
+        "ALTER TABLE historical_candles ADD COLUMN IF NOT EXISTS trading_symbol VARCHAR(50);",
+        """
+        CREATE TABLE IF NOT EXISTS instruments (
+            date DATE,
+            trading_symbol VARCHAR(255),
+            instrument_token VARCHAR(50),
+            name VARCHAR(255),
+            instrument_type VARCHAR(50),
+            exchange_token VARCHAR(50),
+            exchange VARCHAR(50),
+            PRIMARY KEY (date, trading_symbol)
+        );
+        """,
+        "ALTER TABLE instruments ADD COLUMN IF NOT EXISTS instrument_type VARCHAR(50);",
+        """
+        CREATE TABLE IF NOT EXISTS instrument_statistics (
+            trading_symbol VARCHAR(255) PRIMARY KEY,
+            sum_200 DOUBLE PRECISION,
+            avg_200 DOUBLE PRECISION,
+            count INT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id SERIAL PRIMARY KEY,
+            order_type VARCHAR(10),
+            trading_symbol VARCHAR(255),
+            price DOUBLE PRECISION,
+            status VARCHAR(20),
+            created_at TIMESTAMP
+        );
+        """,
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS close DOUBLE PRECISION;",
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS avg_200 DOUBLE PRECISION;",
+    ]),
+    (2, "Window bounds for incremental SMA", [
+        "ALTER TABLE instrument_statistics ADD COLUMN IF NOT EXISTS window_start TIMESTAMP WITH TIME ZONE;",
+        "ALTER TABLE instrument_statistics ADD COLUMN IF NOT EXISTS window_end TIMESTAMP WITH TIME ZONE;",
+        "ALTER TABLE instrument_statistics ADD COLUMN IF NOT EXISTS updates_since_recompute INT DEFAULT 0;",
+    ]),
+    (3, "Indicator engine output", [
+        """
+        CREATE TABLE IF NOT EXISTS instrument_indicators (
+            trading_symbol VARCHAR(255),
+            indicator VARCHAR(50),
+            value DOUBLE PRECISION,
+            as_of TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (trading_symbol, indicator)
+        );
+        """,
+    ]),
+    (4, "Backfill checkpoints", [
+        """
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            trading_symbol VARCHAR(255),
+            interval VARCHAR(20),
+            range_start TIMESTAMP WITH TIME ZONE,
+            range_end TIMESTAMP WITH TIME ZONE,
+            candles INT,
+            completed_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (trading_symbol, interval, range_start, range_end)
+        );
+        """,
+    ]),
+    (5, "Slowly changing instrument master", [
+        """
+        CREATE TABLE IF NOT EXISTS instruments_scd (
+            id BIGSERIAL PRIMARY KEY,
+            instrument_token VARCHAR(50) NOT NULL,
+            trading_symbol VARCHAR(255),
+            name VARCHAR(255),
+            instrument_type VARCHAR(50),
+            exchange_token VARCHAR(50),
+            exchange VARCHAR(50),
+            valid_from DATE NOT NULL,
+            valid_to DATE
+        );
+        """,
+        # One open version per contract; also the lookup path for the sync's diff
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS instruments_scd_current_token
+        ON instruments_scd (instrument_token) WHERE valid_to IS NULL;
+        """,
+        "CREATE INDEX IF NOT EXISTS instruments_scd_token_history ON instruments_scd (instrument_token, valid_from);",
+        """
+        CREATE OR REPLACE VIEW instruments_current AS
+        SELECT instrument_token, trading_symbol, name, instrument_type, exchange_token, exchange, valid_from
+        FROM instruments_scd
+        WHERE valid_to IS NULL;
+        """,
+        # Seed from the latest daily snapshot so lookups keep working straight after the upgrade
+        """
+        INSERT INTO instruments_scd (instrument_token, trading_symbol, name, instrument_type, exchange_token, exchange, valid_from)
+        SELECT DISTINCT ON (instrument_token)
+               instrument_token, trading_symbol, name, instrument_type, exchange_token, exchange, date
+        FROM instruments
+        WHERE date = (SELECT MAX(date) FROM instruments) AND instrument_token IS NOT NULL
+        ORDER BY instrument_token, trading_symbol
+        ON CONFLICT (instrument_token) WHERE valid_to IS NULL DO NOTHING;
+        """,
+    ]),
+    (6, "Prefix-searchable instrument symbols", [
+        # text_pattern_ops lets anchored LIKE patterns ('NIFTY26%') use a btree range scan
+        # under any collation; the partial index keeps the current-set lookup small.
+        """
+        CREATE INDEX IF NOT EXISTS instruments_scd_current_symbol
+        ON instruments_scd (trading_symbol text_pattern_ops) WHERE valid_to IS NULL;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS instruments_scd_symbol_history
+        ON instruments_scd (trading_symbol text_pattern_ops, valid_from);
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent cold starts migrate once.
+MIGRATION_LOCK_ID = 727_001
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def get_applied_version(conn) -> int:
+    """
+    Returns the highest applied migration version (0 for a fresh database).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cur.fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """
+    Applies all pending migrations in a single transaction.
+    Returns the number of migrations applied.
+    """
+    applied = 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        current = cur.fetchone()[0]
+
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            print(f"Applied schema migration {version}: {description}")
+            applied += 1
+
+    conn.commit()
+    return applied
+
+
+def ensure_schema(conn) -> bool:
+    """
+    Brings the schema up to date once per process.
+
+    The first call checks schema_migrations (and migrates if needed); every later
+    call returns immediately, so hot-path queries never issue DDL or catalog probes.
+    Disabled entirely when DB_AUTO_MIGRATE is false.
+    """
+    global _schema_ready
+    if _schema_ready or not DB_AUTO_MIGRATE:
+        return True
+
+    with _schema_lock:
+        if _schema_ready:
+            return True
+        try:
+            with timer("db.ensure_schema"):
+                if get_applied_version(conn) < SCHEMA_VERSION:
+                    migrate(conn)
+            _schema_ready = True
+        except Exception as e:
+            print(f"Schema bootstrap failed: {e}")
+            conn.rollback()
+            return False
+
+    return True
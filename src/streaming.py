@@ -0,0 +1,323 @@
+import asyncio
+import json
+import struct
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+from src.config import (
+    KITE_AUTH_TOKEN, KITE_API_KEY, KITE_WS_URL, STREAM_BAR_SECONDS, STREAM_BAR_GRACE_SECONDS,
+    STREAM_RECONNECT_MAX_SECONDS
+)
+from src.database import SMA_WINDOW, get_recent_closes_bulk, save_historical_data, update_running_average
+from src.metrics import increment, timer
+from src.orders import process_order_logic
+
+# Price divisors by exchange segment (the low byte of the instrument token)
+_SEGMENT_CDS = 3
+_SEGMENT_BCD = 6
+
+# Packet sizes of the Kite ticker's binary modes
+_LTP_PACKET = 8
+_INDEX_QUOTE_PACKET = 28
+_INDEX_FULL_PACKET = 32
+_QUOTE_PACKET = 44
+_FULL_PACKET = 184
+
+
+def _divisor(token: int) -> float:
+    segment = token & 0xff
+    if segment == _SEGMENT_CDS:
+        return 10000000.0
+    if segment == _SEGMENT_BCD:
+        return 10000.0
+    return 100.0
+
+
+def parse_ticks(message: bytes) -> List[Dict]:
+    """
+    Decodes one binary Kite ticker message into [{"instrument_token", "last_price",
+    "volume", "exchange_timestamp"}]. Heartbeats (1-byte messages) decode to [].
+
+    Layout: a big-endian int16 packet count, then per packet an int16 length and the
+    packet; prices are integers in paise (or the segment's smaller unit).
+    """
+    if len(message) < 2:
+        return []
+
+    ticks = []
+    count = struct.unpack_from(">H", message, 0)[0]
+    offset = 2
+    for _ in range(count):
+        length = struct.unpack_from(">H", message, offset)[0]
+        packet = message[offset + 2:offset + 2 + length]
+        offset += 2 + length
+        if len(packet) < _LTP_PACKET:
+            continue
+
+        token, price = struct.unpack_from(">II", packet, 0)
+        tick = {"instrument_token": token, "last_price": price / _divisor(token), "volume": None, "exchange_timestamp": None}
+
+        if length in (_QUOTE_PACKET, _FULL_PACKET):
+            tick["volume"] = struct.unpack_from(">I", packet, 16)[0]
+        if length == _FULL_PACKET:
+            tick["exchange_timestamp"] = struct.unpack_from(">I", packet, 60)[0]
+        elif length == _INDEX_FULL_PACKET:
+            tick["exchange_timestamp"] = struct.unpack_from(">I", packet, 28)[0]
+
+        ticks.append(tick)
+    return ticks
+
+
+class CloseRing:
+    """
+    The last `capacity` closes of one symbol in a fixed NumPy buffer.
+    """
+
+    def __init__(self, capacity: int = SMA_WINDOW, closes: Optional[List[float]] = None):
+        self._buffer = np.zeros(capacity)
+        self._count = 0
+        self._next = 0
+        for close in (closes or [])[-capacity:]:
+            self.append(close)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, close: float):
+        self._buffer[self._next] = close
+        self._next = (self._next + 1) % len(self._buffer)
+        self._count = min(self._count + 1, len(self._buffer))
+
+    def sma(self) -> Optional[float]:
+        """
+        Mean of the held closes, rounded like instrument_statistics.avg_200.
+        """
+        if not self._count:
+            return None
+        return round(float(self._buffer[:self._count].sum()) / self._count, 2)
+
+
+class CandleAggregator:
+    """
+    Folds ticks into fixed-length OHLC bars per instrument token, aligned to epoch
+    multiples of `bar_seconds` (5-minute bars line up with IST session times).
+    """
+
+    def __init__(self, bar_seconds: int = STREAM_BAR_SECONDS):
+        self.bar_seconds = bar_seconds
+        self._bars: Dict[int, Dict] = {}
+        self._last_closed: Dict[int, int] = {}
+        self.late_ticks = 0
+
+    def add_tick(self, token: int, price: float, timestamp: float, volume: Optional[int] = None) -> Optional[Dict]:
+        """
+        Adds a tick; returns the token's previous bar if this tick starts a new one.
+        Ticks for a bar that was already closed are counted in late_ticks and dropped.
+        """
+        start = int(timestamp // self.bar_seconds) * self.bar_seconds
+        if start <= self._last_closed.get(token, -1):
+            self.late_ticks += 1
+            return None
+
+        bar = self._bars.get(token)
+        closed = None
+        if bar is not None and start > bar["start"]:
+            closed = self._close(token)
+            bar = None
+
+        if bar is None:
+            self._bars[token] = {"instrument_token": token, "start": start, "open": price, "high": price,
+                                 "low": price, "close": price, "volume": volume}
+        else:
+            bar["high"] = max(bar["high"], price)
+            bar["low"] = min(bar["low"], price)
+            bar["close"] = price
+            if volume is not None:
+                bar["volume"] = volume
+        return closed
+
+    def _close(self, token: int) -> Dict:
+        bar = self._bars.pop(token)
+        self._last_closed[token] = bar["start"]
+        return bar
+
+    def flush_due(self, now: float, grace: float = STREAM_BAR_GRACE_SECONDS) -> List[Dict]:
+        """
+        Closes the bars whose interval ended more than `grace` seconds before `now`,
+        so a contract that stops trading still gets its bar on time.
+        """
+        due = [token for token, bar in self._bars.items() if bar["start"] + self.bar_seconds + grace <= now]
+        return [self._close(token) for token in due]
+
+
+class TickStreamer:
+    """
+    Streams ticks for the given instruments from the Kite ticker and acts on every closed bar.
+
+    Each closed bar is appended to the symbol's CloseRing (seeded with the stored closes),
+    saved to historical_candles, folded into instrument_statistics, and passed to
+    process_order_logic with the ring's SMA. Bar handling runs on one worker thread,
+    in bar order, so the socket is never blocked on Postgres.
+    """
+
+    def __init__(self, instruments: List[Dict], url: Optional[str] = None,
+                 on_bar: Optional[Callable[[Dict, Optional[float]], None]] = None,
+                 bar_seconds: int = STREAM_BAR_SECONDS, clock: Callable[[], float] = time.time):
+        self.symbols = {int(i['instrument_token']): i['trading_symbol'] for i in instruments}
+        self.url = url or _ticker_url()
+        self.on_bar = on_bar
+        self.clock = clock
+        self.aggregator = CandleAggregator(bar_seconds)
+        self.rings: Dict[str, CloseRing] = {}
+        self._last_stored: Dict[str, datetime] = {}
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self.bars_handled = 0
+
+    def seed(self):
+        """
+        Loads each symbol's last SMA_WINDOW stored closes into its ring (one query).
+        """
+        recent = get_recent_closes_bulk(list(self.symbols.values()), SMA_WINDOW)
+        for symbol in self.symbols.values():
+            closes, last = recent.get(symbol, ([], None))
+            self.rings[symbol] = CloseRing(SMA_WINDOW, closes)
+            if last is not None:
+                self._last_stored[symbol] = last
+
+    def handle_bar(self, bar: Dict):
+        symbol = self.symbols[bar["instrument_token"]]
+        timestamp = datetime.fromtimestamp(bar["start"], tz=timezone.utc)
+        ring = self.rings.setdefault(symbol, CloseRing(SMA_WINDOW))
+
+        # A bar already stored (by the poller, or before a restart) is already in the ring
+        last = self._last_stored.get(symbol)
+        if last is None or timestamp > last:
+            ring.append(bar["close"])
+            self._last_stored[symbol] = timestamp
+
+            inserted = save_historical_data([{
+                "timestamp": timestamp,
+                "closed": bar["close"],
+                "instrument_token": str(bar["instrument_token"]),
+                "trading_symbol": symbol
+            }])
+            if inserted:
+                update_running_average(symbol, inserted)
+
+        avg = ring.sma()
+        if self.on_bar:
+            self.on_bar(bar, avg)
+        if avg is not None:
+            process_order_logic(symbol, bar["close"], avg)
+        self.bars_handled += 1
+
+    def _dispatch(self, bars: List[Dict]):
+        for bar in bars:
+            self._worker.submit(self._handle_bar_safely, bar)
+
+    def _handle_bar_safely(self, bar: Dict):
+        try:
+            with timer("stream.bar"):
+                self.handle_bar(bar)
+        except Exception as e:
+            print(f"Failed to handle bar {bar}: {e}")
+
+    def on_message(self, message):
+        if isinstance(message, str):
+            # Text frames carry order updates and errors as JSON
+            try:
+                payload = json.loads(message)
+            except ValueError:
+                return
+            if payload.get("type") == "error":
+                print(f"Ticker error: {payload.get('data')}")
+            return
+
+        closed = []
+        ticks = parse_ticks(message)
+        increment("stream.ticks", len(ticks))
+        for tick in ticks:
+            if tick["instrument_token"] not in self.symbols:
+                continue
+            timestamp = tick["exchange_timestamp"] or self.clock()
+            bar = self.aggregator.add_tick(tick["instrument_token"], tick["last_price"], timestamp, tick["volume"])
+            if bar:
+                closed.append(bar)
+        self._dispatch(closed)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            self._dispatch(self.aggregator.flush_due(self.clock()))
+
+    async def _session(self, stop: asyncio.Event):
+        tokens = list(self.symbols)
+        async with connect(self.url, max_size=None) as ws:
+            await ws.send(json.dumps({"a": "subscribe", "v": tokens}))
+            await ws.send(json.dumps({"a": "mode", "v": ["full", tokens]}))
+            print(f"Ticker connected: {len(tokens)} instrument(s) subscribed.")
+
+            while not stop.is_set():
+                receive = asyncio.ensure_future(ws.recv())
+                stopped = asyncio.ensure_future(stop.wait())
+                done, _ = await asyncio.wait({receive, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                if receive not in done:
+                    receive.cancel()
+                    stopped.cancel()
+                    break
+                stopped.cancel()
+                self.on_message(receive.result())
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """
+        Streams until `stop` is set, reconnecting with exponential backoff when the
+        socket drops. Bars whose interval has ended are handled before returning;
+        a bar still forming at shutdown is discarded rather than stored incomplete.
+        """
+        stop = stop or asyncio.Event()
+        if not self.rings:
+            self.seed()
+
+        flusher = asyncio.ensure_future(self._flush_loop())
+        delay = 1.0
+        try:
+            while not stop.is_set():
+                try:
+                    await self._session(stop)
+                    delay = 1.0
+                except (ConnectionClosed, OSError) as e:
+                    print(f"Ticker connection lost: {e}. Reconnecting in {delay:.0f}s...")
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = min(delay * 2, STREAM_RECONNECT_MAX_SECONDS)
+        finally:
+            flusher.cancel()
+            self._dispatch(self.aggregator.flush_due(self.clock()))
+            self._worker.shutdown(wait=True)
+
+
+def _ticker_url() -> str:
+    if not KITE_AUTH_TOKEN:
+        raise ValueError("Environment variable KITE_AUTH_TOKEN is not set.")
+    # KITE_AUTH_TOKEN is "api_key:access_token", as sent in the REST Authorization header
+    api_key, _, access_token = KITE_AUTH_TOKEN.partition(":")
+    if not access_token:
+        api_key, access_token = KITE_API_KEY, KITE_AUTH_TOKEN
+    return f"{KITE_WS_URL}?api_key={api_key}&access_token={access_token}"
+
+
+def run_stream(instruments: List[Dict]):
+    """
+    Blocking entry point: streams the instruments until interrupted (Ctrl+C).
+    """
+    streamer = TickStreamer(instruments)
+    try:
+        asyncio.run(streamer.run())
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
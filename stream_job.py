@@ -0,0 +1,23 @@
+import argparse
+from main import ensure_target_instruments_exist
+from src.streaming import run_stream
+from src.config import METRICS_PORT
+from src import metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream live ticks, build 5-minute bars and run the strategy on each bar close.")
+    parser.add_argument("--pattern", default="NIFTY26%", help="SQL LIKE pattern of trading symbols")
+    args = parser.parse_args()
+
+    if METRICS_PORT:
+        metrics.enable()
+        metrics.serve_prometheus(METRICS_PORT)
+        print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    instruments = ensure_target_instruments_exist(args.pattern)
+
+    if instruments:
+        print(f"Streaming {len(instruments)} instrument(s)...")
+        run_stream(instruments)
+    else:
+        print("No instruments found. Run fetch_instruments_job.py first.")
@@ -3,7 +3,7 @@ try:
     conn = get_db_connection()
     if conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM instruments WHERE trading_symbol LIKE 'NIFTY26%'")
+            cur.execute("DELETE FROM instruments_scd WHERE trading_symbol LIKE 'NIFTY26%'")
             print(f"Deleted {cur.rowcount} rows.")
         conn.commit()
         conn.close()
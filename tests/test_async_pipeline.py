@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.pipeline
+from src.pipeline import run_pipeline_sync
+
+
+@patch('builtins.print')
+@patch('src.pipeline.process_order_logic')
+@patch('src.pipeline.get_latest_stats_and_close')
+@patch('src.pipeline.update_running_average')
+@patch('src.pipeline.save_historical_data')
+@patch('src.pipeline.fetch_kite_historical_data')
+class TestAsyncPipeline(unittest.TestCase):
+    def test_slow_instrument_does_not_hold_back_others(self, mock_fetch, mock_save, mock_update, mock_latest, mock_orders, mock_print):
+        events = []
+
+        def fake_fetch(instrument_token, trading_symbol, **kwargs):
+            if trading_symbol == "SLOW":
+                time.sleep(0.3)
+            events.append(("fetched", trading_symbol))
+            return [{"closed": 100.0, "trading_symbol": trading_symbol}]
+
+        mock_fetch.side_effect = fake_fetch
+        mock_save.side_effect = lambda candles: candles
+        mock_latest.return_value = (100.0, 101.0)
+        mock_orders.side_effect = lambda symbol, close, avg, book: events.append(("order", symbol))
+
+        instruments = [{"trading_symbol": s, "instrument_token": str(i)} for i, s in enumerate(["SLOW", "A", "B", "C"])]
+        summary = run_pipeline_sync(instruments, concurrency={"fetch": 4})
+
+        self.assertEqual(summary["completed"], 4)
+        self.assertEqual(summary["order"]["ok"], 4)
+        # Every fast instrument reached the order stage before the slow fetch returned
+        self.assertEqual(events.index(("fetched", "SLOW")), 6)
+        self.assertEqual(events[-1], ("order", "SLOW"))
+        mock_update.assert_any_call("A", [{"closed": 100.0, "trading_symbol": "A"}])
+
+    def test_failures_timeouts_and_skips_are_isolated(self, mock_fetch, mock_save, mock_update, mock_latest, mock_orders, mock_print):
+        def fake_fetch(instrument_token, trading_symbol, **kwargs):
+            if trading_symbol == "HANG":
+                time.sleep(0.5)
+            if trading_symbol == "BAD":
+                raise RuntimeError("boom")
+            if trading_symbol == "EMPTY":
+                return []
+            return [{"closed": 100.0}]
+
+        mock_fetch.side_effect = fake_fetch
+        mock_save.side_effect = lambda candles: None if candles is None else candles
+        mock_latest.side_effect = lambda symbol: None if symbol == "NOSTATS" else (100.0, 101.0)
+
+        instruments = [{"trading_symbol": s, "instrument_token": str(i)} for i, s in enumerate(["HANG", "BAD", "EMPTY", "NOSTATS", "OK"])]
+        started = time.monotonic()
+        summary = run_pipeline_sync(instruments, timeout=0.1, queue_size=1)
+
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(summary["fetch"], {"ok": 2, "skipped": 1, "failed": 1, "timed_out": 1})
+        self.assertEqual(summary["indicator"], {"ok": 1, "skipped": 1, "failed": 0, "timed_out": 0})
+        self.assertEqual(summary["completed"], 1)
+        mock_orders.assert_called_once_with("OK", 100.0, 101.0, None)
+
+    def test_partial_run_collects_results_in_input_order(self, mock_fetch, mock_save, mock_update, mock_latest, mock_orders, mock_print):
+        def fake_fetch(instrument_token, trading_symbol, **kwargs):
+            time.sleep(0.01 * (3 - int(instrument_token)))
+            return [{"closed": 100.0, "trading_symbol": trading_symbol}]
+
+        mock_fetch.side_effect = fake_fetch
+        mock_save.side_effect = lambda candles: candles
+        instruments = [{"trading_symbol": s, "instrument_token": str(i)} for i, s in enumerate(["A", "B", "C"])]
+
+        updated = src.pipeline.run_stages(instruments, ("fetch", "persist"), concurrency={"fetch": 3})
+
+        self.assertEqual([item["trading_symbol"] for item in updated], ["A", "B", "C"])
+        self.assertEqual(updated[0]["new_candles"], [{"closed": 100.0, "trading_symbol": "A"}])
+        mock_update.assert_not_called()
+        with self.assertRaises(ValueError):
+            run_pipeline_sync(instruments, only=("fetch", "indicator"))
+
+    def test_empty(self, mock_fetch, mock_save, mock_update, mock_latest, mock_orders, mock_print):
+        summary = run_pipeline_sync([])
+        self.assertEqual(summary["completed"], 0)
+        mock_fetch.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
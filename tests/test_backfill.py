@@ -0,0 +1,105 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import importlib
+
+UTC = timezone.utc
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        sys.modules.pop('src.backfill', None)
+        self.backfill = importlib.import_module('src.backfill')
+
+    def test_chunk_range_respects_kite_lookback(self):
+        start = datetime(2025, 1, 1, tzinfo=UTC)
+        end = start + timedelta(days=250)
+
+        chunks = self.backfill.chunk_range(start, end, "5minute")
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0], (start, start + timedelta(days=100)))
+        self.assertEqual(chunks[-1][1], end)
+        self.assertTrue(all(e - s <= timedelta(days=100) for s, e in chunks))
+
+    def test_subtract_ranges(self):
+        t = lambda h: datetime(2026, 1, 1, h, tzinfo=UTC)
+
+        result = self.backfill.subtract_ranges([(t(0), t(10))], [(t(2), t(4)), (t(6), t(10))])
+        self.assertEqual(result, [(t(0), t(2)), (t(4), t(6))])
+
+        # Leftovers no longer than a bar are dropped
+        result = self.backfill.subtract_ranges([(t(0), t(10))], [(t(0), t(9))], min_length=timedelta(hours=1))
+        self.assertEqual(result, [])
+
+    def test_find_missing_ranges(self):
+        cur = MagicMock()
+        start = datetime(2026, 1, 5, 0, 0, tzinfo=UTC)
+        end = datetime(2026, 1, 9, 0, 0, tzinfo=UTC)
+        first = datetime(2026, 1, 6, 3, 45, tzinfo=UTC)
+        last = datetime(2026, 1, 7, 9, 55, tzinfo=UTC)
+        hole = (datetime(2026, 1, 6, 5, 0, tzinfo=UTC), datetime(2026, 1, 6, 6, 0, tzinfo=UTC))
+
+        cur.fetchone.return_value = (first, last)
+        cur.fetchall.return_value = [hole]
+
+        ranges = self.backfill.find_missing_ranges(cur, "TEST", start, end, "5minute")
+
+        self.assertEqual(ranges, [(start, first), hole, (last, end)])
+        gap_query, params = cur.execute.call_args_list[1][0]
+        self.assertIn("LAG(timestamp)", gap_query)
+        self.assertIn("Asia/Kolkata", gap_query)
+        self.assertEqual(params[3], timedelta(minutes=5))
+
+    def test_find_missing_ranges_empty_symbol(self):
+        cur = MagicMock()
+        cur.fetchone.return_value = (None, None)
+        start = datetime(2026, 1, 5, tzinfo=UTC)
+        end = datetime(2026, 1, 9, tzinfo=UTC)
+
+        self.assertEqual(self.backfill.find_missing_ranges(cur, "TEST", start, end, "5minute"), [(start, end)])
+
+    def test_run_backfill_saves_checkpoints_and_recomputes(self):
+        start = datetime(2026, 1, 5, tzinfo=UTC)
+        good = {"trading_symbol": "GOOD", "instrument_token": "1"}
+        bad = {"trading_symbol": "BAD", "instrument_token": "2"}
+        plan = [
+            (good, start, start + timedelta(days=1)),
+            (bad, start, start + timedelta(days=1)),
+        ]
+
+        def fake_request(token, symbol, interval, from_date, to_date):
+            if symbol == "BAD":
+                raise self.backfill.KiteAPIError("Too many requests")
+            return [{"timestamp": "2026-01-05T09:15:00+0530", "closed": 100.0,
+                     "instrument_token": token, "trading_symbol": symbol}]
+
+        with patch.object(self.backfill, 'plan_backfill', return_value=plan), \
+             patch.object(self.backfill, 'request_historical_candles', side_effect=fake_request), \
+             patch.object(self.backfill, 'bulk_save_historical_data',
+                          side_effect=lambda candles: {"rows": len(candles), "inserted": len(candles), "skipped": 0}) as mock_save, \
+             patch.object(self.backfill, '_record_checkpoint') as mock_checkpoint, \
+             patch.object(self.backfill, 'update_running_average') as mock_sma:
+
+            summary = self.backfill.run_backfill([good, bad, good], start, start + timedelta(days=1))
+
+        self.assertEqual(summary, {"chunks": 2, "failed": 1, "inserted": 1, "symbols": 1})
+        mock_save.assert_called_once()
+        mock_checkpoint.assert_called_once_with("GOOD", "5minute", start, start + timedelta(days=1), 1)
+        mock_sma.assert_called_once_with("GOOD", [], full_recompute=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.backtest
+import src.optimizer
+from src.backtest import backtest, rolling_sma, load_candle_series
+from src.optimizer import run_sweep, format_table
+from src.orders import process_order_logic, decide_order_action, OPEN_SHORT
+from src.positions import PositionBook
+
+
+def naive_sma(closes, window):
+    return [round(sum(closes[max(0, i - window + 1):i + 1]) / (i + 1 - max(0, i - window + 1)), 2) for i in range(len(closes))]
+
+
+class TestBacktest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.closes = 100 + np.cumsum(rng.normal(0, 1, 3000))
+
+    def test_rolling_sma_matches_live_average(self):
+        self.assertEqual(list(rolling_sma(self.closes, 50)), naive_sma(list(self.closes), 50))
+
+    @patch('builtins.print')
+    def test_parity_with_order_logic(self, mock_print):
+        window = 50
+        closes = [float(c) for c in self.closes]
+        sma = naive_sma(closes, window)
+
+        # Feed the live per-tick logic candle by candle into an in-memory book
+        book = PositionBook()
+        for close, avg in zip(closes, sma):
+            process_order_logic("SYM", close, avg, book)
+
+        expected = [(o["order_type"], o["price"]) for o in book._new_orders]
+
+        result = backtest(self.closes, window=window)
+        actual = []
+        for trade in result["trades"]:
+            actual += [("SELL", trade["entry_price"]), ("BUY", trade["exit_price"])]
+        if result["open_position"]:
+            actual.append(("SELL", result["open_position"]["entry_price"]))
+
+        self.assertGreater(len(result["trades"]), 5)
+        self.assertEqual(actual, expected)
+        self.assertEqual({t["reason"] for t in result["trades"]}, {"reversal", "take_profit"})
+
+    def test_stop_loss_parity(self):
+        window, take_profit, stop_loss = 50, 0.03, 0.01
+        closes = [float(c) for c in self.closes]
+
+        expected, position = [], None
+        for close, avg in zip(closes, naive_sma(closes, window)):
+            action = decide_order_action(close, avg, position, take_profit, stop_loss)
+            if action == OPEN_SHORT:
+                position = {"price": close}
+            elif action:
+                expected.append((position["price"], close, action))
+                position = None
+
+        result = backtest(self.closes, window=window, take_profit=take_profit, stop_loss=stop_loss)
+
+        self.assertEqual([(t["entry_price"], t["exit_price"], t["reason"]) for t in result["trades"]], expected)
+        self.assertIn("stop_loss", {t["reason"] for t in result["trades"]})
+
+    def test_pnl_and_drawdown(self):
+        # Short at 90, 2 points up at 88, covered at 110 on the reversal
+        closes = np.array([100.0, 90.0, 88.0, 110.0])
+        result = backtest(closes, window=2, take_profit=0.5)
+
+        self.assertEqual(len(result["trades"]), 1)
+        trade = result["trades"][0]
+        self.assertEqual((trade["entry_index"], trade["exit_index"], trade["reason"]), (1, 3, "reversal"))
+        self.assertEqual(result["pnl"], -20.0)
+        self.assertEqual(result["win_rate"], 0.0)
+        self.assertEqual(result["max_drawdown"], 22.0)
+
+    def test_empty_series(self):
+        result = backtest(np.empty(0))
+        self.assertEqual((result["candles"], result["trades"], result["open_position"]), (0, [], None))
+
+    @patch('src.backtest.db_connection')
+    def test_load_candle_series(self, mock_db_connection):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [(1700000000, 100.5), (1700000300, 101.0)]
+
+        timestamps, closes = load_candle_series("SYM")
+
+        self.assertEqual(list(closes), [100.5, 101.0])
+        self.assertEqual(str(timestamps[1]), "2023-11-14T22:18:20")
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+
+
+
+class TestSweep(unittest.TestCase):
+    @patch('builtins.print')
+    @patch('src.optimizer.load_candle_series')
+    def test_sweep_matches_backtest(self, mock_load, mock_print):
+        rng = np.random.default_rng(3)
+        series = {
+            "A": 100 + np.cumsum(rng.normal(0, 1, 2000)),
+            "B": 500 + np.cumsum(rng.normal(0, 3, 1500)),
+            "EMPTY": np.empty(0)
+        }
+        mock_load.side_effect = lambda symbol: (None, series[symbol])
+
+        results = run_sweep(["A", "B", "EMPTY"], [20, 50], [0.01, 0.03], [None, 0.02], max_workers=2)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual([r["total_return"] for r in results], sorted((r["total_return"] for r in results), reverse=True))
+
+        row = next(r for r in results if (r["window"], r["take_profit"], r["stop_loss"]) == (50, 0.03, 0.02))
+        expected = [backtest(series[s], window=50, take_profit=0.03, stop_loss=0.02) for s in ("A", "B")]
+        self.assertEqual(row["symbols"], 2)
+        self.assertEqual(row["trades"], sum(len(e["trades"]) for e in expected))
+        self.assertAlmostEqual(row["total_return"], sum(t["return"] for e in expected for t in e["trades"]))
+
+        table = format_table(results, top=3)
+        self.assertEqual(len(table.splitlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
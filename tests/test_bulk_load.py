@@ -0,0 +1,123 @@
+import sys
+import os
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.bulk_load
+from src.bulk_load import _IteratorReader, _csv_chunks
+
+
+class TestStreaming(unittest.TestCase):
+    def test_reader_serves_exact_sizes(self):
+        reader = _IteratorReader(iter(["abc", "defgh", "", "ij"]))
+
+        self.assertEqual(reader.read(4), "abcd")
+        self.assertEqual(reader.read(2), "ef")
+        self.assertEqual(reader.read(), "ghij")
+        self.assertEqual(reader.read(8), "")
+
+    def test_csv_chunks_are_lazy_and_counted(self):
+        consumed = []
+
+        def rows():
+            for i in range(5):
+                consumed.append(i)
+                yield {"a": i, "b": None if i == 2 else f"x,{i}"}
+
+        counter = {"rows": 0}
+        chunks = _csv_chunks(rows(), ["a", "b"], counter, chunk_bytes=10)
+
+        first = next(chunks)
+        self.assertLess(len(consumed), 5, "Rows must be pulled on demand")
+
+        text = first + "".join(chunks)
+        self.assertEqual(counter["rows"], 5)
+        self.assertEqual(text.splitlines()[0], '0,"x,0"')
+        self.assertEqual(text.splitlines()[2], "2,")  # None -> NULL
+
+
+class TestCopyMerge(unittest.TestCase):
+    @patch('src.bulk_load.db_connection')
+    def test_copy_then_set_based_merge(self, mock_db_connection):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        copied = {}
+
+        def fake_copy(sql, stream):
+            copied["sql"] = sql
+            copied["data"] = stream.read()
+
+        mock_cursor.copy_expert.side_effect = fake_copy
+        mock_cursor.rowcount = 2
+
+        candles = (
+            {"timestamp": f"2026-01-05T09:{m:02d}:00+0530", "closed": 100.0 + m,
+             "instrument_token": "1", "trading_symbol": "TEST"}
+            for m in (15, 20, 25)
+        )
+        result = src.bulk_load.bulk_save_historical_data(candles)
+
+        self.assertEqual(result, {"rows": 3, "inserted": 2, "skipped": 1})
+        self.assertIn("COPY _stage_historical_candles", copied["sql"])
+        self.assertEqual(len(copied["data"].splitlines()), 3)
+
+        queries = [" ".join(c[0][0].split()) for c in mock_cursor.execute.call_args_list]
+        self.assertTrue(any(q.startswith("CREATE TEMP TABLE _stage_historical_candles ON COMMIT DROP") for q in queries))
+        self.assertTrue(any("ON CONFLICT (trading_symbol, timestamp) DO NOTHING" in q for q in queries))
+        mock_conn.commit.assert_called_once()
+
+    @patch('src.bulk_load.db_connection')
+    def test_failure_returns_none(self, mock_db_connection):
+        mock_conn = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value.copy_expert.side_effect = Exception("bad data")
+
+        self.assertIsNone(src.bulk_load.bulk_save_historical_data([{"trading_symbol": "NIFTY26JANFUT"}]))
+        mock_conn.rollback.assert_called()
+
+
+class TestSyncInstruments(unittest.TestCase):
+    @patch('src.bulk_load.db_connection')
+    def test_diff_counts_and_scope(self, mock_db_connection):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.copy_expert.side_effect = lambda sql, stream: stream.read()
+
+        # Closed versions: 2 (changed) and 9 (gone); opened: 2 (changed) and 4 (new)
+        mock_cursor.fetchall.side_effect = [[("2",), ("9",)], [("2",), ("4",)]]
+
+        records = [
+            {"instrument_token": t, "trading_symbol": f"NIFTY26{t}FUT", "name": "NIFTY",
+             "instrument_type": "FUT", "exchange_token": t, "exchange": "NFO"}
+            for t in ("1", "2", "4")
+        ]
+        result = src.bulk_load.sync_instruments(records, date(2026, 1, 6), scope_pattern="NIFTY%")
+
+        self.assertEqual(result, {"rows": 3, "added": 1, "changed": 1, "expired": 1})
+
+        update_sql, update_params = mock_cursor.execute.call_args_list[-2][0]
+        self.assertIn("UPDATE instruments_scd c SET valid_to = %s", update_sql)
+        self.assertIn("s.name IS NOT DISTINCT FROM c.name", update_sql)
+        self.assertEqual(update_params, (date(2026, 1, 6), "NIFTY%", "NIFTY%", True))
+
+        insert_sql, insert_params = mock_cursor.execute.call_args_list[-1][0]
+        self.assertIn("INSERT INTO instruments_scd", insert_sql)
+        self.assertEqual(insert_params, (date(2026, 1, 6),))
+        mock_conn.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.candle_store
+from src.candle_store import sync_store, load_candles, list_months, read_partition
+
+JAN = int(datetime(2025, 1, 31, 23, 0, tzinfo=timezone.utc).timestamp())
+FEB = int(datetime(2025, 2, 1, 0, 0, tzinfo=timezone.utc).timestamp())
+
+
+class TestCandleStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+
+        patcher = patch('src.candle_store.db_connection')
+        mock_db_connection = patcher.start()
+        mock_db_connection.return_value.__enter__.return_value = self.mock_conn
+        self.addCleanup(patcher.stop)
+
+        print_patcher = patch('builtins.print')
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def _sync(self, month_counts, *fetches):
+        self.mock_cursor.fetchall.side_effect = [month_counts, *fetches]
+        return sync_store(root=self.root)
+
+    def test_initial_sync_then_append_then_skip(self):
+        jan = [(JAN, 100.0), (JAN + 300, 101.0)]
+        feb = [(FEB, 102.0)]
+        summary = self._sync([("SYM", "2025-01", 2), ("SYM", "2025-02", 1)], jan, feb)
+
+        self.assertEqual(summary, {"months": 2, "appended": 0, "rewritten": 2, "candles": 3})
+        self.assertEqual(list_months("SYM", self.root), ["2025-01", "2025-02"])
+
+        # Only the newer February candle is fetched and appended
+        summary = self._sync([("SYM", "2025-01", 2), ("SYM", "2025-02", 2)], [(FEB + 300, 103.0)])
+        self.assertEqual(summary, {"months": 2, "appended": 1, "rewritten": 0, "candles": 1})
+        self.assertEqual(self.mock_cursor.execute.call_args[0][1][-1], FEB)
+
+        summary = self._sync([("SYM", "2025-01", 2), ("SYM", "2025-02", 2)])
+        self.assertEqual(summary["appended"] + summary["rewritten"], 0)
+
+        ts, closes = load_candles("SYM", root=self.root)
+        self.assertEqual(list(closes), [100.0, 101.0, 102.0, 103.0])
+        self.assertEqual(ts.dtype, np.dtype("datetime64[s]"))
+
+        ts, closes = load_candles("SYM", start=datetime(2025, 2, 1, tzinfo=timezone.utc), root=self.root)
+        self.assertEqual(list(closes), [102.0, 103.0])
+
+    def test_backfilled_gap_rewrites_month(self):
+        self._sync([("SYM", "2025-01", 2)], [(JAN, 100.0), (JAN + 600, 102.0)])
+
+        # The appended rows don't add up to the new count, so the month is reloaded
+        summary = self._sync([("SYM", "2025-01", 3)], [], [(JAN, 100.0), (JAN + 300, 101.0), (JAN + 600, 102.0)])
+
+        self.assertEqual(summary["rewritten"], 1)
+        self.assertEqual(list(read_partition("SYM", "2025-01", self.root)[1]), [100.0, 101.0, 102.0])
+
+    def test_torn_append_is_ignored(self):
+        self._sync([("SYM", "2025-01", 1)], [(JAN, 100.0)])
+        with open(os.path.join(self.root, "SYM", "2025-01.1.close"), "ab") as f:
+            f.write(np.array([999.0]).tobytes())
+
+        ts, closes = read_partition("SYM", "2025-01", self.root)
+        self.assertEqual((len(ts), list(closes)), (1, [100.0]))
+
+    def test_rewrite_is_committed_by_the_manifest(self):
+        self._sync([("SYM", "2025-01", 2)], [(JAN, 100.0), (JAN + 600, 102.0)])
+
+        # Dies after writing the new columns but before the manifest: the old month stays visible
+        with patch('src.candle_store._write_manifest', side_effect=OSError("disk full")):
+            self.assertIsNone(self._sync([("SYM", "2025-01", 3)], [], [(JAN, 1.0), (JAN + 300, 2.0), (JAN + 600, 3.0)]))
+        self.assertEqual(list(read_partition("SYM", "2025-01", self.root)[1]), [100.0, 102.0])
+
+        self._sync([("SYM", "2025-01", 3)], [], [(JAN, 100.0), (JAN + 300, 101.0), (JAN + 600, 102.0)])
+        self.assertEqual(list(read_partition("SYM", "2025-01", self.root)[1]), [100.0, 101.0, 102.0])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "SYM"))), ["2025-01.2.close", "2025-01.2.ts", "2025-01.json"])
+
+    def test_rejects_unsafe_symbol(self):
+        with self.assertRaises(ValueError):
+            load_candles("../etc", root=self.root)
+
+    def test_db_unavailable(self):
+        src.candle_store.db_connection.return_value.__enter__.return_value = None
+        self.assertIsNone(sync_store(root=self.root))
+
+
+if __name__ == '__main__':
+    unittest.main()
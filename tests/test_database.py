@@ -57,7 +57,8 @@ class TestDatabaseSave(unittest.TestCase):
         insert_query = """
         INSERT INTO historical_candles (timestamp, closed, instrument_token, trading_symbol)
         VALUES %s
-        ON CONFLICT (trading_symbol, timestamp) DO NOTHING;
+        ON CONFLICT (trading_symbol, timestamp) DO NOTHING
+        RETURNING timestamp, closed, instrument_token, trading_symbol;
         """
         
         mock_execute_values.assert_called_once()
@@ -74,5 +75,41 @@ class TestDatabaseSave(unittest.TestCase):
 
         print("DB Verification Passed: Correctly used ON CONFLICT DO NOTHING")
 
+class TestReversePosition(unittest.TestCase):
+    def setUp(self):
+        if 'src.database' in sys.modules:
+            del sys.modules['src.database']
+        import src.database
+
+    @patch('src.database.ensure_schema')
+    @patch('src.database.psycopg2')
+    def test_single_statement_single_commit(self, mock_psycopg2, mock_ensure_schema):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1, 2, None)
+
+        result = src.database.reverse_position(1, "TEST", 105.0, close=105.0, avg_200=100.0)
+
+        self.assertEqual(result, {"closed_id": 1, "buy_id": 2, "entry_id": None})
+        query, params = mock_cursor.execute.call_args[0]
+        query = " ".join(query.split())
+        self.assertIn("WITH closed AS ( UPDATE orders SET status = 'completed' WHERE id = %s AND status = 'created'", query)
+        self.assertIn("SELECT 'BUY', %s, %s, %s, %s, 'completed', %s FROM closed", query)
+        self.assertEqual(params[0], 1)
+        mock_conn.commit.assert_called_once()
+
+    @patch('src.database.psycopg2')
+    def test_already_closed_sell_is_a_no_op(self, mock_psycopg2):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (None, None, None)
+
+        self.assertIsNone(src.database.reverse_position(1, "TEST", 105.0))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.database
+
+
+def make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        if 'src.database' in sys.modules:
+            del sys.modules['src.database']
+        import src.database
+
+    @patch('src.database.psycopg2')
+    def test_connection_is_reused(self, mock_psycopg2):
+        mock_psycopg2.connect.side_effect = lambda **kwargs: make_conn()
+        pool = src.database.ConnectionPool(minconn=0, maxconn=2)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(mock_psycopg2.connect.call_count, 1)
+        first.rollback.assert_called()
+
+    @patch('src.database.psycopg2')
+    def test_closed_connection_is_replaced(self, mock_psycopg2):
+        mock_psycopg2.connect.side_effect = lambda **kwargs: make_conn()
+        pool = src.database.ConnectionPool(minconn=1, maxconn=1)
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.closed = 1  # Server dropped the connection while idle
+
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(mock_psycopg2.connect.call_count, 2)
+
+    @patch('src.database.psycopg2')
+    def test_stale_connection_is_health_checked(self, mock_psycopg2):
+        mock_psycopg2.connect.side_effect = lambda **kwargs: make_conn()
+        pool = src.database.ConnectionPool(minconn=1, maxconn=1, healthcheck_seconds=0)
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = Exception("server closed the connection")
+
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        conn.close.assert_called_once()
+
+    @patch('src.database.psycopg2')
+    def test_exhausted_pool_times_out(self, mock_psycopg2):
+        mock_psycopg2.connect.side_effect = lambda **kwargs: make_conn()
+        pool = src.database.ConnectionPool(minconn=0, maxconn=1)
+
+        pool.getconn()
+        with self.assertRaises(src.database.PoolExhaustedError):
+            pool.getconn(timeout=0.01)
+
+    @patch('src.database.psycopg2')
+    def test_db_connection_yields_none_on_failure(self, mock_psycopg2):
+        mock_psycopg2.connect.side_effect = Exception("connection refused")
+
+        with src.database.db_connection() as conn:
+            self.assertIsNone(conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
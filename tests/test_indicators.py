@@ -0,0 +1,97 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.indicators
+from src.indicators import compute_indicators, parse_indicator_spec, required_lookback, register_indicator
+
+
+class TestIndicatorMath(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.closes = 100 + np.cumsum(rng.normal(0, 1, 300))
+
+    def test_sma_std_bbands(self):
+        values = compute_indicators(self.closes, ["sma_20", "std_20", "bbands_20"])
+
+        window = self.closes[-20:]
+        self.assertAlmostEqual(values["sma_20"], window.mean())
+        self.assertAlmostEqual(values["std_20"], window.std())
+        self.assertAlmostEqual(values["bbands_20_middle"], window.mean())
+        self.assertAlmostEqual(values["bbands_20_upper"], window.mean() + 2 * window.std())
+        self.assertAlmostEqual(values["bbands_20_lower"], window.mean() - 2 * window.std())
+
+    def test_ema_matches_recursive_definition(self):
+        period = 10
+        series = self.closes[-3 * period:]
+        alpha = 2.0 / (period + 1)
+        ema = series[:period].mean()
+        for price in series[period:]:
+            ema = alpha * price + (1 - alpha) * ema
+
+        values = compute_indicators(series, ["ema_10"])
+        self.assertAlmostEqual(values["ema_10"], ema)
+
+    def test_insufficient_data_and_missing_volume_are_skipped(self):
+        values = compute_indicators(self.closes[:5], ["sma_20", "vwap_5"])
+        self.assertEqual(values, {})
+
+        volumes = np.ones(5)
+        values = compute_indicators(self.closes[:5], ["vwap_5"], volumes=volumes)
+        self.assertAlmostEqual(values["vwap_5"], self.closes[:5].mean())
+
+    def test_spec_parsing_and_lookback(self):
+        self.assertEqual(parse_indicator_spec("ema_50"), ("ema", 50))
+        self.assertEqual(required_lookback(["sma_200", "ema_50"]), 200)
+        self.assertEqual(required_lookback(["ema_100"]), 300)
+        with self.assertRaises(ValueError):
+            parse_indicator_spec("macd_12")
+        with self.assertRaises(ValueError):
+            parse_indicator_spec("sma_x")
+
+    def test_registering_a_new_kind(self):
+        @register_indicator("max")
+        def _max(closes, period, volumes=None):
+            return {"": float(closes[-period:].max())}
+
+        values = compute_indicators(self.closes, ["max_30"])
+        self.assertEqual(values["max_30"], self.closes[-30:].max())
+
+
+class TestUpdateIndicators(unittest.TestCase):
+    @patch('src.indicators.execute_values')
+    @patch('src.indicators.get_recent_closes_bulk')
+    @patch('src.indicators.db_connection')
+    def test_single_read_and_upsert(self, mock_db_connection, mock_recent, mock_execute_values):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        mock_recent.return_value = {"A": ([1.0, 2.0, 3.0], "t3"), "B": ([10.0, 20.0, 30.0], "t3")}
+
+        results = src.indicators.update_indicators(["A", "B"], specs=["sma_2", "sma_3"])
+
+        # One read of the longest lookback through the shared closes query
+        mock_recent.assert_called_once_with(["A", "B"], 3)
+
+        self.assertEqual(results["A"], {"sma_2": 2.5, "sma_3": 2.0})
+        self.assertEqual(results["B"], {"sma_2": 25.0, "sma_3": 20.0})
+
+        rows = mock_execute_values.call_args[0][2]
+        self.assertIn(("A", "sma_2", 2.5, "t3"), rows)
+        self.assertEqual(len(rows), 4)
+        mock_conn.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
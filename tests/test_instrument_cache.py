@@ -0,0 +1,157 @@
+import sys
+import os
+import importlib
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import instrument_cache
+from src.instrument_cache import InstrumentSnapshot, like_to_regex
+
+DUMP = (
+    "instrument_token,exchange_token,tradingsymbol,name,last_price,expiry,strike,tick_size,lot_size,instrument_type,segment,exchange\n"
+    "3,33,NIFTY26FEBFUT,NIFTY,0,,0,0.05,75,FUT,NFO-FUT,NFO\n"
+    "1,11,BANKNIFTY26JANFUT,BANKNIFTY,0,,0,0.05,30,FUT,NFO-FUT,NFO\n"
+    "2,22,NIFTY26JANFUT,NIFTY,0,,0,0.05,75,FUT,NFO-FUT,NFO\n"
+    "4,44,NIFTY26JAN20000CE,NIFTY,0,,20000,0.05,75,CE,NFO-OPT,NFO\n"
+)
+
+
+class TestInstrumentSnapshot(unittest.TestCase):
+    def setUp(self):
+        records = [
+            {"trading_symbol": s, "instrument_token": t, "name": "N", "instrument_type": "FUT", "exchange_token": t, "exchange": "NFO"}
+            for s, t in [("NIFTY26FEBFUT", "3"), ("BANKNIFTY26JANFUT", "1"), ("NIFTY26JANFUT", "2"), ("NIFTYNXT26JANFUT", "5")]
+        ]
+        self.snapshot = InstrumentSnapshot.from_records(date(2026, 1, 5), records, etag='"abc"')
+
+    def test_lookup_uses_prefix_and_wildcards(self):
+        self.assertEqual([r["trading_symbol"] for r in self.snapshot.lookup("NIFTY26%")], ["NIFTY26FEBFUT", "NIFTY26JANFUT"])
+        self.assertEqual([r["trading_symbol"] for r in self.snapshot.lookup("%JANFUT")],
+                         ["BANKNIFTY26JANFUT", "NIFTY26JANFUT", "NIFTYNXT26JANFUT"])
+        self.assertEqual(self.snapshot.lookup("NIFTY26MAR%"), [])
+
+        record = self.snapshot.lookup("NIFTY26JANFUT")[0]
+        self.assertEqual(record["instrument_token"], "2")
+        self.assertEqual(record["date"], "2026-01-05")
+
+    def test_round_trip(self):
+        blob = self.snapshot.to_bytes()
+        restored = InstrumentSnapshot.from_bytes(blob)
+
+        self.assertEqual(restored.rows, self.snapshot.rows)
+        self.assertEqual(restored.etag, '"abc"')
+        self.assertEqual(restored.trading_date, date(2026, 1, 5))
+        with self.assertRaises(ValueError):
+            InstrumentSnapshot.from_bytes(b"garbage")
+
+    def test_ist_today_is_ahead_of_utc_late_evening(self):
+        utc_evening = datetime(2026, 1, 5, 20, 0, tzinfo=timezone.utc)
+        with patch.object(instrument_cache, 'datetime') as mock_datetime:
+            mock_datetime.now.side_effect = lambda tz: utc_evening.astimezone(tz)
+            self.assertEqual(instrument_cache.ist_today(), date(2026, 1, 6))
+
+    def test_like_pattern_translation(self):
+        match = like_to_regex("NIFTY2_J%FUT").match
+        self.assertTrue(match("NIFTY26JANFUT"))
+        self.assertFalse(match("NIFTY26JANFUT.X"))
+        self.assertFalse(match("BANKNIFTY26JANFUT"))
+        self.assertTrue(like_to_regex("A.B%").match("A.BC"))
+        self.assertFalse(like_to_regex("A.B%").match("AXBC"))
+
+
+class TestSnapshotDownload(unittest.TestCase):
+    def setUp(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        self.kite_api = importlib.import_module('src.kite_api')
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            patch.object(instrument_cache, 'INSTRUMENT_CACHE_DIR', self.cache_dir.name),
+            patch.object(self.kite_api, 'KITE_API_KEY', 'key'),
+            patch.object(self.kite_api, 'get_rate_limiter'),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.cache_dir.cleanup()
+
+    def _response(self, status_code, body=b"", headers=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.raw = BytesIO(body)
+        response.headers = headers or {}
+        return response
+
+    @patch('src.kite_api.get_http_session')
+    def test_downloads_once_then_revalidates(self, mock_session):
+        get = mock_session.return_value.get
+        get.return_value = self._response(200, DUMP.encode(), {"ETag": '"v1"', "Last-Modified": "Mon, 05 Jan 2026 02:00:00 GMT"})
+
+        first = self.kite_api.fetch_instrument_snapshot(date(2026, 1, 5))
+        self.assertEqual(first.symbols, ["BANKNIFTY26JANFUT", "NIFTY26FEBFUT", "NIFTY26JANFUT"])
+        self.assertNotIn("If-None-Match", get.call_args[1]["headers"])
+
+        # Same trading date: served from disk, no request
+        again = self.kite_api.fetch_instrument_snapshot(date(2026, 1, 5))
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(again.rows, first.rows)
+
+        # Next trading date: conditional request, 304 carries the rows forward
+        get.return_value = self._response(304)
+        nextday = self.kite_api.fetch_instrument_snapshot(date(2026, 1, 6))
+
+        headers = get.call_args[1]["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], "Mon, 05 Jan 2026 02:00:00 GMT")
+        self.assertEqual(nextday.trading_date, date(2026, 1, 6))
+        self.assertEqual(nextday.rows, first.rows)
+        self.assertIsNotNone(instrument_cache.load_snapshot(date(2026, 1, 6)))
+
+    @patch('src.kite_api.get_http_session')
+    def test_unsolicited_304_refetches_instead_of_saving_empty(self, mock_session):
+        get = mock_session.return_value.get
+        get.side_effect = [self._response(304), self._response(200, DUMP.encode())]
+
+        snapshot = self.kite_api.fetch_instrument_snapshot(date(2026, 1, 5))
+
+        self.assertEqual(len(snapshot), 3)
+        self.assertNotIn("If-None-Match", get.call_args_list[0][1]["headers"])
+        self.assertEqual(get.call_args_list[1][1]["headers"]["Cache-Control"], "no-cache")
+
+        # A second 304 leaves nothing on disk rather than an empty snapshot
+        get.side_effect = [self._response(304), self._response(304)]
+        self.assertIsNone(self.kite_api.fetch_instrument_snapshot(date(2026, 1, 4)))
+        self.assertIsNone(instrument_cache.load_snapshot(date(2026, 1, 4)))
+
+    @patch('src.kite_api.get_http_session')
+    def test_fetch_instruments_streams_without_snapshot(self, mock_session):
+        mock_session.return_value.get.return_value = self._response(200, DUMP.encode())
+
+        instruments = self.kite_api.fetch_instruments(pattern="NIFTY26%")
+
+        # Filtered while parsing, in dump order, and no snapshot is written
+        self.assertEqual([i["trading_symbol"] for i in instruments], ["NIFTY26FEBFUT", "NIFTY26JANFUT"])
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    @patch('src.kite_api.get_http_session')
+    def test_fetch_instruments_serves_pattern_from_snapshot(self, mock_session):
+        mock_session.return_value.get.return_value = self._response(200, DUMP.encode())
+        self.kite_api.fetch_instrument_snapshot(instrument_cache.ist_today())
+        mock_session.return_value.get.reset_mock()
+
+        instruments = self.kite_api.fetch_instruments(pattern="NIFTY26%")
+
+        self.assertEqual([i["trading_symbol"] for i in instruments], ["NIFTY26FEBFUT", "NIFTY26JANFUT"])
+        mock_session.return_value.get.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
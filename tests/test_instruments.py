@@ -2,7 +2,12 @@ import unittest
 import sys
 import os
 from unittest.mock import MagicMock, patch
-from io import StringIO
+from io import BytesIO, StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import tempfile
+import threading
+import requests
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from datetime import date
 
@@ -23,8 +28,13 @@ class TestInstruments(unittest.TestCase):
             del sys.modules['src.database']
         import src.database
     
-    @patch('requests.get')
-    def test_fetch_instruments(self, mock_get):
+    @patch('src.instrument_cache.INSTRUMENT_CACHE_DIR', os.path.join(tempfile.mkdtemp(), "instruments"))
+    def test_fetch_instruments(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        # so the session patched below is the one fetch_instruments() uses
+        sys.modules.pop('src.kite_api', None)
+        kite_api = importlib.import_module('src.kite_api')
+
         # Mock API response
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -34,32 +44,124 @@ class TestInstruments(unittest.TestCase):
 123456,789,ACC,ACC Ltd,1000.0,,0,0.05,1,FUT,NSE,NSE
 654321,987,INFY,Infosys,1500.0,,0,0.05,1,EQ,NSE,NSE
 """
-        mock_response.text = csv_data
-        mock_get.return_value = mock_response
+        mock_response.raw = BytesIO(csv_data.encode())
+        mock_response.headers = {}
         
-        # Set env var
-        with patch.dict('os.environ', {'KITE_API_KEY': 'test_token'}):
-            instruments = fetch_instruments()
+        with patch.object(kite_api, 'KITE_API_KEY', 'test_token'), \
+             patch.object(kite_api, 'KITE_AUTH_TOKEN', 'test_token'), \
+             patch.object(kite_api, 'get_rate_limiter'), \
+             patch.object(kite_api, 'get_http_session') as mock_session:
+            mock_session.return_value.get.return_value = mock_response
+            instruments = kite_api.fetch_instruments()
             
         self.assertEqual(len(instruments), 1)
         self.assertEqual(instruments[0]['trading_symbol'], 'ACC')
         self.assertEqual(instruments[0]['instrument_token'], '123456')
         self.assertEqual(instruments[0]['instrument_type'], 'FUT')
 
-    @patch('src.database.psycopg2')
-    @patch('src.database.execute_values')
-    def test_save_instruments(self, mock_execute_values, mock_psycopg2):
-        # Mock DB
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_psycopg2.connect.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        
-        # Test Data
-        current_date = date.today().isoformat()
+    def test_iter_instruments_streams_and_filters(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        kite_api = importlib.import_module('src.kite_api')
+
+        header = "instrument_token,exchange_token,tradingsymbol,name,last_price,expiry,strike,tick_size,lot_size,instrument_type,segment,exchange\n"
+        rows = [
+            "1,11,NIFTY26JANFUT,NIFTY,0,,0,0.05,75,FUT,NFO-FUT,NFO\n",
+            "2,22,NIFTY26JAN20000CE,NIFTY,0,,20000,0.05,75,CE,NFO-OPT,NFO\n",
+            "3,33,BANKNIFTY26JANFUT,BANKNIFTY,0,,0,0.05,30,FUT,NFO-FUT,NFO\n",
+            "4,44,GOLD26FEBFUT,GOLD,0,,0,1,1,FUT,MCX-FUT,MCX\n",
+        ]
+        body = gzip.compress((header + "".join(rows)).encode())
+
+        # A real socket, so the parser reads a genuine urllib3 response to EOF
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        local_url = f"http://127.0.0.1:{server.server_address[1]}/instruments"
+
+        requested = []
+
+        def local_get(endpoint, url, **kwargs):
+            requested.append(kwargs)
+            return requests.get(local_url, **kwargs)
+
+        with patch.object(kite_api, 'KITE_API_KEY', 'key'), \
+             patch.object(kite_api, '_rate_limited_get', side_effect=local_get):
+            stream = kite_api.iter_instruments(exchanges=["NFO"], pattern="NIFTY26%")
+            self.assertEqual(requested, [], "Nothing should be fetched until iterated")
+            records = list(stream)
+
+        self.assertTrue(requested[0]["stream"])
+        self.assertEqual([r["trading_symbol"] for r in records], ["NIFTY26JANFUT"])
+        self.assertEqual(records[0]["instrument_token"], "1")
+        self.assertEqual(records[0]["date"], kite_api.ist_today().isoformat())
+
+    def test_fetch_instrument_snapshot_over_socket(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        kite_api = importlib.import_module('src.kite_api')
+
+        header = "instrument_token,exchange_token,tradingsymbol,name,last_price,expiry,strike,tick_size,lot_size,instrument_type,segment,exchange\n"
+        rows = [
+            "1,11,NIFTY26JANFUT,NIFTY,0,,0,0.05,75,FUT,NFO-FUT,NFO\n",
+            "2,22,NIFTY26JAN20000CE,NIFTY,0,,20000,0.05,75,CE,NFO-OPT,NFO\n",
+            "3,33,BANKNIFTY26JANFUT,BANKNIFTY,0,,0,0.05,30,FUT,NFO-FUT,NFO\n",
+        ]
+        body = gzip.compress((header + "".join(rows)).encode())
+
+        # A real socket, so the parser reads a genuine urllib3 response to EOF
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        local_url = f"http://127.0.0.1:{server.server_address[1]}/instruments"
+
+        requested = []
+
+        def local_get(endpoint, url, **kwargs):
+            requested.append(kwargs)
+            return requests.get(local_url, **kwargs)
+
+        with patch('src.instrument_cache.INSTRUMENT_CACHE_DIR', os.path.join(tempfile.mkdtemp(), "instruments")), \
+             patch.object(kite_api, 'KITE_API_KEY', 'key'), \
+             patch.object(kite_api, '_rate_limited_get', side_effect=local_get):
+            snapshot = kite_api.fetch_instrument_snapshot(date(2026, 1, 5))
+
+        self.assertTrue(requested[0]["stream"])
+        self.assertEqual(snapshot.etag, '"v1"')
+        self.assertEqual(sorted(snapshot.symbols), ["BANKNIFTY26JANFUT", "NIFTY26JANFUT"])
+        self.assertEqual(snapshot.lookup("NIFTY26%")[0]["instrument_token"], "1")
+
+    @patch('src.bulk_load.sync_instruments')
+    def test_save_instruments(self, mock_sync):
+        # Deprecated wrapper: delegates to the SCD sync without expiring missing contracts
         data = [
             {
-                "date": current_date,
+                "date": "2026-01-05",
                 "instrument_token": "123456",
                 "trading_symbol": "ACC",
                 "name": "ACC Ltd",
@@ -68,41 +170,31 @@ class TestInstruments(unittest.TestCase):
                 "exchange": "NSE"
             }
         ]
-        
+
         src.database.save_instruments(data)
-        
-        # Verify INSERT for single item
-        insert_query = """
-        INSERT INTO instruments (date, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange)
-        VALUES %s
-        ON CONFLICT (date, trading_symbol) DO NOTHING;
-        """
-        
-        args = mock_execute_values.call_args
-        self.assertIsNotNone(args)
-        # Normalize whitespace for comparison
-        self.assertEqual(" ".join(args[0][1].split()), " ".join(insert_query.split()))
-        self.assertEqual(args[0][2], [
-            (current_date, "ACC", "123456", "ACC Ltd", "EQ", "789", "NSE")
-        ])
-        
-        print("Instruments Verification Passed.")
-        
-        # --- Test Batching ---
-        # New Test Data for Batching
-        data_batch = [
-            {"date": current_date, "trading_symbol": "A", "instrument_token": "1", "name": "A", "instrument_type": "EQ", "exchange_token": "1", "exchange": "NSE"},
-            {"date": current_date, "trading_symbol": "B", "instrument_token": "2", "name": "B", "instrument_type": "EQ", "exchange_token": "2", "exchange": "NSE"}
-        ]
-        
-        # Reset mock to clear previous calls
-        mock_execute_values.reset_mock()
-        
-        src.database.save_instruments(data_batch, batch_size=1)
-        
-        # Should be called twice (once per item)
-        self.assertEqual(mock_execute_values.call_count, 2)
-        print("Batching Verification Passed.")
+
+        mock_sync.assert_called_once_with(data, date(2026, 1, 5), expire=False)
+
+        mock_sync.reset_mock()
+        src.database.save_instruments([])
+        mock_sync.assert_not_called()
+
+    @patch('src.database.psycopg2')
+    def test_check_instruments_exist(self, mock_psycopg2):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1,)
+
+        self.assertTrue(src.database.check_instruments_exist("2026-01-05"))
+
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertEqual(" ".join(query.split()), "SELECT 1 FROM instruments_current WHERE valid_from <= %s LIMIT 1;")
+        self.assertEqual(params, ("2026-01-05",))
+
+        mock_cursor.fetchone.return_value = None
+        self.assertFalse(src.database.check_instruments_exist("2026-01-05"))
 
     @patch('src.database.psycopg2')
     def test_get_instruments_by_pattern(self, mock_psycopg2):
@@ -129,16 +221,17 @@ class TestInstruments(unittest.TestCase):
         
         # Verify Query
         expected_query = """
-        SELECT date, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange
-        FROM instruments
-        WHERE trading_symbol LIKE %s AND date = %s;
+        SELECT valid_from, trading_symbol, instrument_token, name, instrument_type, exchange_token, exchange
+        FROM instruments_current
+        WHERE trading_symbol LIKE %s
+        ORDER BY trading_symbol;
         """
         
         # Check execution
         args = mock_cursor.execute.call_args
         self.assertIsNotNone(args, "Execute was not called")
         self.assertEqual(" ".join(args[0][0].split()), " ".join(expected_query.split()))
-        self.assertEqual(args[0][1], (pattern, current_date_str))
+        self.assertEqual(args[0][1], (pattern,))
         
         # Verify Results
         self.assertEqual(len(results), 2)
@@ -148,5 +241,44 @@ class TestInstruments(unittest.TestCase):
         
         print("Pattern Fetch Verification Passed.")
 
+        # Repeated lookups on the same trading day are served from memory
+        mock_cursor.execute.reset_mock()
+        again = src.database.get_instruments_by_pattern(pattern)
+        self.assertEqual(again, results)
+        mock_cursor.execute.assert_not_called()
+
+        src.database.clear_instrument_cache()
+        src.database.get_instruments_by_pattern(pattern)
+        self.assertIn("FROM instruments_current", mock_cursor.execute.call_args[0][0])
+
+        # The cache rolls over with the IST trading date, not the host's (UTC) date
+        mock_cursor.execute.reset_mock()
+        with patch('src.database.ist_today', return_value=date(2099, 1, 1)):
+            src.database.get_instruments_by_pattern(pattern)
+        mock_cursor.execute.assert_called_once()
+
+    @patch('src.database.psycopg2')
+    def test_get_instruments_by_pattern_as_of_date(self, mock_psycopg2):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = []
+
+        results = src.database.get_instruments_by_pattern("NIFTY26%", "2026-01-05")
+
+        query, params = mock_cursor.execute.call_args[0]
+        query = " ".join(query.split())
+        self.assertIn("SELECT DISTINCT ON (instrument_token)", query)
+        self.assertIn("FROM instruments_scd", query)
+        self.assertIn("valid_from <= %s AND (valid_to IS NULL OR valid_to > %s)", query)
+        self.assertEqual(params, ("NIFTY26%", "2026-01-05", "2026-01-05"))
+        self.assertEqual(results, [])
+
+        # Empty results are not cached, so a later sync is picked up
+        src.database.get_instruments_by_pattern("NIFTY26%", "2026-01-05")
+        lookups = [c for c in mock_cursor.execute.call_args_list if "instruments_scd" in c[0][0]]
+        self.assertEqual(len(lookups), 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,43 @@
+import sys
+import os
+import importlib
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class TestKiteSession(unittest.TestCase):
+    def setUp(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        self.kite_api = importlib.import_module('src.kite_api')
+
+    def test_session_is_shared_and_configured(self):
+        session = self.kite_api.get_http_session()
+
+        self.assertIs(session, self.kite_api.get_http_session())
+        self.assertIn("gzip", session.headers["Accept-Encoding"])
+
+        adapter = session.get_adapter("https://api.kite.trade/instruments")
+        self.assertEqual(adapter._pool_maxsize, max(self.kite_api.FETCH_WORKERS, 1))
+        self.assertEqual(adapter.max_retries.total, self.kite_api.KITE_HTTP_RETRIES)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertNotIn(429, adapter.max_retries.status_forcelist)
+
+    @patch('src.kite_api.get_rate_limiter')
+    @patch('src.kite_api.get_http_session')
+    def test_requests_carry_timeouts(self, mock_session, mock_get_limiter):
+        response = MagicMock()
+        response.status_code = 200
+        mock_session.return_value.get.return_value = response
+
+        self.kite_api._rate_limited_get("historical", "https://api.kite.trade/x", params={"a": 1})
+
+        kwargs = mock_session.return_value.get.call_args[1]
+        self.assertEqual(kwargs["timeout"], (self.kite_api.KITE_CONNECT_TIMEOUT, self.kite_api.KITE_READ_TIMEOUT))
+        self.assertEqual(kwargs["params"], {"a": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import lambda_function
+
+
+@patch('builtins.print')
+@patch('main.process_orders_for_instruments')
+@patch('main.update_sma_for_instruments')
+@patch('main.fetch_and_save_historical_data')
+@patch('main.ensure_target_instruments_exist')
+class TestLambdaWarmState(unittest.TestCase):
+    def setUp(self):
+        lambda_function._warm.update({"started": None, "targets": {}, "last_candle": {}})
+
+    def test_warm_invocation_reuses_targets_and_skips_stored_candles(self, mock_ensure, mock_fetch, mock_sma, mock_orders, mock_print):
+        targets = [{"trading_symbol": "A", "instrument_token": "1"}, {"trading_symbol": "B", "instrument_token": "2"}]
+        mock_ensure.return_value = targets
+        # The current candle for A is stored by the first run; B returned nothing
+        current = datetime.now(timezone.utc)
+        mock_fetch.return_value = [{**targets[0], "new_candles": [{"timestamp": current, "closed": 100.0}]}]
+
+        self.assertEqual(lambda_function.lambda_handler({}, None)['statusCode'], 200)
+        self.assertEqual(lambda_function.lambda_handler({}, None)['statusCode'], 200)
+
+        mock_ensure.assert_called_once()
+        self.assertEqual(mock_fetch.call_args_list[0].args[0], targets)
+        self.assertEqual(mock_fetch.call_args_list[1].args[0], [targets[1]])
+
+        # Once the candle is older than the fetch window, A is fetched again
+        lambda_function._warm["last_candle"]["A"] = current - timedelta(minutes=5)
+        lambda_function.lambda_handler({}, None)
+        self.assertEqual(mock_fetch.call_args_list[2].args[0], targets)
+
+    @patch('src.pipeline.run_pipeline_sync')
+    @patch('src.config.PIPELINE_MODE', 'async')
+    def test_async_mode_uses_warm_candles(self, mock_run, mock_ensure, mock_fetch, mock_sma, mock_orders, mock_print):
+        targets = [{"trading_symbol": "A", "instrument_token": "1"}, {"trading_symbol": "B", "instrument_token": "2"}]
+        mock_ensure.return_value = targets
+        current = datetime.now(timezone.utc)
+
+        def run(instruments, results):
+            results.append({**targets[0], "new_candles": [{"timestamp": current, "closed": 100.0}]})
+            return {"instruments": len(instruments), "completed": 1}
+
+        mock_run.side_effect = run
+
+        lambda_function.lambda_handler({}, None)
+        lambda_function.lambda_handler({}, None)
+
+        self.assertEqual(mock_run.call_args_list[0].args[0], targets)
+        self.assertEqual(mock_run.call_args_list[1].args[0], [targets[1]])
+        mock_fetch.assert_not_called()
+
+    @patch('src.kite_api.close_http_session')
+    @patch('src.database.close_pool')
+    def test_expired_warm_state_is_rebuilt(self, mock_close_pool, mock_close_session, mock_ensure, mock_fetch, mock_sma, mock_orders, mock_print):
+        mock_ensure.return_value = [{"trading_symbol": "A", "instrument_token": "1"}]
+        mock_fetch.return_value = []
+
+        lambda_function.lambda_handler({}, None)
+        mock_close_pool.assert_not_called()
+
+        with patch('src.config.LAMBDA_WARM_TTL_SECONDS', 0):
+            lambda_function.lambda_handler({}, None)
+
+        mock_close_pool.assert_called_once()
+        mock_close_session.assert_called_once()
+        self.assertEqual(mock_ensure.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import json
+import unittest
+import urllib.request
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+from src import metrics
+
+
+@metrics.timed("test.fetch", label_args=("trading_symbol",), count_rows=True, none_is_error=True)
+def fetch(token, trading_symbol, fail=False):
+    if fail:
+        raise RuntimeError("boom")
+    return None if token == "missing" else [1, 2, 3]
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+        self.addCleanup(metrics.enable, False)
+        self.addCleanup(metrics.reset)
+
+    def _counter(self, name, **labels):
+        for c in metrics.snapshot()["counters"]:
+            if c["name"] == name and c["labels"] == {k: str(v) for k, v in labels.items()}:
+                return c["value"]
+        return None
+
+    def test_decorator_records_latency_rows_and_errors(self):
+        fetch("1", "A")
+        fetch("2", trading_symbol="A")
+        fetch("missing", "B")
+        with self.assertRaises(RuntimeError):
+            fetch("3", "B", fail=True)
+
+        histograms = {h["labels"]["trading_symbol"]: h for h in metrics.snapshot()["histograms"]}
+        self.assertEqual(histograms["A"]["count"], 2)
+        self.assertEqual(sum(histograms["A"]["buckets"]), 2)
+        self.assertEqual(self._counter("test.fetch.rows", trading_symbol="A"), 6)
+        self.assertEqual(self._counter("test.fetch.errors", trading_symbol="B"), 2)
+
+    def test_timer_and_formats(self):
+        with metrics.timer("test.stage", stage="fetch") as t:
+            t.rows = 4
+        metrics.observe("test.stage", 30.0, stage="fetch")
+
+        line = json.loads(metrics.to_json_lines()[0])
+        self.assertEqual((line["metric"], line["labels"], line["count"]), ("test.stage", {"stage": "fetch"}, 2))
+        self.assertEqual(line["buckets"]["50"], 1)
+
+        emf = json.loads(metrics.to_emf("Test")[0])
+        directive = emf["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual((directive["Namespace"], directive["Dimensions"]), ("Test", [["stage"]]))
+        self.assertEqual((emf["stage"], len(emf["test.stage"])), ("fetch", 2))
+
+        text = metrics.to_prometheus()
+        self.assertIn("# TYPE kite_test_stage_ms histogram", text)
+        self.assertIn('kite_test_stage_ms_bucket{stage="fetch",le="+Inf"} 2', text)
+        self.assertIn('kite_test_stage_rows_total{stage="fetch"} 4', text)
+
+    def test_prometheus_endpoint(self):
+        metrics.increment("test.hits", 3)
+        server = metrics.serve_prometheus(0)
+        self.addCleanup(server.shutdown)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            body = response.read().decode()
+
+        self.assertIn("kite_test_hits_total 3", body)
+
+    def test_disabled_records_nothing(self):
+        metrics.enable(False)
+
+        self.assertEqual(fetch("1", "A"), [1, 2, 3])
+        with metrics.timer("test.stage") as t:
+            t.rows = 1
+        metrics.increment("test.hits")
+
+        self.assertIs(metrics.timer("x"), metrics.timer("y"))
+        self.assertEqual(metrics.snapshot(), {"histograms": [], "counters": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
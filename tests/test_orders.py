@@ -7,6 +7,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Mock sys dependencies
 mock_psycopg2 = MagicMock()
 sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
 
 # Let's mock the functions imported by src.orders
 import src.orders
@@ -21,8 +22,8 @@ class TestOrderLogic(unittest.TestCase):
     
     @patch('src.orders.get_open_sell_order')
     @patch('src.orders.create_order')
-    @patch('src.orders.close_order')
-    def test_process_order_logic_no_open_order_signal(self, mock_close, mock_create, mock_get_open):
+    @patch('src.orders.reverse_position')
+    def test_process_order_logic_no_open_order_signal(self, mock_reverse, mock_create, mock_get_open):
         """Case A: No open order, Close < SMA -> SELL"""
         mock_get_open.return_value = None
         
@@ -35,14 +36,14 @@ class TestOrderLogic(unittest.TestCase):
         
         src.orders.process_order_logic(symbol, current_close, avg_200)
         
-        mock_create.assert_called_once_with("SELL", symbol, current_close)
-        mock_close.assert_not_called()
+        mock_create.assert_called_once_with("SELL", symbol, current_close, close=current_close, avg_200=avg_200)
+        mock_reverse.assert_not_called()
         print("Test A Passed: SELL Signal generated.")
 
     @patch('src.orders.get_open_sell_order')
     @patch('src.orders.create_order')
-    @patch('src.orders.close_order')
-    def test_process_order_logic_no_open_order_no_signal(self, mock_close, mock_create, mock_get_open):
+    @patch('src.orders.reverse_position')
+    def test_process_order_logic_no_open_order_no_signal(self, mock_reverse, mock_create, mock_get_open):
         """Case A (No Signal): No open order, Close >= SMA -> Do nothing"""
         mock_get_open.return_value = None
         
@@ -57,8 +58,8 @@ class TestOrderLogic(unittest.TestCase):
 
     @patch('src.orders.get_open_sell_order')
     @patch('src.orders.create_order')
-    @patch('src.orders.close_order')
-    def test_process_order_logic_reversal(self, mock_close, mock_create, mock_get_open):
+    @patch('src.orders.reverse_position')
+    def test_process_order_logic_reversal(self, mock_reverse, mock_create, mock_get_open):
         """Case B1: Open SELL exists, Close > SMA -> Reversal BUY"""
         mock_get_open.return_value = {"id": 1, "price": 110.0, "status": "created"}
         
@@ -72,56 +73,56 @@ class TestOrderLogic(unittest.TestCase):
         
         src.orders.process_order_logic(symbol, current_close, avg_200)
         
-        mock_create.assert_called_once_with("BUY", symbol, current_close, status="completed")
-        mock_close.assert_called_once_with(1)
+        # BUY and SELL close happen in one atomic reverse_position call
+        mock_create.assert_not_called()
+        mock_reverse.assert_called_once_with(1, symbol, current_close, close=current_close, avg_200=avg_200)
         print("Test B1 Passed: Reversal BUY generated.")
 
     @patch('src.orders.get_open_sell_order')
     @patch('src.orders.create_order')
-    @patch('src.orders.close_order')
-    def test_process_order_logic_take_profit(self, mock_close, mock_create, mock_get_open):
-        """Case B2: Open SELL exists, Close < SMA, Profit >= 20% -> Take Profit BUY"""
+    @patch('src.orders.reverse_position')
+    def test_process_order_logic_take_profit(self, mock_reverse, mock_create, mock_get_open):
+        """Case B2: Open SELL exists, Close < SMA, Profit >= 2% -> Take Profit BUY"""
         entry_price = 100.0
         mock_get_open.return_value = {"id": 1, "price": entry_price, "status": "created"}
         
         symbol = "TEST"
-        avg_200 = 90.0
         
-        # Scenario: Profit = 20%
-        # (Entry - Close) / Entry = 0.20
-        # 1 - Close/Entry = 0.20
-        # Close/Entry = 0.80
-        # Close = 80.0
+        # Scenario: Profit = 2%
+        # (Entry - Close) / Entry = 0.02
+        # 1 - Close/Entry = 0.02
+        # Close/Entry = 0.98
+        # Close = 98.0
+        avg_200 = 99.0
         
-        current_close = 80.0 
+        current_close = 98.0 
         # Check conditions: 
-        # Close (80) < SMA (90) -> True
-        # Profit (20%) >= 20% -> True
+        # Close (98) < SMA (99) -> True
+        # Profit (2%) >= 2% -> True
         
         src.orders.process_order_logic(symbol, current_close, avg_200)
         
-        mock_create.assert_called_once_with("BUY", symbol, current_close, status="completed")
-        mock_close.assert_called_once_with(1)
+        # BUY and SELL close happen in one atomic reverse_position call
+        mock_create.assert_not_called()
+        mock_reverse.assert_called_once_with(1, symbol, current_close, close=current_close, avg_200=avg_200)
         print("Test B2 Passed: Take Profit BUY generated.")
 
     @patch('src.orders.get_open_sell_order')
     @patch('src.orders.create_order')
-    @patch('src.orders.close_order')
-    def test_process_order_logic_hold(self, mock_close, mock_create, mock_get_open):
-        """Case B (Hold): Open SELL exists, Close < SMA, Profit < 20% -> Hold"""
+    @patch('src.orders.reverse_position')
+    def test_process_order_logic_hold(self, mock_reverse, mock_create, mock_get_open):
+        """Case B (Hold): Open SELL exists, Close < SMA, Profit < 2% -> Hold"""
         entry_price = 100.0
         mock_get_open.return_value = {"id": 1, "price": entry_price, "status": "created"}
         
         symbol = "TEST"
-        avg_200 = 90.0
-        current_close = 85.0 # Profit 15%
-        
-        current_close = 85.0 # Profit 15%
+        avg_200 = 99.5
+        current_close = 99.0 # Profit 1%
         
         src.orders.process_order_logic(symbol, current_close, avg_200)
         
         mock_create.assert_not_called()
-        mock_close.assert_not_called()
+        mock_reverse.assert_not_called()
         print("Test B (Hold) Passed.")
 
 if __name__ == '__main__':
@@ -18,8 +18,8 @@ import main
 
 class TestPipeline(unittest.TestCase):
 
-    @patch('main.fetch_kite_historical_data')
-    @patch('main.save_historical_data')
+    @patch('src.pipeline.fetch_kite_historical_data')
+    @patch('src.pipeline.save_historical_data')
     def test_fetch_and_save(self, mock_save, mock_fetch):
         """Stage 1: Fetch and Save"""
         mock_fetch.return_value = [{"closed": 100}]
@@ -32,36 +32,115 @@ class TestPipeline(unittest.TestCase):
         mock_save.assert_called_once()
         print("Stage 1 (Fetch/Save) Verification Passed.")
 
-    @patch('main.update_running_average')
-    def test_update_sma(self, mock_update_avg):
+    @patch('src.pipeline.fetch_kite_historical_data')
+    @patch('src.pipeline.save_historical_data')
+    def test_fetch_concurrent_order_and_isolation(self, mock_save, mock_fetch):
+        """Stage 1: concurrent fetch returns input order and isolates failures"""
+        import time
+
+        def fake_fetch(instrument_token, trading_symbol, **kwargs):
+            # Earlier instruments finish last
+            time.sleep(0.01 * (5 - int(instrument_token)))
+            if trading_symbol == "BAD":
+                raise RuntimeError("boom")
+            return [{"closed": 100, "trading_symbol": trading_symbol}]
+
+        mock_fetch.side_effect = fake_fetch
+        mock_save.side_effect = lambda candles: candles
+        instruments = [
+            {"trading_symbol": "A", "instrument_token": "1"},
+            {"trading_symbol": "BAD", "instrument_token": "2"},
+            {"trading_symbol": "C", "instrument_token": "3"},
+            {"trading_symbol": "D", "instrument_token": "4"},
+        ]
+
+        updated = main.fetch_and_save_historical_data(instruments, max_workers=4)
+
+        self.assertEqual([i['trading_symbol'] for i in updated], ["A", "C", "D"])
+        # Fetches finish in reverse, but saves keep input order
+        saved = [c[0][0][0]['trading_symbol'] for c in mock_save.call_args_list]
+        self.assertEqual(saved, ["A", "C", "D"])
+        self.assertEqual(updated[0]['new_candles'], [{"closed": 100, "trading_symbol": "A"}])
+
+    @patch('main.INDICATORS', ["sma_20"])
+    @patch('src.indicators.update_indicators')
+    @patch('main.get_latest_stats_and_close_bulk')
+    @patch('src.pipeline.get_latest_stats_and_close')
+    @patch('src.pipeline.update_running_average')
+    def test_update_sma(self, mock_update_avg, mock_latest, mock_latest_bulk, mock_indicators):
         """Stage 2: Update SMA"""
-        instruments = [{"trading_symbol": "TEST"}]
+        mock_latest_bulk.return_value = {"TEST": (90.0, 100.0)}
+        instruments = [{"trading_symbol": "TEST"}, {"trading_symbol": "MISSING"}]
         
-        main.update_sma_for_instruments(instruments)
+        latest = main.update_sma_for_instruments(instruments)
         
-        mock_update_avg.assert_called_once_with("TEST", [])
+        mock_update_avg.assert_any_call("TEST", [])
+        # Per instrument only the running average; stats and indicators are read once for all
+        mock_latest.assert_not_called()
+        mock_latest_bulk.assert_called_once_with(["TEST", "MISSING"])
+        mock_indicators.assert_called_once_with(["TEST", "MISSING"])
+        self.assertEqual(latest, {"TEST": (90.0, 100.0)})
         print("Stage 2 (SMA Update) Verification Passed.")
 
-    @patch('main.get_latest_stats_and_close')
-    @patch('main.process_order_logic')
-    def test_process_orders(self, mock_process_order, mock_get_stats):
+    @patch('main.SMA_MODE', 'bulk')
+    @patch('src.pipeline.update_running_average')
+    @patch('main.recompute_running_averages')
+    def test_update_sma_bulk_mode(self, mock_recompute, mock_update_avg):
+        """Stage 2: bulk SMA hands its results to the order stage"""
+        mock_recompute.return_value = {"TEST": (90.0, 100.0)}
+        instruments = [{"trading_symbol": "TEST"}]
+
+        latest = main.update_sma_for_instruments(instruments)
+
+        mock_recompute.assert_called_once_with(["TEST"])
+        mock_update_avg.assert_not_called()
+        self.assertEqual(latest, {"TEST": (90.0, 100.0)})
+
+        with patch('main.get_latest_stats_and_close_bulk') as mock_get_stats, \
+             patch('main.PositionBook') as mock_book, \
+             patch('src.pipeline.process_order_logic') as mock_process_order:
+            main.process_orders_for_instruments(instruments, latest)
+
+        mock_get_stats.assert_not_called()
+        mock_process_order.assert_called_once_with("TEST", 90.0, 100.0, mock_book.load.return_value)
+
+    @patch('main.PositionBook')
+    @patch('main.get_latest_stats_and_close_bulk')
+    @patch('src.pipeline.process_order_logic')
+    def test_process_orders(self, mock_process_order, mock_get_stats, mock_book):
         """Stage 3: Process Orders"""
-        # Mock DB returns (latest_close, avg_200)
-        mock_get_stats.return_value = (90.0, 100.0)
+        # Mock DB returns {symbol: (latest_close, avg_200)}; MISSING has no stats yet
+        mock_get_stats.return_value = {"TEST": (90.0, 100.0)}
         
-        instruments = [{"trading_symbol": "TEST"}]
+        instruments = [{"trading_symbol": "TEST"}, {"trading_symbol": "MISSING"}]
         
         main.process_orders_for_instruments(instruments)
+
+        # One batched lookup for all instruments
+        mock_get_stats.assert_called_once_with(["TEST", "MISSING"])
         
-        # main.py imports process_order_logic from src.orders
-        # Because we patch 'src.orders.process_order_logic', relying on main having imported it
-        # If main does `from src.orders import process_order_logic`, patching `src.orders.process_order_logic`
-        # updates the definition in `src.orders`, but main might have a reference to the OLD one?
-        # NO. PATCH patches where it is LOOKED UP.
-        # If main does `from src.orders import process_order_logic`, verifying main uses the patched version needs patching 'main.process_order_logic'
+        # The order stage runs in src.pipeline, which imports process_order_logic from src.orders,
+        # so the name is patched where the pipeline looks it up
         
-        mock_process_order.assert_called_once_with("TEST", 90.0, 100.0)
+        # Positions are loaded once, and all order writes flushed once at the end
+        book = mock_book.load.return_value
+        mock_book.load.assert_called_once_with(["TEST"])
+        mock_process_order.assert_called_once_with("TEST", 90.0, 100.0, book)
+        book.flush.assert_called_once()
         print("Stage 3 (Order Logic) Verification Passed.")
 
+    @patch('main.increment')
+    @patch('main.PositionBook')
+    @patch('main.get_latest_stats_and_close_bulk')
+    @patch('src.pipeline.process_order_logic')
+    def test_process_orders_counts_failed_flush(self, mock_process_order, mock_get_stats, mock_book, mock_increment):
+        """Stage 3: a failed flush is counted, not ignored"""
+        mock_get_stats.return_value = {"TEST": (90.0, 100.0)}
+        mock_book.load.return_value.flush.return_value = False
+
+        main.process_orders_for_instruments([{"trading_symbol": "TEST"}])
+
+        mock_increment.assert_called_once_with("orders.flush_failed")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,136 @@
+import sys
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+import src.positions
+import src.orders
+from src.orders import decide_order_action, OPEN_SHORT, REVERSAL, TAKE_PROFIT
+from src.positions import PositionBook
+
+
+class TestDecideOrderAction(unittest.TestCase):
+    def test_transitions(self):
+        position = {"id": 1, "price": 100.0}
+
+        self.assertEqual(decide_order_action(90.0, 100.0, None), OPEN_SHORT)
+        self.assertIsNone(decide_order_action(100.0, 100.0, None))
+        self.assertEqual(decide_order_action(105.0, 100.0, position), REVERSAL)
+        self.assertEqual(decide_order_action(97.0, 99.0, position), TAKE_PROFIT)
+        self.assertIsNone(decide_order_action(99.0, 99.5, position))
+
+
+class TestPositionBook(unittest.TestCase):
+    def setUp(self):
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+
+        patcher = patch('src.positions.db_connection')
+        mock_db_connection = patcher.start()
+        mock_db_connection.return_value.__enter__.return_value = self.mock_conn
+        self.addCleanup(patcher.stop)
+
+        for target in ('src.positions.ensure_schema', 'src.positions.execute_values'):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_load_is_one_query(self):
+        self.mock_cursor.fetchall.return_value = [(7, "SELL", "A", 100.0, "created", None)]
+
+        book = PositionBook.load(["A", "B"])
+
+        self.assertEqual(book.open_position("A")["id"], 7)
+        self.assertIsNone(book.open_position("B"))
+        query, params = self.mock_cursor.execute.call_args[0]
+        self.assertIn("DISTINCT ON (trading_symbol)", query)
+        self.assertEqual(params, (["A", "B"],))
+
+    @patch('src.orders.reverse_position')
+    @patch('src.orders.create_order')
+    @patch('src.orders.get_open_sell_order')
+    def test_run_is_applied_locally_and_flushed_once(self, mock_get_open, mock_create, mock_reverse):
+        book = PositionBook({"A": {"id": 7, "trading_symbol": "A", "price": 100.0}})
+
+        src.orders.process_order_logic("A", 105.0, 100.0, book)  # reversal of the loaded SELL
+        src.orders.process_order_logic("B", 90.0, 100.0, book)   # new SELL
+        src.orders.process_order_logic("B", 91.0, 100.0, book)   # hold (profit < threshold)
+
+        mock_get_open.assert_not_called()
+        mock_create.assert_not_called()
+        mock_reverse.assert_not_called()
+        self.assertEqual(book.pending, 2)
+
+        self.mock_cursor.fetchall.return_value = [(7,)]
+        src.positions.execute_values.return_value = [(11,), (12,)]
+        self.assertTrue(book.flush())
+
+        self.mock_cursor.execute.assert_called_once_with(
+            "UPDATE orders SET status = 'completed' WHERE id = ANY(%s) AND status = 'created' RETURNING id", ([7],)
+        )
+        inserted = src.positions.execute_values.call_args[0][2]
+        self.assertEqual([(o[0], o[1], o[5]) for o in inserted], [("SELL", "B", "created"), ("BUY", "A", "completed")])
+        self.mock_conn.commit.assert_called_once()
+        self.assertEqual(book.open_position("B")["id"], 11)
+        self.assertEqual(book.pending, 0)
+
+    def test_cover_skipped_when_closed_elsewhere(self):
+        book = PositionBook({
+            "A": {"id": 7, "trading_symbol": "A", "price": 100.0},
+            "B": {"id": 8, "trading_symbol": "B", "price": 100.0},
+        })
+        book.cover("A", 105.0, 100.0)
+        book.cover("B", 105.0, 100.0)
+
+        # 7 was already completed by another run: only 8 is closed and covered
+        self.mock_cursor.fetchall.return_value = [(8,)]
+        src.positions.execute_values.return_value = [(20,)]
+        self.assertTrue(book.flush())
+
+        inserted = src.positions.execute_values.call_args[0][2]
+        self.assertEqual([(o[0], o[1]) for o in inserted], [("BUY", "B")])
+        self.assertEqual(book.pending, 0)
+
+    def test_concurrent_transitions(self):
+        book = PositionBook({f"S{i}": {"id": i, "trading_symbol": f"S{i}", "price": 100.0} for i in range(200)})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: book.cover(f"S{i}", 105.0, 100.0), range(200)))
+            list(pool.map(lambda i: book.open_short(f"N{i}", 90.0, 100.0), range(200)))
+
+        self.assertEqual(book.pending, 400)
+
+    def test_open_and_cover_in_same_run(self):
+        book = PositionBook()
+        book.open_short("C", 90.0, 100.0)
+        book.cover("C", 101.0, 100.0)
+
+        src.positions.execute_values.return_value = [(1,), (2,)]
+        book.flush()
+
+        inserted = src.positions.execute_values.call_args[0][2]
+        self.assertEqual([(o[0], o[5]) for o in inserted], [("SELL", "completed"), ("BUY", "completed")])
+        self.mock_cursor.execute.assert_not_called()
+        self.assertIsNone(book.open_position("C"))
+
+    def test_failed_flush_keeps_pending(self):
+        book = PositionBook()
+        book.open_short("D", 90.0, 100.0)
+
+        src.positions.execute_values.side_effect = Exception("db down")
+        self.assertFalse(book.flush())
+        self.mock_conn.rollback.assert_called()
+        self.assertEqual(book.pending, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
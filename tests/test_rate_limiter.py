@@ -0,0 +1,115 @@
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.rate_limiter import TokenBucket
+import importlib
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('src.rate_limiter.time.monotonic', self.clock.monotonic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_queue(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        # Bucket empty: callers queue 0.5s apart
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+
+        self.clock.now += 1.0
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+
+    def test_penalize_delays_later_callers(self):
+        bucket = TokenBucket(rate=4, capacity=4)
+        bucket.penalize(2.0)
+
+        self.assertAlmostEqual(bucket.reserve(), 2.25)
+
+    def test_acquire_async_does_not_block_loop(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.reserve()
+
+        with patch('src.rate_limiter.asyncio.sleep') as mock_sleep:
+            async def fake_sleep(seconds):
+                return None
+            mock_sleep.side_effect = fake_sleep
+            asyncio.run(bucket.acquire_async())
+
+        mock_sleep.assert_called_once_with(1.0)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestRateLimitedGet(unittest.TestCase):
+    def setUp(self):
+        # Other test modules replace src.kite_api in sys.modules; load the real one
+        sys.modules.pop('src.kite_api', None)
+        self.kite_api = importlib.import_module('src.kite_api')
+
+    def make_response(self, status, headers=None):
+        response = MagicMock()
+        response.status_code = status
+        response.headers = headers or {}
+        return response
+
+    @patch('src.kite_api.get_rate_limiter')
+    @patch('src.kite_api.get_http_session')
+    def test_retries_429_honouring_retry_after(self, mock_session, mock_get_limiter):
+        mock_get = mock_session.return_value.get
+        limiter = MagicMock()
+        mock_get_limiter.return_value = limiter
+        ok = self.make_response(200)
+        throttled = self.make_response(429, {"Retry-After": "1.5"})
+        mock_get.side_effect = [throttled, ok]
+
+        response = self.kite_api._rate_limited_get("historical", "https://example.test")
+
+        self.assertIs(response, ok)
+        throttled.close.assert_called_once()
+        ok.close.assert_not_called()
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        limiter.penalize.assert_called_once_with(1.5)
+
+    @patch('src.kite_api.KITE_MAX_RETRIES', 2)
+    @patch('src.kite_api.get_rate_limiter')
+    @patch('src.kite_api.get_http_session')
+    def test_gives_up_after_max_retries(self, mock_session, mock_get_limiter):
+        mock_get = mock_session.return_value.get
+        limiter = MagicMock()
+        mock_get_limiter.return_value = limiter
+        mock_get.return_value = self.make_response(429)
+
+        response = self.kite_api._rate_limited_get("historical", "https://example.test")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(mock_get.call_count, 3)
+        # The last response is the caller's to read and close
+        self.assertEqual(response.close.call_count, 2)
+        # Exponential backoff when no Retry-After is sent
+        delays = [c[0][0] for c in limiter.penalize.call_args_list]
+        self.assertEqual(delays, [self.kite_api.KITE_BACKOFF_SECONDS, self.kite_api.KITE_BACKOFF_SECONDS * 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.schema
+
+
+class TestSchemaBootstrap(unittest.TestCase):
+    def setUp(self):
+        if 'src.schema' in sys.modules:
+            del sys.modules['src.schema']
+        import src.schema
+
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+
+    def executed(self):
+        return [c[0][0] for c in self.mock_cursor.execute.call_args_list]
+
+    def test_fresh_database_applies_all_migrations(self):
+        # to_regclass -> table missing, then MAX(version) inside migrate() -> 0
+        self.mock_cursor.fetchone.side_effect = [(False,), (0,)]
+
+        self.assertTrue(src.schema.ensure_schema(self.mock_conn))
+
+        statements = self.executed()
+        self.assertTrue(any("pg_advisory_xact_lock" in q for q in statements))
+        self.assertTrue(any("CREATE TABLE IF NOT EXISTS historical_candles" in q for q in statements))
+        inserts = [c for c in self.mock_cursor.execute.call_args_list if "INSERT INTO schema_migrations" in c[0][0]]
+        self.assertEqual(len(inserts), len(src.schema.MIGRATIONS))
+        self.mock_conn.commit.assert_called_once()
+
+    def test_current_schema_runs_no_ddl_and_checks_once(self):
+        self.mock_cursor.fetchone.side_effect = [(True,), (src.schema.SCHEMA_VERSION,)]
+
+        src.schema.ensure_schema(self.mock_conn)
+        src.schema.ensure_schema(self.mock_conn)
+        src.schema.ensure_schema(self.mock_conn)
+
+        statements = self.executed()
+        self.assertEqual(len(statements), 2)
+        self.assertFalse(any("CREATE" in q or "ALTER" in q for q in statements))
+
+    def test_disabled_auto_migrate_skips_check(self):
+        with patch('src.schema.DB_AUTO_MIGRATE', False):
+            self.assertTrue(src.schema.ensure_schema(self.mock_conn))
+        self.mock_cursor.execute.assert_not_called()
+
+    def test_failure_rolls_back_and_retries_later(self):
+        self.mock_cursor.execute.side_effect = Exception("permission denied")
+
+        self.assertFalse(src.schema.ensure_schema(self.mock_conn))
+        self.mock_conn.rollback.assert_called_once()
+        self.assertFalse(src.schema._schema_ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
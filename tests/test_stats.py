@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import unittest
 from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
 
 # Mock sys dependencies
 mock_psycopg2 = MagicMock()
@@ -27,14 +28,16 @@ class TestRunningAverage(unittest.TestCase):
         mock_psycopg2.connect.return_value = mock_conn
         mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
         
+        # No stored stats yet -> full recompute
+        mock_cursor.fetchone.return_value = None
         # Mock fetch candles -> Return 3 values (10, 10, 11) -> Avg 10.333...
-        mock_cursor.fetchall.return_value = [[10.0], [10.0], [11.0]]
+        mock_cursor.fetchall.return_value = [[10.0, "t3"], [10.0, "t2"], [11.0, "t1"]]
         
         # Call function
         src.database.update_running_average("TEST", [])
         
         # Verify SELECT called with LIMIT 200
-        select_calls = [c for c in mock_cursor.execute.call_args_list if "SELECT closed FROM historical_candles" in c[0][0]]
+        select_calls = [c for c in mock_cursor.execute.call_args_list if "SELECT closed, timestamp FROM historical_candles" in c[0][0]]
         self.assertTrue(select_calls)
         self.assertIn("LIMIT 200", select_calls[0][0][0])
         
@@ -49,8 +52,134 @@ class TestRunningAverage(unittest.TestCase):
         self.assertEqual(params[2], 10.33)  # avg rounded
         self.assertEqual(params[3], 3)     # count
         
+        self.assertEqual(params[4], "t1")  # window_start (oldest)
+        self.assertEqual(params[5], "t3")  # window_end (newest)
+        
         print("Simple Recalculation Test Passed.")
 
+    @patch('src.database.psycopg2')
+    def test_update_running_average_incremental(self, mock_psycopg2):
+        """Full window: new candles enter, the same number leave."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        start = datetime(2026, 1, 1, 9, 15, tzinfo=timezone.utc)
+        end = datetime(2026, 1, 2, 15, 25, tzinfo=timezone.utc)
+        later = end + timedelta(minutes=5)
+
+        # Stored stats: 200 candles summing to 20000 (avg 100)
+        mock_cursor.fetchone.return_value = (20000.0, 200, start, end, 3)
+        mock_cursor.fetchall.side_effect = [
+            [(130.0, later)],                                  # entering rows
+            [(100.0, start), (102.0, start + timedelta(minutes=5))],  # leaving row + next window_start
+        ]
+
+        src.database.update_running_average("TEST", [{"timestamp": later, "closed": 130.0}])
+
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertFalse(any("LIMIT 200" in q for q in queries), "Incremental path must not rescan the window")
+
+        upsert_calls = [c for c in mock_cursor.execute.call_args_list if "INSERT INTO instrument_statistics" in c[0][0]]
+        params = upsert_calls[0][0][1]
+        self.assertEqual(params[1], 20030.0)   # 20000 + 130 - 100
+        self.assertEqual(params[2], 100.15)
+        self.assertEqual(params[3], 200)
+        self.assertEqual(params[4], start + timedelta(minutes=5))
+        self.assertEqual(params[5], later)
+        self.assertEqual(params[6], 4)         # updates_since_recompute
+
+    @patch('src.database.psycopg2')
+    def test_update_running_average_late_candle_recomputes(self, mock_psycopg2):
+        """A candle inserted behind window_end forces a full recompute."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        start = datetime(2026, 1, 1, 9, 15, tzinfo=timezone.utc)
+        end = datetime(2026, 1, 2, 15, 25, tzinfo=timezone.utc)
+        mock_cursor.fetchone.return_value = (20000.0, 200, start, end, 3)
+        mock_cursor.fetchall.return_value = [(10.0, end), (20.0, start)]
+
+        late = {"timestamp": "2026-01-02T10:00:00+0530", "closed": 99.0}
+        src.database.update_running_average("TEST", [late])
+
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertTrue(any("LIMIT 200" in q for q in queries))
+
+        upsert_calls = [c for c in mock_cursor.execute.call_args_list if "INSERT INTO instrument_statistics" in c[0][0]]
+        params = upsert_calls[0][0][1]
+        self.assertEqual(params[1], 30.0)
+        self.assertEqual(params[6], 0)
+
+    @patch('src.database.psycopg2')
+    def test_update_running_average_periodic_recompute(self, mock_psycopg2):
+        """After SMA_RECOMPUTE_EVERY incremental updates the window is rebuilt."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        start = datetime(2026, 1, 1, 9, 15, tzinfo=timezone.utc)
+        end = datetime(2026, 1, 2, 15, 25, tzinfo=timezone.utc)
+        mock_cursor.fetchone.return_value = (20000.0, 200, start, end, src.database.SMA_RECOMPUTE_EVERY - 1)
+        mock_cursor.fetchall.return_value = [(10.0, end)]
+
+        src.database.update_running_average("TEST", [])
+
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertTrue(any("LIMIT 200" in q for q in queries))
+
+class TestLatestStatsBulk(unittest.TestCase):
+    def setUp(self):
+        if 'src.database' in sys.modules:
+            del sys.modules['src.database']
+        import src.database
+
+    @patch('src.database.psycopg2')
+    def test_one_query_for_all_symbols(self, mock_psycopg2):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [("A", 101.5, 100.0), ("B", 49.0, 50.0)]
+
+        result = src.database.get_latest_stats_and_close_bulk(["A", "B", "C"])
+
+        self.assertEqual(result, {"A": (101.5, 100.0), "B": (49.0, 50.0)})
+        mock_cursor.execute.assert_called_once()
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertIn("CROSS JOIN LATERAL", query)
+        self.assertIn("trading_symbol = ANY(%s)", query)
+        self.assertEqual(params, (["A", "B", "C"],))
+
+    @patch('src.database.psycopg2')
+    def test_bulk_recompute_single_statement(self, mock_psycopg2):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_psycopg2.connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [("A", 101.5, 100.0)]
+
+        result = src.database.recompute_running_averages(["A", "B"])
+
+        self.assertEqual(result, {"A": (101.5, 100.0)})
+        statements = [c for c in mock_cursor.execute.call_args_list if "instrument_statistics" in c[0][0]]
+        self.assertEqual(len(statements), 1)
+        query, params = statements[0][0]
+        self.assertIn("CROSS JOIN LATERAL", query)
+        self.assertIn("ON CONFLICT (trading_symbol)", query)
+        self.assertEqual(params, (["A", "B"], 200))
+        mock_conn.commit.assert_called_once()
+
+    def test_empty_input_skips_db(self):
+        with patch('src.database.db_connection') as mock_db_connection:
+            self.assertEqual(src.database.get_latest_stats_and_close_bulk([]), {})
+            mock_db_connection.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,121 @@
+import sys
+import os
+import asyncio
+import json
+import struct
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock not-installed libraries
+mock_psycopg2 = MagicMock()
+sys.modules["psycopg2"] = mock_psycopg2
+sys.modules["psycopg2.extras"] = MagicMock()
+
+from websockets.asyncio.server import serve
+import src.streaming
+from src.streaming import parse_ticks, CandleAggregator, CloseRing, TickStreamer
+
+TOKEN = 12602626  # segment byte 2 (NFO): prices in paise
+
+
+def full_packet(token, price, exchange_timestamp, volume=0):
+    packet = struct.pack(">IIIIIII", token, int(round(price * 100)), 0, 0, volume, 0, 0)
+    packet += struct.pack(">IIII", 0, 0, 0, 0)
+    packet += struct.pack(">IIIII", 0, 0, 0, 0, exchange_timestamp)
+    return packet + bytes(184 - len(packet))
+
+
+def message(*packets):
+    return struct.pack(">H", len(packets)) + b"".join(struct.pack(">H", len(p)) + p for p in packets)
+
+
+class TestTickParsing(unittest.TestCase):
+    def test_parse_modes(self):
+        ltp = struct.pack(">II", 256265, 2345670)
+        ticks = parse_ticks(message(ltp, full_packet(TOKEN, 101.25, 1700000000, volume=42)))
+
+        self.assertEqual(ticks[0], {"instrument_token": 256265, "last_price": 23456.7, "volume": None, "exchange_timestamp": None})
+        self.assertEqual(ticks[1], {"instrument_token": TOKEN, "last_price": 101.25, "volume": 42, "exchange_timestamp": 1700000000})
+
+    def test_heartbeat(self):
+        self.assertEqual(parse_ticks(b"\x00"), [])
+
+
+class TestAggregation(unittest.TestCase):
+    def test_bars_close_on_next_bucket(self):
+        agg = CandleAggregator(300)
+        self.assertIsNone(agg.add_tick(TOKEN, 100.0, 600))
+        self.assertIsNone(agg.add_tick(TOKEN, 103.0, 700))
+        self.assertIsNone(agg.add_tick(TOKEN, 99.0, 899))
+        bar = agg.add_tick(TOKEN, 101.0, 900)
+
+        self.assertEqual((bar["start"], bar["open"], bar["high"], bar["low"], bar["close"]), (600, 100.0, 103.0, 99.0, 99.0))
+
+        # A late tick for the closed bar is dropped
+        self.assertIsNone(agg.add_tick(TOKEN, 50.0, 899))
+        self.assertEqual(agg.late_ticks, 1)
+
+        self.assertEqual(agg.flush_due(1201, grace=2), [])
+        self.assertEqual(agg.flush_due(1202, grace=2)[0]["close"], 101.0)
+
+    def test_ring_sma(self):
+        ring = CloseRing(3, [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual((len(ring), ring.sma()), (3, 3.0))
+        ring.append(8.0)
+        self.assertEqual(ring.sma(), 5.0)
+        self.assertIsNone(CloseRing(3).sma())
+
+
+class TestTickStreamer(unittest.TestCase):
+    @patch('builtins.print')
+    @patch('src.streaming.process_order_logic')
+    @patch('src.streaming.update_running_average')
+    @patch('src.streaming.save_historical_data')
+    @patch('src.streaming.get_recent_closes_bulk')
+    def test_stream_against_local_server(self, mock_recent, mock_save, mock_update, mock_orders, mock_print):
+        mock_recent.return_value = {"NIFTYFUT": ([100.0, 102.0], None)}
+        mock_save.side_effect = lambda candles: candles
+        received = []
+
+        async def ticker(ws):
+            received.append(json.loads(await ws.recv()))
+            received.append(json.loads(await ws.recv()))
+            await ws.send(b"\x00")
+            await ws.send(message(full_packet(TOKEN, 104.0, 1200), full_packet(999, 1.0, 1200)))
+            await ws.send(message(full_packet(TOKEN, 106.0, 1300)))
+            await ws.send(json.dumps({"type": "error", "data": "ignored"}))
+            await ws.send(message(full_packet(TOKEN, 90.0, 1500)))
+            await ws.wait_closed()
+
+        async def scenario():
+            async with serve(ticker, "127.0.0.1", 0) as server:
+                port = server.sockets[0].getsockname()[1]
+                bars = []
+                stop = asyncio.Event()
+
+                def on_bar(bar, avg):
+                    bars.append((bar["close"], avg))
+                    loop.call_soon_threadsafe(stop.set)
+
+                loop = asyncio.get_running_loop()
+                streamer = TickStreamer([{"instrument_token": str(TOKEN), "trading_symbol": "NIFTYFUT"}],
+                                        url=f"ws://127.0.0.1:{port}", on_bar=on_bar, bar_seconds=300,
+                                        clock=lambda: 1500)
+                await asyncio.wait_for(streamer.run(stop), timeout=10)
+                return bars
+
+        bars = asyncio.run(scenario())
+
+        self.assertEqual(received, [{"a": "subscribe", "v": [TOKEN]}, {"a": "mode", "v": ["full", [TOKEN]]}])
+        self.assertEqual(bars, [(106.0, 102.67)])
+
+        candle = mock_save.call_args[0][0][0]
+        self.assertEqual((candle["closed"], candle["trading_symbol"], candle["timestamp"].timestamp()), (106.0, "NIFTYFUT", 1200))
+        mock_update.assert_called_once()
+        mock_orders.assert_called_once_with("NIFTYFUT", 106.0, 102.67)
+
+
+if __name__ == '__main__':
+    unittest.main()
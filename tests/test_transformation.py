@@ -2,8 +2,8 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import importlib
 import json
-from src.kite_api import fetch_kite_historical_data
 from unittest.mock import patch, MagicMock
 
 def test_transformation():
@@ -17,17 +17,20 @@ def test_transformation():
         }
     }
 
-    with patch('requests.get') as mock_get:
+    # Other test modules replace src.kite_api in sys.modules; load the real one
+    # so the session patched below is the one fetch_kite_historical_data() uses
+    sys.modules.pop('src.kite_api', None)
+    kite_api = importlib.import_module('src.kite_api')
+
+    with patch.object(kite_api, 'KITE_AUTH_TOKEN', 'dummy_token'), \
+         patch.object(kite_api, 'get_rate_limiter'), \
+         patch.object(kite_api, 'get_http_session') as mock_session:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = mock_response_data
-        mock_get.return_value = mock_response
-
-        # Set dummy env var
-        import os
-        os.environ["KITE_AUTH_TOKEN"] = "dummy_token"
+        mock_session.return_value.get.return_value = mock_response
 
-        result = fetch_kite_historical_data(
+        result = kite_api.fetch_kite_historical_data(
             instrument_token="12602626",
             trading_symbol="ACC",
             interval="5minute", 